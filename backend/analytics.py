@@ -0,0 +1,203 @@
+"""
+Agrégats de visites pré-calculés pour le tableau de bord.
+
+Les visites brutes (`visitor_analytics`) sont agrégées par fenêtres de temps
+d'ingestion (`ingested_at`) en documents par heure et par jour
+(`analytics_rollups`), par IP (`visitor_ips`) et par page (`visitor_pages`).
+Les IP distinctes sont estimées par HyperLogLog (registres creux fusionnés
+par $max).
+
+Une fenêtre ({start, end, behind, lease_until}) est réservée par
+compare-and-set dans `pending` sur le document des totaux : avec plusieurs
+workers, une seule passe la traite. Elle n'en sort qu'une fois toutes ses
+écritures faites, avec l'avancée du point de reprise (`watermark`) ; après un
+échec elle est reprise telle quelle (mêmes bornes), par ce worker ou, une
+fois le bail expiré, par un autre. Chaque document retient la dernière
+fenêtre qui lui a été appliquée : une reprise ne compte rien deux fois.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+
+from sketches import HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_TOTALS_ID = "all"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def rollup_update(delta: dict) -> dict:
+    update = {"$inc": {"visits": delta["visits"]}, "$set": {"updated_at": _now()}}
+    registers = delta["hll"].registers()
+    if registers:
+        update["$max"] = {f"hll.{index}": rank for index, rank in registers.items()}
+    return update
+
+
+def apply_once(key: dict, update: dict, window: str, **on_insert) -> List[UpdateOne]:
+    """Écritures d'une fenêtre sur un document, sans effet si elle y a déjà été appliquée
+
+    Les fenêtres sont traitées l'une après l'autre : retenir la dernière
+    appliquée (`rollup_window`) suffit pour qu'une fenêtre reprise après un
+    échec partiel ne compte pas deux fois les documents déjà à jour.
+    """
+    return [
+        UpdateOne(key, {"$setOnInsert": {**key, **on_insert}}, upsert=True),
+        UpdateOne({**key, "rollup_window": {"$ne": window}},
+                  {**update, "$set": {**update.get("$set", {}), "rollup_window": window}}),
+    ]
+
+
+class VisitRollup:
+    """Agrégation des visites par fenêtres réservées (voir le module)"""
+
+    def __init__(self, db, lag_seconds: float = 30, lease_seconds: float = 300,
+                 hourly_retention_days: int = 14, window: timedelta = timedelta(days=1)):
+        self.db = db
+        # Délai avant agrégation : ingested_at est fixé juste avant l'insert_many, qui doit avoir abouti
+        self.lag_seconds = lag_seconds
+        # Bail d'une fenêtre réservée : passé ce délai, un autre worker la reprend
+        self.lease_seconds = lease_seconds
+        self.hourly_retention_days = hourly_retention_days
+        # Fenêtre maximale d'une passe : borne la mémoire lors du rattrapage de l'historique
+        self.window = window
+
+    async def run(self) -> dict:
+        """Agréger les visites postérieures au dernier point de reprise
+
+        Renvoie le nombre de visites agrégées et `behind` s'il reste un arriéré.
+        """
+        window = await self.claim()
+        if window is None:
+            return {"visits": 0, "behind": False}
+        try:
+            visits = await self.apply(window)
+        except BaseException:
+            await self.release(window)
+            raise
+        return {"visits": visits, "behind": window["behind"]}
+
+    async def claim(self) -> Optional[dict]:
+        """Réserver la prochaine fenêtre de visites à agréger, None s'il n'y a rien à faire"""
+        rollups = self.db.analytics_rollups
+        await rollups.update_one(
+            {"id": ANALYTICS_TOTALS_ID},
+            {"$setOnInsert": {"id": ANALYTICS_TOTALS_ID, "granularity": "all", "visits": 0, "watermark": None}},
+            upsert=True
+        )
+        state = await rollups.find_one({"id": ANALYTICS_TOTALS_ID}, {"_id": 0, "watermark": 1, "pending": 1})
+        now = datetime.now(timezone.utc)
+        lease_until = (now + timedelta(seconds=self.lease_seconds)).isoformat()
+        pending = state.get("pending")
+        if pending:
+            if pending.get("lease_until") and pending["lease_until"] > now.isoformat():
+                # Fenêtre en cours sur un autre worker
+                return None
+            retried = await rollups.update_one(
+                {"id": ANALYTICS_TOTALS_ID, "pending.start": pending["start"], "pending.lease_until": pending.get("lease_until")},
+                {"$set": {"pending.lease_until": lease_until}}
+            )
+            return {**pending, "lease_until": lease_until} if retried.modified_count else None
+
+        watermark = state.get("watermark")
+        if watermark is None:
+            oldest = await self.db.visitor_analytics.find_one(
+                {"ingested_at": {"$exists": True}}, {"_id": 0, "ingested_at": 1}, sort=[("ingested_at", ASCENDING)]
+            )
+            if not oldest:
+                return None
+            start = oldest["ingested_at"]
+        else:
+            start = watermark
+        cutoff = (now - timedelta(seconds=self.lag_seconds)).isoformat()
+        window_end = (datetime.fromisoformat(start) + self.window).isoformat()
+        window = {"start": start, "end": min(cutoff, window_end), "behind": window_end < cutoff, "lease_until": lease_until}
+        if start >= window["end"]:
+            return None
+        claimed = await rollups.find_one_and_update(
+            {"id": ANALYTICS_TOTALS_ID, "watermark": watermark, "pending": None},
+            {"$set": {"pending": window}}
+        )
+        return window if claimed else None
+
+    async def release(self, window: dict):
+        """Rendre tout de suite une fenêtre dont la passe a échoué, sans attendre la fin du bail"""
+        try:
+            await self.db.analytics_rollups.update_one(
+                {"id": ANALYTICS_TOTALS_ID, "pending.start": window["start"], "pending.lease_until": window["lease_until"]},
+                {"$set": {"pending.lease_until": None}}
+            )
+        except PyMongoError as e:
+            logger.error(f"Failed to release analytics rollup window {window['start']}: {str(e)}")
+
+    async def apply(self, window: dict) -> int:
+        """Écrire les agrégats d'une fenêtre réservée, puis avancer le point de reprise"""
+        start, end = window["start"], window["end"]
+        hours: Dict[str, dict] = {}
+        days: Dict[str, dict] = {}
+        totals = {"visits": 0, "hll": HyperLogLog()}
+        ips: Dict[str, dict] = {}
+        pages: Dict[str, int] = {}
+        cursor = self.db.visitor_analytics.find(
+            {"ingested_at": {"$gte": start, "$lt": end}},
+            {"_id": 0, "ip": 1, "page": 1, "timestamp": 1}
+        )
+        async for visit in cursor:
+            ip, timestamp = visit.get("ip") or "unknown", visit["timestamp"]
+            for bucket, period in ((hours, timestamp[:13]), (days, timestamp[:10])):
+                delta = bucket.setdefault(period, {"visits": 0, "hll": HyperLogLog()})
+                delta["visits"] += 1
+                delta["hll"].add(ip)
+            totals["visits"] += 1
+            totals["hll"].add(ip)
+            per_ip = ips.setdefault(ip, {"visits": 0, "first_visit": timestamp, "last_visit": timestamp})
+            per_ip["visits"] += 1
+            per_ip["first_visit"] = min(per_ip["first_visit"], timestamp)
+            per_ip["last_visit"] = max(per_ip["last_visit"], timestamp)
+            pages[visit.get("page")] = pages.get(visit.get("page"), 0) + 1
+
+        if totals["visits"]:
+            rollups = []
+            for hour, delta in hours.items():
+                period_start = datetime.fromisoformat(f"{hour}:00:00+00:00")
+                rollups += apply_once(
+                    {"id": f"hour:{hour}"}, rollup_update(delta), start, granularity="hour", period=hour,
+                    expires_at=period_start + timedelta(days=self.hourly_retention_days)
+                )
+            for day, delta in days.items():
+                rollups += apply_once({"id": f"day:{day}"}, rollup_update(delta), start, granularity="day", period=day)
+            ip_updates = [
+                op for ip, stats in ips.items() for op in apply_once({"ip": ip}, {
+                    "$inc": {"visits": stats["visits"]},
+                    "$max": {"last_visit": stats["last_visit"]},
+                    "$min": {"first_visit": stats["first_visit"]},
+                }, start)
+            ]
+            page_updates = [
+                op for page, count in pages.items()
+                for op in apply_once({"page": page}, {"$inc": {"visits": count}}, start)
+            ]
+            # ordered : la création d'un document précède son incrément conditionnel
+            await asyncio.gather(
+                self.db.analytics_rollups.bulk_write(rollups, ordered=True),
+                self.db.visitor_ips.bulk_write(ip_updates, ordered=True),
+                self.db.visitor_pages.bulk_write(page_updates, ordered=True),
+            )
+
+        # Dernière écriture : totaux et point de reprise ensemble, fenêtre libérée
+        finish = rollup_update(totals) if totals["visits"] else {"$set": {"updated_at": _now()}}
+        finish["$set"]["watermark"] = end
+        finish["$unset"] = {"pending": ""}
+        finished = await self.db.analytics_rollups.find_one_and_update(
+            {"id": ANALYTICS_TOTALS_ID, "pending.start": start}, finish
+        )
+        # Fenêtre déjà terminée par un worker qui l'a reprise : ses écritures n'ont pas été doublées
+        return totals["visits"] if finished else 0
@@ -0,0 +1,125 @@
+"""
+File d'attente bornée vidée par lots en arrière-plan.
+
+Les handlers déposent un élément et répondent sans attendre la base ; une
+tâche de fond regroupe les éléments (jusqu'à `batch_size`, ou ce qui est
+arrivé en `interval` secondes) et passe chaque lot à `flush`, une coroutine
+qui l'écrit en une fois. File pleine : `put` attend au plus `put_timeout`
+secondes qu'une place se libère (contre-pression), puis abandonne l'élément,
+compté dans `dropped`. `close` refuse les nouveaux éléments et écrit ce qui
+reste dans la file avant de rendre la main.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BatchQueue:
+    """File bornée avec écriture groupée par une tâche de fond, avec métriques"""
+
+    def __init__(self, flush: Callable[[List], Awaitable[None]], maxsize: int = 10_000,
+                 batch_size: int = 500, interval: float = 1.0, put_timeout: float = 0.0):
+        self.flush = flush
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.interval = interval
+        self.put_timeout = put_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._batch_ready: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failed = 0
+        self.flush_seconds = 0.0
+
+    def _ensure_started(self):
+        if self._task is None:
+            # Créés dans la boucle qui les utilise
+            self._queue = asyncio.Queue(self.maxsize)
+            self._batch_ready = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, item) -> bool:
+        """Déposer `item` ; False s'il a été abandonné (file pleine ou fermée)"""
+        if self._closed:
+            self.dropped += 1
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            if self.put_timeout <= 0:
+                self.dropped += 1
+                return False
+            try:
+                await asyncio.wait_for(self._queue.put(item), self.put_timeout)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                return False
+        self.enqueued += 1
+        if self._queue.qsize() >= self.batch_size:
+            self._batch_ready.set()
+        return True
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            if not self._closed and self._queue.qsize() + 1 < self.batch_size:
+                # Laisser le lot se remplir pendant au plus `interval`
+                self._batch_ready.clear()
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _write(self, batch: List):
+        started_at = time.perf_counter()
+        try:
+            await self.flush(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Failed to flush batch of {len(batch)}: {str(e)}")
+        else:
+            self.flushed += len(batch)
+        finally:
+            self.batches += 1
+            self.flush_seconds += time.perf_counter() - started_at
+
+    async def close(self, timeout: float = 10.0):
+        """Refuser les nouveaux éléments et écrire ceux qui restent (au plus `timeout` secondes)"""
+        self._closed = True
+        if self._task is None:
+            return
+        self._batch_ready.set()
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            self.dropped += self._queue.qsize()
+            logger.error(f"Batch queue closed with {self._queue.qsize()} items not flushed")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "maxsize": self.maxsize,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "batches": self.batches,
+            "avg_batch": round(self.flushed / self.batches, 1) if self.batches else 0.0,
+            "avg_flush_ms": round(self.flush_seconds * 1000 / self.batches, 2) if self.batches else 0.0,
+        }
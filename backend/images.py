@@ -0,0 +1,161 @@
+"""
+Variantes redimensionnées des images uploadées (avatars, photos de demandes).
+
+Le décodage et l'encodage Pillow sont coûteux en CPU et tiennent le GIL :
+`ImagePipeline` les exécute dans un pool de processus, jamais dans le worker
+qui sert les requêtes. `render_variants` applique l'orientation EXIF puis
+réencode sans aucune métadonnée (position GPS, appareil...), en WebP si
+Pillow le prend en charge, sinon en JPEG. `strip_metadata` fait de même pour
+l'original, à sa taille et dans son format, avant qu'il soit publié.
+"""
+import asyncio
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Sequence
+
+VARIANT_SIZES = (64, 256, 1024)
+
+# Refuser les images dont le décodage exploserait la mémoire (bombes de décompression)
+MAX_PIXELS = 40_000_000
+
+
+def _output_format() -> str:
+    from PIL import features
+    return "WEBP" if features.check("webp") else "JPEG"
+
+
+def render_variants(data: bytes, sizes: Sequence[int] = VARIANT_SIZES, quality: int = 80) -> Dict[int, dict]:
+    """Produire une variante par taille (plus grand côté en pixels), sans métadonnées
+
+    Les images plus petites qu'une taille demandée ne sont pas agrandies.
+    Exécutée dans un processus du pool : ne dépend que de ses arguments.
+    """
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    fmt = _output_format()
+    content_type = "image/webp" if fmt == "WEBP" else "image/jpeg"
+    with Image.open(io.BytesIO(data)) as source:
+        source.seek(0)  # première image des GIF animés
+        image = ImageOps.exif_transpose(source)
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha and fmt == "WEBP" else "RGB")
+        variants = {}
+        for size in sorted(sizes):
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+            buffer = io.BytesIO()
+            # Aucun paramètre exif= : l'image réencodée ne porte plus de métadonnées
+            if fmt == "WEBP":
+                resized.save(buffer, fmt, quality=quality, method=4)
+            else:
+                resized.save(buffer, fmt, quality=quality, optimize=True, progressive=True)
+            variants[size] = {
+                "data": buffer.getvalue(),
+                "content_type": content_type,
+                "width": resized.width,
+                "height": resized.height,
+            }
+    return variants
+
+
+class InvalidImage(Exception):
+    """Contenu que Pillow ne sait pas décoder (ou trop grand pour l'être)"""
+
+
+# Formats réencodés par strip_metadata ; le GIF ne porte pas d'EXIF et garde ainsi son animation
+SANITIZED_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+def strip_metadata(data: bytes, quality: int = 92) -> dict:
+    """Réencoder une image à sa taille, orientation EXIF appliquée et sans métadonnées
+
+    Renvoie {"data", "content_type"} ; les formats hors SANITIZED_FORMATS sont
+    rendus tels quels. Lève InvalidImage si le contenu n'est pas décodable.
+    Exécutée dans un processus du pool.
+    """
+    from PIL import Image
+
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    try:
+        return _strip_metadata(data, quality)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e)) from None
+
+
+def _strip_metadata(data: bytes, quality: int) -> dict:
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as source:
+        fmt = source.format
+        if fmt not in SANITIZED_FORMATS:
+            return {"data": data, "content_type": Image.MIME.get(fmt, "application/octet-stream")}
+        image = ImageOps.exif_transpose(source)
+        buffer = io.BytesIO()
+        # Comme pour les variantes, aucun paramètre exif= ni xmp= : seul le profil de couleur est conservé
+        if fmt == "JPEG":
+            image.save(buffer, fmt, quality=quality, optimize=True, icc_profile=source.info.get("icc_profile"))
+        elif fmt == "WEBP":
+            image.save(buffer, fmt, quality=quality, method=4, icc_profile=source.info.get("icc_profile"))
+        else:
+            image.save(buffer, fmt, icc_profile=source.info.get("icc_profile"))
+    return {"data": buffer.getvalue(), "content_type": SANITIZED_FORMATS[fmt]}
+
+
+class ImagePipeline:
+    """Pool de processus borné pour `render_variants`, avec métriques"""
+
+    def __init__(self, workers: int = 2, sizes: Sequence[int] = VARIANT_SIZES, quality: int = 80):
+        self.workers = workers
+        self.sizes = tuple(sizes)
+        self.quality = quality
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.run_seconds = 0.0
+
+    def _ensure_started(self):
+        if self._executor is None:
+            # spawn : pas de fork d'un worker qui a déjà des threads (pools, client Mongo)
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def render(self, data: bytes) -> Dict[int, dict]:
+        return await self._run(render_variants, data, self.sizes, self.quality)
+
+    async def sanitize(self, data: bytes) -> dict:
+        """Original sans métadonnées (voir `strip_metadata`)"""
+        return await self._run(strip_metadata, data)
+
+    async def _run(self, fn, *args):
+        self._ensure_started()
+        self.pending += 1
+        started_at = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+            self.run_seconds += time.perf_counter() - started_at
+        self.completed += 1
+        return result
+
+    def stats(self) -> dict:
+        done = self.completed + self.failed
+        return {
+            "workers": self.workers,
+            "sizes": list(self.sizes),
+            "pending": self.pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_run_ms": round(self.run_seconds * 1000 / done, 2) if done else 0.0,
+        }
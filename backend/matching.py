@@ -0,0 +1,451 @@
+"""
+Moteur de matching demandes <-> offres.
+
+Index en mémoire par corridor (origin_country, destination_country, mode) :
+- offres ACTIVE non masquées, triées par (capacity_kg, departure_date)
+- demandes OPEN non masquées, triées par (weight, deadline)
+
+L'index est maintenu incrémentalement par les routes qui créent, modifient
+ou suppriment des offres et des demandes ; tant qu'il n'est pas chargé
+(`ready` à False) les routes de matching interrogent Mongo directement.
+
+Les offres candidates d'une demande sont ensuite classées par un score
+vectorisé (NumPy) pondéré par le profil `matching_weights` des paramètres
+de la plateforme. L'index garde par corridor les colonnes numériques des
+offres (`OfferColumns` : prix, capacité, dates, villes, transporteur) : le
+filtrage et le score d'un corridor entier se font sans boucle Python ni
+copie de document, seule la page renvoyée est copiée.
+"""
+import bisect
+import math
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+OFFER_LISTED_STATUS = "ACTIVE"
+REQUEST_LISTED_STATUS = "OPEN"
+
+DEFAULT_MATCHING_WEIGHTS = {
+    "price": 0.35,      # coût total price_per_kg x poids (moins cher = mieux)
+    "capacity": 0.10,   # capacité restante après chargement du colis
+    "slack": 0.20,      # marge entre le départ et la date limite
+    "city": 0.20,       # villes de départ / d'arrivée identiques
+    "rating": 0.15,     # note moyenne du transporteur
+}
+SLACK_HORIZON_DAYS = 14   # au-delà, une marge supplémentaire ne rapporte plus rien
+RATING_PRIOR_COUNT = 2    # moyenne bayésienne : un transporteur sans avis vaut 3/5
+RATING_PRIOR_MEAN = 3.0
+
+
+def parse_ts(value) -> Optional[float]:
+    """Convertir une date ISO (ou datetime) en timestamp POSIX, None si absente ou invalide"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        try:
+            dt = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def corridor_key(doc: dict) -> Tuple[str, str, str]:
+    return (doc.get("origin_country"), doc.get("destination_country"), doc.get("mode"))
+
+
+def offer_is_listed(offer: dict) -> bool:
+    return offer.get("status") == OFFER_LISTED_STATUS and not offer.get("hidden")
+
+
+def request_is_listed(req: dict) -> bool:
+    return req.get("status") == REQUEST_LISTED_STATUS and not req.get("hidden")
+
+
+def _arrives_in_time(arrival: Optional[float], deadline: Optional[float]) -> bool:
+    return arrival is None or deadline is None or arrival <= deadline
+
+
+def dates_compatible(offer: dict, req: dict) -> bool:
+    """L'offre doit arriver au plus tard à la date limite de la demande"""
+    return _arrives_in_time(parse_ts(offer.get("arrival_date")), parse_ts(req.get("deadline")))
+
+
+def _nan_if_none(value: Optional[float]) -> float:
+    return np.nan if value is None else value
+
+
+def _city(value) -> str:
+    return str(value).strip().lower() if value else ""
+
+
+class OfferCodes:
+    """Codes entiers des villes et des transporteurs : les comparaisons se font sur des entiers"""
+
+    def __init__(self):
+        self.cities: Dict[str, int] = {}
+        self.user_index: Dict[str, int] = {}
+        self.users: List[str] = []
+
+    def city(self, value) -> int:
+        name = _city(value)
+        return self.cities.setdefault(name, len(self.cities)) if name else -1
+
+    def user(self, user_id) -> int:
+        code = self.user_index.get(user_id)
+        if code is None:
+            code = self.user_index[user_id] = len(self.users)
+            self.users.append(user_id)
+        return code
+
+
+# Colonnes d'une ligne d'offre
+PRICE, CAPACITY, DEPARTURE, ARRIVAL, ORIGIN_CITY, DESTINATION_CITY, USER = range(7)
+
+
+def offer_row(offer: dict, codes: OfferCodes, departure: Optional[float] = None, arrival: Optional[float] = None) -> tuple:
+    """Valeurs numériques d'une offre (dates absentes : NaN), calculées une fois à l'indexation"""
+    if departure is None:
+        departure = parse_ts(offer.get("departure_date"))
+    if arrival is None:
+        arrival = parse_ts(offer.get("arrival_date"))
+    return (
+        float(offer.get("price_per_kg") or 0.0),
+        float(offer.get("capacity_kg") or 0.0),
+        _nan_if_none(departure),
+        _nan_if_none(arrival),
+        codes.city(offer.get("origin_city")),
+        codes.city(offer.get("destination_city")),
+        codes.user(offer.get("user_id")),
+    )
+
+
+class OfferColumns:
+    """Colonnes NumPy d'un ensemble d'offres, dans un ordre fixe"""
+
+    def __init__(self, ids: np.ndarray, matrix: np.ndarray, codes: OfferCodes):
+        self.ids = ids
+        self.matrix = matrix  # une ligne par colonne (PRICE, CAPACITY...), une colonne par offre
+        self.codes = codes
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_rows(cls, ids: List[str], rows: List[tuple], codes: OfferCodes) -> "OfferColumns":
+        matrix = np.array(rows, dtype=float).reshape(len(rows), 7).T.copy()
+        return cls(np.array(ids, dtype=object), matrix, codes)
+
+    @classmethod
+    def from_offers(cls, offers: List[dict]) -> "OfferColumns":
+        codes = OfferCodes()
+        return cls.from_rows([o["id"] for o in offers], [offer_row(o, codes) for o in offers], codes)
+
+    def take(self, selector) -> "OfferColumns":
+        return OfferColumns(self.ids[selector], self.matrix[:, selector], self.codes)
+
+    def column(self, name: int) -> np.ndarray:
+        return self.matrix[name]
+
+    def user_codes(self) -> np.ndarray:
+        return self.matrix[USER].astype(np.intp)
+
+    def user_ids(self) -> List[str]:
+        """Transporteurs présents dans ces colonnes"""
+        if not len(self):
+            return []
+        present = np.flatnonzero(np.bincount(self.user_codes(), minlength=len(self.codes.users)))
+        return [self.codes.users[code] for code in present]
+
+
+def _offer_entry(offer: dict) -> tuple:
+    departure = parse_ts(offer.get("departure_date"))
+    return (float(offer.get("capacity_kg") or 0), departure if departure is not None else math.inf, offer["id"])
+
+
+def _request_entry(req: dict) -> tuple:
+    deadline = parse_ts(req.get("deadline"))
+    return (float(req.get("weight") or 0), deadline if deadline is not None else math.inf, req["id"])
+
+
+class CorridorIndex:
+    """Index trié par corridor des offres et demandes ouvertes au matching"""
+
+    def __init__(self):
+        self.ready = False
+        self._offers: Dict[str, dict] = {}
+        self._requests: Dict[str, dict] = {}
+        self._offer_corridors: Dict[tuple, List[tuple]] = {}
+        self._request_corridors: Dict[tuple, List[tuple]] = {}
+        self._offer_entries: Dict[str, Tuple[tuple, tuple]] = {}
+        self._request_entries: Dict[str, Tuple[tuple, tuple]] = {}
+        self._arrivals: Dict[str, Optional[float]] = {}
+        # Valeurs numériques par offre, et colonnes par corridor reconstruites
+        # (sans reparser les documents) à la première lecture après une modification
+        self._codes = OfferCodes()
+        self._offer_rows: Dict[str, tuple] = {}
+        self._offer_columns: Dict[tuple, OfferColumns] = {}
+        # Modifications reçues pendant la lecture d'un rechargement, rejouées sur le nouvel état
+        self._journal: Optional[List[Tuple[str, object]]] = None
+
+    def __len__(self):
+        return len(self._offers) + len(self._requests)
+
+    def begin_load(self):
+        """Journaliser les modifications jusqu'au prochain `load` (lecture du rechargement en cours)"""
+        self._journal = []
+
+    def cancel_load(self):
+        self._journal = None
+
+    def _record(self, method: str, arg):
+        if self._journal is not None:
+            self._journal.append((method, arg))
+
+    def load(self, offers, requests):
+        """Reconstruire entièrement l'index (tri unique par corridor)
+
+        Les modifications journalisées depuis `begin_load` sont rejouées ensuite : l'instantané
+        lu en base peut être antérieur à une écriture faite pendant la lecture.
+        """
+        self._offers, self._requests = {}, {}
+        self._offer_corridors, self._request_corridors = {}, {}
+        self._offer_entries, self._request_entries = {}, {}
+        self._arrivals = {}
+        self._codes = OfferCodes()
+        self._offer_rows = {}
+        self._offer_columns = {}
+        for offer in offers:
+            if offer_is_listed(offer):
+                self._add_offer(offer, sort=False)
+        for req in requests:
+            if request_is_listed(req):
+                self._add(req, _request_entry(req), self._requests, self._request_corridors, self._request_entries, sort=False)
+        for entries in self._offer_corridors.values():
+            entries.sort()
+        for entries in self._request_corridors.values():
+            entries.sort()
+        journal, self._journal = self._journal or [], None
+        for method, arg in journal:
+            getattr(self, method)(arg)
+        self.ready = True
+
+    @staticmethod
+    def _add(doc, entry, docs, corridors, entries, sort=True):
+        key = corridor_key(doc)
+        bucket = corridors.setdefault(key, [])
+        if sort:
+            bisect.insort(bucket, entry)
+        else:
+            bucket.append(entry)
+        docs[doc["id"]] = {k: v for k, v in doc.items() if k != "_id"}
+        entries[doc["id"]] = (key, entry)
+
+    @staticmethod
+    def _remove(doc_id, docs, corridors, entries):
+        located = entries.pop(doc_id, None)
+        docs.pop(doc_id, None)
+        if not located:
+            return
+        key, entry = located
+        bucket = corridors.get(key, [])
+        i = bisect.bisect_left(bucket, entry)
+        if i < len(bucket) and bucket[i] == entry:
+            bucket.pop(i)
+        if not bucket:
+            corridors.pop(key, None)
+
+    def _add_offer(self, offer: dict, sort: bool = True):
+        entry = _offer_entry(offer)
+        self._add(offer, entry, self._offers, self._offer_corridors, self._offer_entries, sort=sort)
+        arrival = parse_ts(offer.get("arrival_date"))
+        self._arrivals[offer["id"]] = arrival
+        departure = None if entry[1] == math.inf else entry[1]
+        self._offer_rows[offer["id"]] = offer_row(offer, self._codes, departure, arrival)
+
+    def upsert_offer(self, offer: dict):
+        self._record("upsert_offer", offer)
+        self._drop_offer(offer["id"])
+        if offer_is_listed(offer):
+            self._add_offer(offer)
+            self._offer_columns.pop(corridor_key(offer), None)
+
+    def remove_offer(self, offer_id: str):
+        self._record("remove_offer", offer_id)
+        self._drop_offer(offer_id)
+
+    def _drop_offer(self, offer_id: str):
+        located = self._offer_entries.get(offer_id)
+        if located:
+            self._offer_columns.pop(located[0], None)
+        self._remove(offer_id, self._offers, self._offer_corridors, self._offer_entries)
+        self._arrivals.pop(offer_id, None)
+        self._offer_rows.pop(offer_id, None)
+
+    def get_offer(self, offer_id: str) -> Optional[dict]:
+        offer = self._offers.get(offer_id)
+        return dict(offer) if offer is not None else None
+
+    def upsert_request(self, req: dict):
+        self._record("upsert_request", req)
+        self._remove(req["id"], self._requests, self._request_corridors, self._request_entries)
+        if request_is_listed(req):
+            self._add(req, _request_entry(req), self._requests, self._request_corridors, self._request_entries)
+
+    def remove_request(self, request_id: str):
+        self._record("remove_request", request_id)
+        self._remove(request_id, self._requests, self._request_corridors, self._request_entries)
+
+    def _corridor_columns(self, key: tuple) -> OfferColumns:
+        columns = self._offer_columns.get(key)
+        if columns is None:
+            ids = [offer_id for _, _, offer_id in self._offer_corridors.get(key, [])]
+            columns = OfferColumns.from_rows(ids, [self._offer_rows[offer_id] for offer_id in ids], self._codes)
+            self._offer_columns[key] = columns
+        return columns
+
+    def match_offer_columns(self, req: dict) -> OfferColumns:
+        """Colonnes des offres compatibles avec la demande (même filtre que `match_offers`)"""
+        key = corridor_key(req)
+        bucket = self._offer_corridors.get(key, [])
+        start = bisect.bisect_left(bucket, (float(req.get("weight") or 0), -math.inf, ""))
+        columns = self._corridor_columns(key)
+        arrival = columns.column(ARRIVAL)[start:]
+        deadline = parse_ts(req.get("deadline"))
+        if deadline is None:
+            return columns.take(slice(start, None))
+        return columns.take(start + np.flatnonzero(np.isnan(arrival) | (arrival <= deadline)))
+
+    def match_offers(self, req: dict) -> List[dict]:
+        """Offres du corridor dont la capacité couvre le poids et qui arrivent avant la date limite"""
+        return [dict(self._offers[offer_id]) for offer_id in self.match_offer_columns(req).ids]
+
+    def match_requests(self, offer: dict) -> List[dict]:
+        """Demandes du corridor dont le poids tient dans l'offre et dont la date limite est compatible"""
+        bucket = self._request_corridors.get(corridor_key(offer), [])
+        end = bisect.bisect_right(bucket, (float(offer.get("capacity_kg") or 0), math.inf, "\uffff"))
+        arrival = parse_ts(offer.get("arrival_date"))
+        return [
+            dict(self._requests[request_id])
+            for _, deadline, request_id in bucket[:end]
+            if _arrives_in_time(arrival, None if deadline == math.inf else deadline)
+        ]
+
+
+# ==================== SCORING ====================
+def _normalize_weights(weights: Optional[dict]) -> Dict[str, float]:
+    merged = dict(DEFAULT_MATCHING_WEIGHTS)
+    for key, value in (weights or {}).items():
+        if key in merged and value is not None:
+            merged[key] = max(float(value), 0.0)
+    total = sum(merged.values())
+    if total <= 0:
+        return dict(DEFAULT_MATCHING_WEIGHTS)
+    return {k: v / total for k, v in merged.items()}
+
+
+def score_arrays(
+    weight: float,
+    deadline_ts: Optional[float],
+    price_per_kg: np.ndarray,
+    capacity_kg: np.ndarray,
+    departure_ts: np.ndarray,
+    city_match: np.ndarray,
+    rating_sum: np.ndarray,
+    rating_count: np.ndarray,
+    weights: Optional[dict] = None,
+) -> np.ndarray:
+    """Score dans [0, 1] de chaque offre candidate ; toutes les entrées sont des tableaux de même taille"""
+    w = _normalize_weights(weights)
+
+    cost = price_per_kg * weight
+    cost_range = cost.max() - cost.min() if cost.size else 0.0
+    price_score = 1.0 - (cost - cost.min()) / cost_range if cost_range > 0 else np.ones_like(cost)
+
+    capacity_score = np.clip((capacity_kg - weight) / np.maximum(capacity_kg, 1e-9), 0.0, 1.0)
+
+    if deadline_ts is None:
+        slack_score = np.full_like(departure_ts, 0.5)
+    else:
+        slack_days = (deadline_ts - departure_ts) / 86400.0
+        slack_score = np.clip(slack_days / SLACK_HORIZON_DAYS, 0.0, 1.0)
+        slack_score = np.where(np.isnan(slack_score), 0.5, slack_score)
+
+    rating_mean = (rating_sum + RATING_PRIOR_MEAN * RATING_PRIOR_COUNT) / (rating_count + RATING_PRIOR_COUNT)
+    rating_score = np.clip(rating_mean / 5.0, 0.0, 1.0)
+
+    return (
+        w["price"] * price_score
+        + w["capacity"] * capacity_score
+        + w["slack"] * slack_score
+        + w["city"] * city_match
+        + w["rating"] * rating_score
+    )
+
+
+def score_offer_columns(req: dict, columns: OfferColumns, carriers: Dict[str, dict],
+                        weights: Optional[dict] = None) -> np.ndarray:
+    """Score de chaque offre des colonnes pour la demande `req`"""
+    codes = columns.codes
+    # -2 : ville absente ou inconnue de l'index, ne correspond à aucune offre
+    origin = codes.cities.get(_city(req.get("origin_city")), -2)
+    destination = codes.cities.get(_city(req.get("destination_city")), -2)
+    city = 0.5 * (columns.column(ORIGIN_CITY) == origin) + 0.5 * (columns.column(DESTINATION_CITY) == destination)
+    # Notes par code de transporteur, puis diffusées aux offres
+    r_sum_by_user = np.zeros(len(codes.users))
+    r_count_by_user = np.zeros(len(codes.users))
+    for user_id, carrier in carriers.items():
+        code = codes.user_index.get(user_id)
+        if code is not None and carrier:
+            r_sum_by_user[code] = carrier.get("rating_sum") or 0
+            r_count_by_user[code] = carrier.get("rating_count") or 0
+    user_codes = columns.user_codes()
+    return score_arrays(float(req.get("weight") or 0), parse_ts(req.get("deadline")),
+                        columns.column(PRICE), columns.column(CAPACITY), columns.column(DEPARTURE),
+                        city, r_sum_by_user[user_codes], r_count_by_user[user_codes], weights)
+
+
+def top_order(scores: np.ndarray, k: Optional[int] = None) -> np.ndarray:
+    """Positions des `k` meilleurs scores, dans l'ordre d'un tri stable décroissant
+
+    Sélection partielle (argpartition) : seule la page demandée est triée.
+    """
+    n = scores.size
+    if k is None or k >= n:
+        return np.argsort(-scores, kind="stable")
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    threshold = np.partition(scores, n - k)[n - k]
+    above = np.flatnonzero(scores > threshold)
+    # Ex aequo au seuil : les premiers dans l'ordre d'origine, comme le tri stable
+    ties = np.flatnonzero(scores == threshold)[:k - above.size]
+    selected = np.sort(np.concatenate([above, ties]))
+    return selected[np.argsort(-scores[selected], kind="stable")]
+
+
+def rank_offer_columns(req: dict, columns: OfferColumns, carriers: Dict[str, dict],
+                       weights: Optional[dict] = None, limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """(identifiants par score décroissant, scores correspondants), limités aux `limit` premiers"""
+    if not len(columns):
+        return columns.ids, np.empty(0)
+    scores = score_offer_columns(req, columns, carriers, weights)
+    order = top_order(scores, limit)
+    return columns.ids[order], scores[order]
+
+
+def rank_offers(req: dict, offers: List[dict], carriers: Dict[str, dict], weights: Optional[dict] = None) -> List[dict]:
+    """Classer les offres candidates d'une demande par score décroissant (ajoute `match_score`)"""
+    if not offers:
+        return []
+    by_id = {offer["id"]: offer for offer in offers}
+    ids, scores = rank_offer_columns(req, OfferColumns.from_offers(offers), carriers, weights)
+    ranked = []
+    for offer_id, score in zip(ids, scores):
+        offer = by_id[offer_id]
+        offer["match_score"] = round(float(score), 4)
+        ranked.append(offer)
+    return ranked
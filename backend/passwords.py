@@ -0,0 +1,102 @@
+"""
+Hachage et vérification bcrypt hors de la boucle d'événements.
+
+bcrypt coûte 100 à 300 ms de CPU par appel au coût 12 : exécuté dans un
+handler async, il bloque toutes les autres requêtes du worker. `PasswordHasher`
+exécute ces appels dans un pool de threads dédié (bcrypt relâche le GIL),
+limite le nombre d'appels simultanés et refuse les demandes au-delà d'une
+file d'attente bornée plutôt que de laisser la latence exploser.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import bcrypt
+
+
+class PasswordHasherBusy(Exception):
+    """La file d'attente du pool est pleine"""
+
+
+class PasswordHasher:
+    """Pool borné de hachage bcrypt avec métriques de file d'attente"""
+
+    def __init__(self, rounds: int = 12, workers: int = 2, max_queue: int = 256):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.waiting = 0
+        self.running = 0
+        self.max_waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def _ensure_started(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            self._slots = asyncio.Semaphore(self.workers)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, fn, *args):
+        self._ensure_started()
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        queued_at = time.perf_counter()
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        started_at = time.perf_counter()
+        self.wait_seconds += started_at - queued_at
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self.run_seconds += time.perf_counter() - started_at
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self._hash, password, self.rounds)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(self._verify, password, hashed)
+
+    @staticmethod
+    def _hash(password: str, rounds: int) -> str:
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+    @staticmethod
+    def _verify(password: str, hashed: str) -> bool:
+        try:
+            return bcrypt.checkpw(password.encode(), hashed.encode())
+        except ValueError:
+            # Hash absent ou mal formé
+            return False
+
+    def stats(self) -> dict:
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "waiting": self.waiting,
+            "running": self.running,
+            "max_waiting": self.max_waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_seconds * 1000 / self.completed, 2) if self.completed else 0.0,
+            "avg_run_ms": round(self.run_seconds * 1000 / self.completed, 2) if self.completed else 0.0,
+        }
@@ -0,0 +1,171 @@
+"""
+Limitation de débit par fenêtre glissante (anti brute-force).
+
+Chaque limiteur compte les tentatives par clé (IP, email...) dans deux
+compteurs à fenêtre fixe, la fenêtre courante et la précédente. Le nombre de
+tentatives sur la dernière fenêtre glissante est estimé en pondérant la
+fenêtre précédente par la part encore couverte. C'est O(1) en temps et en
+mémoire par clé, contrairement à un journal des horodatages.
+
+`MemoryCounterStore` garde les compteurs dans le worker (LRU borné).
+`RedisCounterStore` les partage entre workers ; il accepte n'importe quel
+client compatible `redis.asyncio` (INCR / EXPIRE / GET en pipeline, DECR).
+
+Pour ne compter que les échecs sans laisser passer une rafale parallèle,
+une tentative est réservée par `hit` avant le traitement puis rendue par
+`refund` s'il réussit.
+"""
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def parse_rate(value: str) -> Tuple[int, float]:
+    """Convertir "20/60" en (20 tentatives, fenêtre de 60 secondes)"""
+    limit, _, window = value.partition("/")
+    return int(limit), float(window or 60)
+
+
+class MemoryCounterStore:
+    """Compteurs (fenêtre courante, fenêtre précédente) par clé, bornés en nombre de clés"""
+
+    backend = "memory"
+
+    def __init__(self, maxkeys: int = 100_000):
+        self.maxkeys = maxkeys
+        self._counters: "OrderedDict[str, list]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._counters)
+
+    async def incr(self, key: str, bucket: int, window: float) -> Tuple[int, int]:
+        entry = self._counters.get(key)
+        if entry is None or entry[0] < bucket - 1:
+            entry = [bucket, 0, 0]
+        elif entry[0] == bucket - 1:
+            entry = [bucket, 0, entry[1]]
+        entry[1] += 1
+        self._counters[key] = entry
+        self._counters.move_to_end(key)
+        while len(self._counters) > self.maxkeys:
+            self._counters.popitem(last=False)
+        return entry[1], entry[2]
+
+    async def decr(self, key: str, bucket: int, window: float):
+        entry = self._counters.get(key)
+        if entry is None or entry[0] < bucket - 1:
+            return
+        # entry[1] : fenêtre de l'entrée ; entry[2] : celle d'avant. Une tentative comptée
+        # avant un changement de fenêtre est rendue à la fenêtre précédente.
+        slot = 2 if entry[0] == bucket and entry[1] == 0 else 1
+        entry[slot] = max(0, entry[slot] - 1)
+
+    async def peek(self, key: str, bucket: int, window: float) -> Tuple[int, int]:
+        entry = self._counters.get(key)
+        if entry is None or entry[0] < bucket - 1:
+            return 0, 0
+        if entry[0] == bucket - 1:
+            return 0, entry[1]
+        return entry[1], entry[2]
+
+
+class RedisCounterStore:
+    """Compteurs partagés entre workers : une clé Redis par (clé, fenêtre), expirée après deux fenêtres"""
+
+    backend = "redis"
+
+    def __init__(self, url: Optional[str] = None, prefix: str = "waselni:rl:", client=None):
+        self.prefix = prefix
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError as e:
+                raise RuntimeError("REDIS_URL est défini mais le paquet 'redis' n'est pas installé") from e
+            client = redis.from_url(url)
+        self._redis = client
+
+    async def incr(self, key: str, bucket: int, window: float) -> Tuple[int, int]:
+        current_key = f"{self.prefix}{key}:{bucket}"
+        pipe = self._redis.pipeline()
+        pipe.incr(current_key)
+        pipe.expire(current_key, int(math.ceil(window * 2)))
+        pipe.get(f"{self.prefix}{key}:{bucket - 1}")
+        current, _, previous = await pipe.execute()
+        return int(current), int(previous or 0)
+
+    async def decr(self, key: str, bucket: int, window: float):
+        current_key = f"{self.prefix}{key}:{bucket}"
+        if await self._redis.decr(current_key) < 0:
+            # Tentative comptée dans la fenêtre précédente (changement de fenêtre depuis le hit)
+            pipe = self._redis.pipeline()
+            pipe.incr(current_key)
+            pipe.decr(f"{self.prefix}{key}:{bucket - 1}")
+            await pipe.execute()
+
+    async def peek(self, key: str, bucket: int, window: float) -> Tuple[int, int]:
+        current, previous = await self._redis.mget(f"{self.prefix}{key}:{bucket}", f"{self.prefix}{key}:{bucket - 1}")
+        return int(current or 0), int(previous or 0)
+
+
+class SlidingWindowLimiter:
+    """`limit` tentatives par fenêtre glissante de `window` secondes et par clé"""
+
+    def __init__(self, name: str, limit: int, window: float, store, clock: Callable[[], float] = time.time):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.store = store
+        self.clock = clock
+        self.allowed = 0
+        self.rejected = 0
+
+    async def hit(self, key: str) -> Optional[int]:
+        """Compter une tentative ; renvoie None si elle est permise, sinon le délai d'attente en secondes"""
+        return await self._evaluate(key, record=True)
+
+    async def check(self, key: str) -> Optional[int]:
+        """Comme `hit`, sans compter de tentative (la limite porte alors sur les tentatives déjà enregistrées)"""
+        return await self._evaluate(key, record=False)
+
+    async def refund(self, key: str):
+        """Rendre une tentative réservée par `hit` (le traitement a réussi et ne compte pas)"""
+        bucket = int(self.clock() // self.window)
+        try:
+            await self.store.decr(f"{self.name}:{key}", bucket, self.window)
+        except Exception as e:
+            logger.error(f"Rate limiter {self.name} unavailable: {str(e)}")
+
+    async def _evaluate(self, key: str, record: bool) -> Optional[int]:
+        now = self.clock()
+        bucket = int(now // self.window)
+        elapsed = (now % self.window) / self.window
+        # Sans enregistrement, la tentative courante doit encore tenir dans la limite
+        limit = self.limit if record else self.limit - 1
+        try:
+            counter = self.store.incr if record else self.store.peek
+            current, previous = await counter(f"{self.name}:{key}", bucket, self.window)
+        except Exception as e:
+            # Backend partagé indisponible : on laisse passer plutôt que de bloquer tout le monde
+            logger.error(f"Rate limiter {self.name} unavailable: {str(e)}")
+            return None
+        if previous * (1 - elapsed) + current <= limit:
+            self.allowed += 1
+            return None
+        self.rejected += 1
+        if current > limit:
+            return max(1, math.ceil(self.window * (1 - elapsed)))
+        # La fenêtre précédente suffit à dépasser la limite : attendre qu'elle ait assez décru
+        decay_needed = (previous + current - limit) / previous
+        return max(1, math.ceil(self.window * (decay_needed - elapsed)))
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "window_seconds": self.window,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
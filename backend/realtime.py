@@ -0,0 +1,137 @@
+"""
+Diffusion temps réel (pub/sub) entre les routes et les connexions WebSocket.
+
+`PubSubHub` distribue en mémoire, dans le worker courant : chaque canal
+référence les files d'envoi des connexions abonnées, un canal sans abonné
+ne coûte rien. `RedisPubSubHub` relaie en plus les publications via Redis
+pour que plusieurs workers uvicorn partagent les mêmes canaux ; chaque
+worker ne s'abonne côté Redis qu'aux canaux qui ont un abonné local. Il
+exige le paquet `redis` (ou un substitut local compatible `redis.asyncio`).
+"""
+import asyncio
+import json
+import logging
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class PubSubHub:
+    """Hub pub/sub en mémoire : canal -> files asyncio des connexions abonnées"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def subscribe(self, channel: str, queue: asyncio.Queue):
+        self._subscribers.setdefault(channel, set()).add(queue)
+
+    async def unsubscribe(self, channel: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(channel)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[channel]
+
+    async def publish(self, channel: str, message: dict):
+        self.published += 1
+        self._deliver(channel, message)
+
+    def _deliver(self, channel: str, message: dict):
+        for queue in self._subscribers.get(channel, ()):
+            try:
+                queue.put_nowait((channel, message))
+                self.delivered += 1
+            except asyncio.QueueFull:
+                # Client trop lent : on perd le message plutôt que de bloquer l'émetteur
+                self.dropped += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "channels": len(self._subscribers),
+            "subscriptions": sum(len(q) for q in self._subscribers.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+class RedisPubSubHub(PubSubHub):
+    """Hub partagé entre workers : publication via Redis, distribution locale par chaque worker"""
+
+    def __init__(self, url: str, prefix: str = "waselni:", client=None):
+        super().__init__()
+        self.prefix = prefix
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError as e:
+                raise RuntimeError("REDIS_URL est défini mais le paquet 'redis' n'est pas installé") from e
+            client = redis.from_url(url)
+        self._redis = client
+        self._pubsub = None
+        self._active: Optional[asyncio.Event] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._pubsub = self._redis.pubsub()
+        self._active = asyncio.Event()
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+        if self._pubsub is not None:
+            await self._pubsub.close()
+        await self._redis.close()
+
+    async def subscribe(self, channel: str, queue: asyncio.Queue):
+        first = channel not in self._subscribers
+        await super().subscribe(channel, queue)
+        if first:
+            await self._pubsub.subscribe(f"{self.prefix}{channel}")
+            self._active.set()
+
+    async def unsubscribe(self, channel: str, queue: asyncio.Queue):
+        listened = channel in self._subscribers
+        await super().unsubscribe(channel, queue)
+        if listened and channel not in self._subscribers:
+            await self._pubsub.unsubscribe(f"{self.prefix}{channel}")
+            if not self._subscribers:
+                self._active.clear()
+
+    async def publish(self, channel: str, message: dict):
+        self.published += 1
+        await self._redis.publish(f"{self.prefix}{channel}", json.dumps(message))
+
+    async def _listen(self):
+        while True:
+            try:
+                # Sans abonnement, la connexion pub/sub n'a rien à lire
+                await self._active.wait()
+                item = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if not item or item.get("type") != "message":
+                    continue
+                channel = item["channel"]
+                if isinstance(channel, bytes):
+                    channel = channel.decode()
+                self._deliver(channel[len(self.prefix):], json.loads(item["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Redis pub/sub listener failed: {str(e)}")
+                await asyncio.sleep(1)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "backend": "redis"}
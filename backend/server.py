@@ -1,24 +1,46 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Query, status
+from fastapi import Request as FastAPIRequest, WebSocket, WebSocketDisconnect
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring, IndexModel, ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Literal
 import os
 import logging
 import asyncio
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr, ConfigDict, validator
-from typing import List, Optional, Literal
 import uuid
+import time
 from datetime import datetime, timezone, timedelta
-import bcrypt
 import jwt
 import re
+import json
+import base64
+import hashlib
 from enum import Enum
-import shutil
+import sys
+import argparse
 import paypalrestsdk
 import resend
+from matching import CorridorIndex, OfferColumns, dates_compatible, rank_offer_columns, DEFAULT_MATCHING_WEIGHTS
+from analytics import ANALYTICS_TOTALS_ID, VisitRollup
+from batching import BatchQueue
+from cache import TTLCache
+from realtime import PubSubHub, RedisPubSubHub
+from images import ImagePipeline, InvalidImage
+from passwords import PasswordHasher, PasswordHasherBusy
+from ratelimit import MemoryCounterStore, RedisCounterStore, SlidingWindowLimiter, parse_rate
+from sketches import BloomFilter, HyperLogLog
+from storage import storage_from_env
+from uploads import (
+    DEFAULT_KINDS, RangeNotSatisfiable, UploadRejected, UploadService,
+    blob_etag, blob_key_from_url, content_type_for, parse_range, sweep_blobs
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -28,9 +50,25 @@ resend.api_key = os.environ.get('RESEND_API_KEY', '')
 SENDER_EMAIL = os.environ.get('SENDER_EMAIL', 'onboarding@resend.dev')
 ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL', 'admin@logimatch.com')
 
+# Comptage des requêtes Mongo par requête HTTP (exposé dans l'en-tête X-DB-Queries)
+db_query_count: ContextVar[Optional[list]] = ContextVar("db_query_count", default=None)
+
+class QueryCountListener(monitoring.CommandListener):
+    """Incrémente le compteur de la requête HTTP courante à chaque commande Mongo"""
+    def started(self, event):
+        counter = db_query_count.get()
+        if counter is not None:
+            counter[0] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[QueryCountListener()])
 db = client[os.environ['DB_NAME']]
 
 # JWT Config
@@ -38,6 +76,33 @@ JWT_SECRET = os.environ.get('JWT_SECRET', 'logimatch_secret_key_change_in_produc
 JWT_ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 REFRESH_TOKEN_EXPIRE_DAYS = 7
+# "db" : chaque requête authentifiée relit l'utilisateur (cache compris) ;
+# "claims" : les routes de lecture s'autorisent sur les claims signés du token
+AUTH_MODE = os.environ.get("AUTH_MODE", "db")
+
+# Pub/sub temps réel (Redis si plusieurs workers, sinon en mémoire)
+REDIS_URL = os.environ.get("REDIS_URL")
+# Identifie les événements publiés par ce processus (ignorés à la réception)
+WORKER_ID = uuid.uuid4().hex
+
+def configured_worker_count() -> int:
+    """Nombre de workers uvicorn (--workers, sinon WEB_CONCURRENCY) ; les workers héritent de sys.argv"""
+    value = os.environ.get("WEB_CONCURRENCY", "1")
+    for i, arg in enumerate(sys.argv):
+        if arg == "--workers" and i + 1 < len(sys.argv):
+            value = sys.argv[i + 1]
+        elif arg.startswith("--workers="):
+            value = arg.split("=", 1)[1]
+    try:
+        return int(value)
+    except ValueError:
+        return 1
+
+WORKER_COUNT = configured_worker_count()
+
+# Nombre de reverse proxies de confiance devant l'API : chacun ajoute à X-Forwarded-For
+# l'adresse qui l'a contacté. 0 (défaut) : l'en-tête est ignoré, à configurer derrière un proxy.
+TRUSTED_PROXIES = int(os.environ.get("TRUSTED_PROXIES", "0"))
 
 # Upload directory
 UPLOAD_DIR = ROOT_DIR / "uploads"
@@ -382,10 +447,18 @@ class CountryUpdate(BaseModel):
     is_origin: Optional[bool] = None
     is_destination: Optional[bool] = None
 
+class MatchingWeights(BaseModel):
+    price: Optional[float] = Field(None, ge=0)
+    capacity: Optional[float] = Field(None, ge=0)
+    slack: Optional[float] = Field(None, ge=0)
+    city: Optional[float] = Field(None, ge=0)
+    rating: Optional[float] = Field(None, ge=0)
+
 class PlatformSettingsUpdate(BaseModel):
     commission_enabled: Optional[bool] = None
     shipper_commission_rate: Optional[float] = None
     carrier_commission_rate: Optional[float] = None
+    matching_weights: Optional[MatchingWeights] = None
 
 class PaymentCreate(BaseModel):
     contract_id: str
@@ -409,11 +482,163 @@ class GoogleAdsSettingsUpdate(BaseModel):
     in_content_ad_slot: Optional[str] = None
 
 # ==================== HELPERS ====================
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+# bcrypt tourne dans un pool dédié pour ne pas bloquer la boucle d'événements
+password_hasher = PasswordHasher(
+    rounds=int(os.environ.get("BCRYPT_ROUNDS", "12")),
+    workers=int(os.environ.get("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    max_queue=int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", "256"))
+)
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode(), hashed.encode())
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Service momentanément surchargé, réessayez")
+
+async def verify_password(password: str, hashed: str) -> bool:
+    try:
+        return await password_hasher.verify(password, hashed)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Service momentanément surchargé, réessayez")
+
+# Uploads écrits en flux hors de la boucle d'événements ; UPLOAD_MAX_<NATURE>_BYTES ajuste les tailles
+# STORAGE_BACKEND=s3 publie les blobs dans S3_BUCKET ; UPLOAD_DIR ne garde alors que les temporaires
+upload_storage = storage_from_env(UPLOAD_DIR)
+upload_service = UploadService(UPLOAD_DIR, {
+    kind: (types, int(os.environ.get(f"UPLOAD_MAX_{kind.upper()}_BYTES", str(max_size))))
+    for kind, (types, max_size) in DEFAULT_KINDS.items()
+}, storage=upload_storage)
+
+async def save_upload(file: UploadFile, kind: str) -> str:
+    """Enregistrer un fichier uploadé comme blob, compter la référence et renvoyer son URL publique"""
+    try:
+        saved = await upload_service.save(file, kind)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return await reference_blob(saved)
+
+async def save_image_upload(file: UploadFile, kind: str) -> str:
+    """Comme save_upload pour une image publique (avatar, photo) : l'original publié est
+    réencodé sans métadonnées (position GPS, appareil...), seules les variantes ne suffisent pas"""
+    saved, raw = await save_raw_image(file, kind)
+    cleaned = None
+    try:
+        clean = await image_pipeline.sanitize(raw)
+        cleaned = await upload_service.store_bytes(clean["data"], clean["content_type"])
+    except InvalidImage as e:
+        logger.warning(f"Image upload rejected ({kind}): {str(e)}")
+        raise HTTPException(status_code=400, detail="Image illisible")
+    finally:
+        # Un GIF est rendu tel quel : le fichier brut est alors l'original publié
+        if not saved["deduplicated"] and (cleaned is None or cleaned["key"] != saved["key"]):
+            await discard_raw_blob(saved["key"])
+    return await reference_blob(cleaned)
+
+async def save_raw_image(file: UploadFile, kind: str) -> tuple:
+    """Enregistrer l'image envoyée et la relire ; renvoie (saved, contenu)"""
+    for attempt in range(2):
+        try:
+            saved = await upload_service.save(file, kind)
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        try:
+            return saved, await upload_service.read(saved["key"])
+        except FileNotFoundError:
+            # Upload identique simultané : dédupliqué sur son fichier brut, qu'il vient de supprimer
+            if attempt:
+                raise
+            await file.seek(0)
+
+async def discard_raw_blob(key: str):
+    """Supprimer tout de suite le fichier brut d'un upload réencodé, s'il n'est référencé nulle part"""
+    if await db.blobs.find_one({"key": key}, {"_id": 1}):
+        return
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, upload_storage.delete, key)
+    except Exception as e:
+        # gc-uploads le supprimera : aucun document ne le référence
+        logger.error(f"Failed to delete raw upload {key}: {str(e)}")
+
+async def reference_blob(saved: dict) -> str:
+    await db.blobs.update_one(
+        {"id": saved["sha256"]},
+        {
+            "$inc": {"refs": 1},
+            "$set": {"last_ref_at": now_utc()},
+            "$setOnInsert": {
+                "key": saved["key"],
+                "size": saved["size"],
+                "content_type": saved["content_type"],
+                "created_at": now_utc()
+            }
+        },
+        upsert=True
+    )
+    return f"/uploads/{saved['key']}"
+
+def upload_urls(value) -> Iterator[str]:
+    """URLs d'un champ : chaîne, tableau, ou variantes {"64": url, ...} (la clé "original" renvoie ailleurs)"""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, list):
+        for item in value:
+            yield from upload_urls(item)
+    elif isinstance(value, dict):
+        for name, item in value.items():
+            if name != "original":
+                yield from upload_urls(item)
+
+async def release_uploads(*urls: Optional[str]):
+    """Décompter les références vers des blobs (le fichier est supprimé par gc-uploads)"""
+    for url in urls:
+        key = blob_key_from_url(url)
+        if key:
+            await db.blobs.update_one({"key": key, "refs": {"$gt": 0}}, {"$inc": {"refs": -1}})
+
+# Variantes redimensionnées (64/256/1024 px) calculées dans un pool de processus
+image_pipeline = ImagePipeline(workers=int(os.environ.get("IMAGE_WORKERS", "2")))
+
+async def generate_image_variants(original_url: str) -> Dict[str, str]:
+    """Produire et enregistrer les variantes d'une image uploadée : {"64": url, ...}"""
+    data = await upload_service.read(blob_key_from_url(original_url))
+    rendered = await image_pipeline.render(data)
+    variants = {}
+    for size, variant in rendered.items():
+        saved = await upload_service.store_bytes(variant["data"], variant["content_type"])
+        variants[str(size)] = await reference_blob(saved)
+    return variants
+
+async def process_avatar_variants(user_id: str, avatar_url: str):
+    """Tâche de fond : variantes de l'avatar, ignorées si l'avatar a changé entre-temps"""
+    try:
+        variants = await generate_image_variants(avatar_url)
+    except Exception as e:
+        logger.error(f"Avatar variants failed for {user_id}: {str(e)}")
+        return
+    user = await db.users.find_one_and_update(
+        {"id": user_id, "avatar_url": avatar_url},
+        {"$set": {"avatar_variants": variants}, "$inc": {"profile_version": 1}},
+        projection={"_id": 0, "password_hash": 0}, return_document=ReturnDocument.AFTER
+    )
+    if not user:
+        await release_uploads(*variants.values())
+        return
+    await invalidate_user(user_id)
+    await refresh_sender_snapshots(user)
+
+async def process_photo_variants(request_id: str, photo_url: str):
+    """Tâche de fond : variantes d'une photo de demande, rangées dans photo_variants"""
+    try:
+        variants = await generate_image_variants(photo_url)
+    except Exception as e:
+        logger.error(f"Photo variants failed for request {request_id}: {str(e)}")
+        return
+    result = await db.requests.update_one(
+        {"id": request_id, "photos": photo_url},
+        {"$push": {"photo_variants": {"original": photo_url, **variants}}}
+    )
+    if not result.matched_count:
+        await release_uploads(*variants.values())
 
 def create_token(data: dict, expires_delta: timedelta) -> str:
     to_encode = data.copy()
@@ -429,15 +654,246 @@ def decode_token(token: str) -> dict:
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Token invalide")
 
+# Cache des utilisateurs authentifiés : chaque écriture sur un utilisateur doit appeler invalidate_user
+user_cache = TTLCache(
+    maxsize=int(os.environ.get("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("USER_CACHE_TTL_SECONDS", "30"))
+)
+USER_INVALIDATION_CHANNEL = "users:invalidate"
+
+async def load_user(user_id: str) -> Optional[dict]:
+    """Document utilisateur depuis le cache du worker, ou Mongo en cas d'absence"""
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await db.users.find_one({"id": user_id}, {"_id": 0})
+        if not user:
+            return None
+        user_cache.set(user_id, user)
+    return dict(user)
+
+async def invalidate_user(user_id: str):
+    """Oublier l'utilisateur dans ce worker et, via le hub pub/sub, dans les autres"""
+    user_cache.pop(user_id)
+    await hub.publish(USER_INVALIDATION_CHANNEL, {"user_id": user_id})
+
+# Version minimale des tokens par utilisateur : seuls les utilisateurs dont la version a été incrémentée y figurent
+token_versions: Dict[str, int] = {}
+TOKEN_VERSION_CHANNEL = "users:token_version"
+# Rechargement périodique : rattrape les incréments dont l'événement pub/sub a été perdu (Redis absent ou déconnecté)
+TOKEN_VERSIONS_RELOAD_SECONDS = int(os.environ.get("TOKEN_VERSIONS_RELOAD_SECONDS", "60"))
+
+def issue_access_token(user: dict, family_id: Optional[str] = None) -> str:
+    return create_token({
+        "sub": user["id"],
+        "role": user["role"],
+        "status": user.get("status", UserStatus.ACTIVE.value),
+        "ver": user.get("token_version", 0),
+        "fam": family_id
+    }, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+async def issue_refresh_token(user: dict, family_id: Optional[str] = None) -> tuple:
+    """Émettre un refresh token enregistré (jti) dans sa famille ; renvoie (token, family_id)"""
+    jti = str(uuid.uuid4())
+    family_id = family_id or str(uuid.uuid4())
+    expires_at = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    await db.refresh_tokens.insert_one({
+        "jti": jti,
+        "family_id": family_id,
+        "user_id": user["id"],
+        "used_at": None,
+        "created_at": now_utc(),
+        "expires_at": expires_at
+    })
+    token = create_token(
+        {"sub": user["id"], "type": "refresh", "ver": user.get("token_version", 0), "jti": jti, "fam": family_id},
+        timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    return token, family_id
+
+async def issue_session(user: dict) -> tuple:
+    """Nouvelle famille de tokens (login, inscription) : renvoie (access_token, refresh_token)"""
+    refresh, family_id = await issue_refresh_token(user)
+    return issue_access_token(user, family_id), refresh
+
+# Familles de refresh tokens révoquées (déconnexion, réutilisation détectée). Le filtre de Bloom
+# évite tout accès base pour une famille non révoquée ; un positif est confirmé dans revoked_tokens.
+REVOCATION_FILTER_CAPACITY = int(os.environ.get("REVOCATION_FILTER_CAPACITY", "100000"))
+revoked_families = BloomFilter(REVOCATION_FILTER_CAPACITY)
+TOKEN_REVOKED_CHANNEL = "tokens:revoked"
+REVOCATION_FILTER_REBUILD_SECONDS = 3600
+# Sans Redis, les révocations des autres workers sont relues (incrémentalement) à cette cadence
+REVOCATION_FILTER_RELOAD_SECONDS = int(os.environ.get("REVOCATION_FILTER_RELOAD_SECONDS", "60"))
+# Reconstruction anticipée quand le filtre dépasse sa capacité
+revocation_filter_stale = asyncio.Event()
+# Révocations reçues pendant une reconstruction, à reporter dans le nouveau filtre (None hors reconstruction)
+revoked_during_rebuild: Optional[set] = None
+
+async def is_family_revoked(family_id: Optional[str]) -> bool:
+    if not family_id or family_id not in revoked_families:
+        return False
+    return await db.revoked_tokens.find_one({"id": family_id}, {"_id": 1}) is not None
+
+def remember_revoked_family(family_id: str):
+    """Ajouter une famille révoquée au filtre du worker (révocation locale ou reçue du hub)"""
+    if revoked_during_rebuild is not None:
+        revoked_during_rebuild.add(family_id)
+    if family_id in revoked_families:
+        return
+    revoked_families.add(family_id)
+    if revoked_families.saturated():
+        revocation_filter_stale.set()
+
+async def revoke_token_family(family_id: str, user_id: str, reason: str):
+    """Révoquer tous les tokens (refresh et access) d'une session"""
+    await db.revoked_tokens.update_one(
+        {"id": family_id},
+        {"$setOnInsert": {
+            "id": family_id,
+            "user_id": user_id,
+            "reason": reason,
+            "created_at": now_utc(),
+            "expires_at": datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+        }},
+        upsert=True
+    )
+    # Les refresh tokens encore inutilisés de la session sont consommés : plus aucune rotation possible,
+    # même si le filtre d'un worker ne connaît pas encore la révocation
+    await db.refresh_tokens.update_many(
+        {"family_id": family_id, "used_at": None},
+        {"$set": {"used_at": now_utc()}}
+    )
+    remember_revoked_family(family_id)
+    await hub.publish(TOKEN_REVOKED_CHANNEL, {"family_id": family_id})
+
+async def load_revoked_families() -> BloomFilter:
+    """Reconstruire le filtre depuis revoked_tokens (dont l'index TTL purge les entrées expirées)"""
+    count = await db.revoked_tokens.count_documents({})
+    # Dimensionné avec de la marge si les révocations dépassent la capacité configurée
+    families = BloomFilter(max(REVOCATION_FILTER_CAPACITY, 2 * count))
+    async for doc in db.revoked_tokens.find({}, {"_id": 0, "id": 1}):
+        families.add(doc["id"])
+    return families
+
+async def load_recent_revocations(since: datetime) -> int:
+    """Ajouter au filtre les familles révoquées depuis `since` ; renvoie leur nombre"""
+    count = 0
+    async for doc in db.revoked_tokens.find({"created_at": {"$gte": since.isoformat()}}, {"_id": 0, "id": 1}):
+        remember_revoked_family(doc["id"])
+        count += 1
+    return count
+
+async def refresh_revoked_families():
+    global revoked_families, revoked_during_rebuild
+    rebuilt_at = None
+    loaded_since = None
+    while True:
+        # Chevauchement d'une période : une révocation datée juste avant la lecture peut n'être visible qu'après
+        started = datetime.now(timezone.utc) - timedelta(seconds=REVOCATION_FILTER_RELOAD_SECONDS)
+        rebuild = (
+            rebuilt_at is None
+            or revocation_filter_stale.is_set()
+            or time.monotonic() - rebuilt_at >= REVOCATION_FILTER_REBUILD_SECONDS
+        )
+        if rebuild:
+            revocation_filter_stale.clear()
+            revoked_during_rebuild = set()
+        try:
+            if rebuild:
+                fresh = await load_revoked_families()
+                # Une révocation publiée pendant le chargement peut manquer à la lecture : elle est reportée
+                for family_id in revoked_during_rebuild:
+                    fresh.add(family_id)
+                revoked_families = fresh
+                rebuilt_at = time.monotonic()
+                logger.info(f"Revocation filter loaded: {len(fresh)} families")
+            else:
+                await load_recent_revocations(loaded_since)
+            loaded_since = started
+        except PyMongoError as e:
+            logger.error(f"Failed to load revocation filter: {str(e)}")
+        finally:
+            revoked_during_rebuild = None
+        try:
+            await asyncio.wait_for(revocation_filter_stale.wait(), REVOCATION_FILTER_RELOAD_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+@app.on_event("startup")
+async def start_revocation_filter():
+    app.state.revocation_filter_task = asyncio.create_task(refresh_revoked_families())
+
+def check_token_version(payload: dict, user: Optional[dict] = None):
+    current = max(token_versions.get(payload.get("sub"), 0), (user or {}).get("token_version", 0))
+    if payload.get("ver", 0) < current:
+        raise HTTPException(status_code=401, detail="Token révoqué")
+
+async def revoke_user_tokens(user_id: str):
+    """Incrémenter la version des tokens de l'utilisateur : tous ceux déjà émis deviennent invalides"""
+    updated = await db.users.find_one_and_update(
+        {"id": user_id},
+        {"$inc": {"token_version": 1}},
+        projection={"token_version": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if updated:
+        token_versions[user_id] = updated["token_version"]
+        await hub.publish(TOKEN_VERSION_CHANNEL, {"user_id": user_id, "version": updated["token_version"]})
+    await invalidate_user(user_id)
+
+async def load_token_versions() -> Dict[str, int]:
+    versions = {}
+    async for user in db.users.find({"token_version": {"$gt": 0}}, {"_id": 0, "id": 1, "token_version": 1}):
+        versions[user["id"]] = user["token_version"]
+    return versions
+
+async def refresh_token_versions():
+    while True:
+        await asyncio.sleep(TOKEN_VERSIONS_RELOAD_SECONDS)
+        try:
+            fresh = await load_token_versions()
+        except PyMongoError as e:
+            logger.error(f"Failed to load token versions: {str(e)}")
+            continue
+        # Fusion plutôt que remplacement : une version reçue pendant le chargement ne doit pas reculer
+        for user_id, version in fresh.items():
+            if version > token_versions.get(user_id, 0):
+                token_versions[user_id] = version
+
+@app.on_event("startup")
+async def start_token_versions():
+    token_versions.update(await load_token_versions())
+    app.state.token_versions_task = asyncio.create_task(refresh_token_versions())
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     payload = decode_token(credentials.credentials)
-    user = await db.users.find_one({"id": payload.get("sub")}, {"_id": 0})
+    # Seuls les access tokens (sans type) autorisent une requête : pas un refresh ni un lien de réinitialisation
+    if payload.get("type"):
+        raise HTTPException(status_code=401, detail="Token invalide")
+    user = await load_user(payload.get("sub"))
     if not user:
         raise HTTPException(status_code=401, detail="Utilisateur non trouvé")
+    check_token_version(payload, user)
+    if await is_family_revoked(payload.get("fam")):
+        raise HTTPException(status_code=401, detail="Token révoqué")
     if user.get("status") == UserStatus.SUSPENDED.value:
         raise HTTPException(status_code=403, detail="Compte suspendu")
     return user
 
+async def get_current_principal(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Identité suffisante pour autoriser (id, role, status).
+    En AUTH_MODE=claims elle est lue dans le token sans accès à la base ; sinon c'est get_current_user."""
+    if AUTH_MODE != "claims":
+        return await get_current_user(credentials)
+    payload = decode_token(credentials.credentials)
+    if payload.get("type") or "status" not in payload:
+        raise HTTPException(status_code=401, detail="Token invalide")
+    check_token_version(payload)
+    if await is_family_revoked(payload.get("fam")):
+        raise HTTPException(status_code=401, detail="Token révoqué")
+    if payload["status"] == UserStatus.SUSPENDED.value:
+        raise HTTPException(status_code=403, detail="Compte suspendu")
+    return {"id": payload["sub"], "role": payload.get("role"), "status": payload["status"]}
+
 async def require_role(user: dict, roles: List[str]):
     if user.get("role") not in roles:
         raise HTTPException(status_code=403, detail="Accès non autorisé")
@@ -450,6 +906,273 @@ def serialize_doc(doc: dict) -> dict:
 def now_utc() -> str:
     return datetime.now(timezone.utc).isoformat()
 
+# La boucle ne garde qu'une référence faible aux tâches : sans celle-ci, une tâche de fond peut disparaître en cours
+background_tasks: set = set()
+
+def run_in_background(coro, name: str) -> asyncio.Task:
+    """Lancer une tâche de fond sans l'attendre ; son échec est journalisé"""
+    task = asyncio.create_task(coro, name=name)
+    background_tasks.add(task)
+    task.add_done_callback(_background_task_done)
+    return task
+
+def _background_task_done(task: asyncio.Task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background task {task.get_name()} failed: {task.exception()!r}")
+
+def get_client_ip(request: FastAPIRequest) -> str:
+    """IP du client, en tenant compte des reverse proxies de confiance (X-Forwarded-For)
+
+    Le début de l'en-tête est fourni par le client et peut être falsifié : on
+    prend l'entrée ajoutée par le plus éloigné de nos TRUSTED_PROXIES proxies.
+    """
+    forwarded_for = request.headers.get("x-forwarded-for")
+    if TRUSTED_PROXIES > 0 and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+        if hops:
+            return hops[-min(TRUSTED_PROXIES, len(hops))]
+    return request.client.host if request.client else "unknown"
+
+class UserBatch:
+    """Regrouper les fetch_users de sections exécutées en parallèle (asyncio.gather)
+
+    Chaque participant qui demande des utilisateurs attend ; dès que tous les
+    participants encore actifs attendent (ou ont terminé), une seule requête
+    $in sert l'union des ids et des projections, puis chacun reçoit sa part.
+    """
+
+    def __init__(self, participants: int):
+        self.active = participants
+        self.pending = []
+        self.queries = 0
+
+    def leave(self):
+        self.active -= 1
+        self._maybe_flush()
+
+    async def load(self, ids: List[str], projection: dict) -> dict:
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((ids, projection, future))
+        self.active -= 1
+        self._maybe_flush()
+        return await future
+
+    def _maybe_flush(self):
+        if self.active == 0 and self.pending:
+            waiting, self.pending = self.pending, []
+            self.active += len(waiting)
+            run_in_background(self._flush(waiting), "user-batch")
+
+    async def _flush(self, waiting):
+        self.queries += 1
+        ids = {uid for batch_ids, _, _ in waiting for uid in batch_ids}
+        projection = {field: 1 for _, proj, _ in waiting for field in proj}
+        try:
+            users = await query_users(list(ids), {**projection, "id": 1})
+        except Exception as e:
+            for _, _, future in waiting:
+                future.set_exception(e)
+            return
+        for batch_ids, proj, future in waiting:
+            future.set_result({
+                uid: {k: v for k, v in users[uid].items() if k in proj}
+                for uid in batch_ids if uid in users
+            })
+
+user_batch: ContextVar[Optional[UserBatch]] = ContextVar("user_batch", default=None)
+
+async def fetch_users(user_ids, projection: dict) -> dict:
+    """Charger en une seule requête $in les utilisateurs référencés, indexés par id"""
+    ids = list({uid for uid in user_ids if uid})
+    if not ids:
+        return {}
+    batch = user_batch.get()
+    if batch is not None:
+        return await batch.load(ids, projection)
+    return await query_users(ids, projection)
+
+async def query_users(ids: List[str], projection: dict) -> dict:
+    keep_id = projection.get("id") == 1
+    users = await db.users.find({"id": {"$in": ids}}, {**projection, "_id": 0, "id": 1}).to_list(len(ids))
+    return {(u["id"] if keep_id else u.pop("id")): u for u in users}
+
+async def fetch_by_ids(collection, ids, projection: dict) -> dict:
+    """Charger en une seule requête $in des documents référencés, indexés par id"""
+    ids = list({i for i in ids if i})
+    if not ids:
+        return {}
+    docs = await collection.find({"id": {"$in": ids}}, {**projection, "_id": 0, "id": 1}).to_list(len(ids))
+    return {doc.pop("id"): doc for doc in docs}
+
+SENDER_FIELDS = ("first_name", "last_name", "avatar_url", "avatar_variants")
+
+def sender_snapshot(user: dict) -> dict:
+    """Copie compacte de l'expéditeur stockée sur chaque message"""
+    return {k: user.get(k) for k in SENDER_FIELDS}
+
+def sender_fields(user: dict) -> dict:
+    """Champs expéditeur d'un nouveau message : la copie et la version du profil copié"""
+    return {"sender": sender_snapshot(user), "sender_version": user.get("profile_version", 0)}
+
+async def attach_users(items: List[dict], projection: dict, fields=(("user_id", "user"),)) -> List[dict]:
+    """Enrichir une page de documents avec leurs utilisateurs (une requête quelle que soit la taille de la page)"""
+    users = await fetch_users((item.get(src) for item in items for src, _ in fields), projection)
+    for item in items:
+        for src, dest in fields:
+            item[dest] = users.get(item.get(src))
+    return items
+
+def encode_cursor(doc: dict, sort_field: str = "created_at") -> str:
+    raw = json.dumps([doc.get(sort_field), doc.get("id")])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+    # Le curseur vient du client : uniquement des scalaires, jamais d'opérateur Mongo ({"$gt": ...})
+    if not all(isinstance(v, (str, int, float)) and not isinstance(v, bool) for v in (value, last_id)):
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+    return value, last_id
+
+def keyset_filter(query: dict, cursor: str, sort_field: str = "created_at") -> dict:
+    """Restreindre la requête aux documents situés après le curseur dans l'ordre (sort_field, id) décroissant"""
+    value, last_id = decode_cursor(cursor)
+    after = {"$or": [{sort_field: {"$lt": value}}, {sort_field: value, "id": {"$lt": last_id}}]}
+    return {"$and": [query, after]} if query else after
+
+count_cache = TTLCache(maxsize=512, ttl=30)
+
+async def count_total(collection, query: dict, exact: bool = True) -> int:
+    """Total exact, ou approximatif (mis en cache 30 s) pour les pages suivantes d'un parcours par curseur"""
+    if exact:
+        return await collection.count_documents(query)
+    key = (collection.name, json.dumps(query, sort_keys=True, default=str))
+    total = count_cache.get(key)
+    if total is None:
+        total = await collection.count_documents(query)
+        count_cache.set(key, total)
+    return total
+
+async def paginate(collection, query: dict, projection: dict, page: int, limit: int,
+                   cursor: Optional[str] = None, include_total: bool = True, sort_field: str = "created_at") -> dict:
+    """Page triée par (sort_field, id) décroissant : par curseur (keyset) si fourni, sinon par numéro de page"""
+    find = collection.find(keyset_filter(query, cursor, sort_field) if cursor else query, projection)
+    find = find.sort([(sort_field, -1), ("id", -1)])
+    if not cursor:
+        find = find.skip((page - 1) * limit)
+    items = await find.limit(limit + 1).to_list(limit + 1)
+    has_more = len(items) > limit
+    items = items[:limit]
+    
+    result = {"items": items, "page": page, "next_cursor": encode_cursor(items[-1], sort_field) if has_more else None}
+    if include_total:
+        total = await count_total(collection, query, exact=cursor is None)
+        result.update({"total": total, "pages": (total + limit - 1) // limit})
+    else:
+        result.update({"total": None, "pages": None})
+    return result
+
+@app.middleware("http")
+async def count_db_queries(request: FastAPIRequest, call_next):
+    """Exposer le nombre de requêtes Mongo émises pour chaque réponse"""
+    counter = [0]
+    token = db_query_count.set(counter)
+    try:
+        response = await call_next(request)
+    finally:
+        db_query_count.reset(token)
+    response.headers["X-DB-Queries"] = str(counter[0])
+    return response
+
+# ==================== RATE LIMITING ====================
+# Compteurs partagés via Redis si plusieurs workers, sinon dans le worker
+rate_limit_store = RedisCounterStore(REDIS_URL) if REDIS_URL else MemoryCounterStore()
+
+@app.on_event("startup")
+async def check_rate_limit_store():
+    if isinstance(rate_limit_store, MemoryCounterStore) and WORKER_COUNT > 1:
+        logger.warning(
+            f"Rate limit counters are kept in memory with {WORKER_COUNT} workers: "
+            f"each limit is effectively multiplied by {WORKER_COUNT}, set REDIS_URL to share them"
+        )
+
+def _limiter(name: str, default: str) -> SlidingWindowLimiter:
+    limit, window = parse_rate(os.environ.get(f"RATE_LIMIT_{name.upper()}", default))
+    return SlidingWindowLimiter(name, limit, window, rate_limit_store)
+
+rate_limiters = {
+    "login_ip": _limiter("login_ip", "60/60"),              # toutes les tentatives
+    "login_email": _limiter("login_email", "5/300"),        # échecs uniquement (réservé puis rendu si succès)
+    "reset_ip": _limiter("reset_ip", "10/300"),
+    "reset_email": _limiter("reset_email", "3/900"),
+}
+
+async def enforce_rate_limits(checks: List[tuple]):
+    """Compter la tentative et refuser (429) dès qu'une des clés dépasse sa limite ;
+    à appeler avant toute requête base ou bcrypt."""
+    for name, key in checks:
+        retry_after = await rate_limiters[name].hit(key)
+        if retry_after is not None:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Trop de tentatives, réessayez dans {retry_after} secondes",
+                headers={"Retry-After": str(retry_after)}
+            )
+
+# ==================== STATS COUNTERS ====================
+# Compteurs du tableau de bord admin, tenus à jour par $inc dans les handlers
+# et recalculés périodiquement (les écarts dus à une écriture perdue ne durent pas)
+STATS_COUNTERS_ID = "global"
+STATS_COUNTER_QUERIES = {
+    "users": ("users", {}),
+    "requests": ("requests", {}),
+    "offers": ("offers", {}),
+    "contracts": ("contracts", {}),
+    "pending_verifications": ("pro_verifications", {"status": VerificationStatus.PENDING.value}),
+    "open_reports": ("reports", {"status": ReportStatus.OPEN.value}),
+}
+STATS_RECONCILE_SECONDS = int(os.environ.get("STATS_RECONCILE_SECONDS", "3600"))
+
+async def bump_stats(**deltas: int):
+    """Appliquer des incréments aux compteurs ; un échec est rattrapé par la réconciliation"""
+    try:
+        await db.stats_counters.update_one({"id": STATS_COUNTERS_ID}, {"$inc": deltas}, upsert=True)
+    except PyMongoError as e:
+        logger.error(f"Failed to update stats counters {deltas}: {str(e)}")
+
+async def reconcile_stats_counters() -> dict:
+    """Recompter chaque compteur depuis les collections et réécrire le document"""
+    names = list(STATS_COUNTER_QUERIES)
+    counts = await asyncio.gather(*(
+        db[collection_name].count_documents(query) for collection_name, query in STATS_COUNTER_QUERIES.values()
+    ))
+    values = dict(zip(names, counts))
+    previous = await db.stats_counters.find_one_and_update(
+        {"id": STATS_COUNTERS_ID},
+        {"$set": {**values, "reconciled_at": now_utc()}},
+        projection={name: 1 for name in names},
+        upsert=True
+    ) or {}
+    drift = {name: values[name] - previous.get(name, 0) for name in names if previous.get(name, 0) != values[name]}
+    if drift and previous:
+        logger.warning(f"Stats counters drift corrected: {drift}")
+    return {"counters": values, "drift": drift}
+
+async def reconcile_stats_counters_periodically():
+    while True:
+        try:
+            await reconcile_stats_counters()
+        except PyMongoError as e:
+            logger.error(f"Failed to reconcile stats counters: {str(e)}")
+        await asyncio.sleep(STATS_RECONCILE_SECONDS)
+
+@app.on_event("startup")
+async def start_stats_reconciler():
+    app.state.stats_reconciler_task = asyncio.create_task(reconcile_stats_counters_periodically())
+
 # ==================== AUTH ROUTES ====================
 @api_router.post("/auth/register", response_model=TokenResponse)
 async def register(data: UserCreate):
@@ -461,7 +1184,7 @@ async def register(data: UserCreate):
     user = {
         "id": user_id,
         "email": data.email,
-        "password_hash": hash_password(data.password),
+        "password_hash": await hash_password(data.password),
         "role": data.role,
         "status": UserStatus.ACTIVE.value,
         "phone_verified": False,
@@ -488,9 +1211,11 @@ async def register(data: UserCreate):
             "created_at": now_utc()
         }
         await db.pro_verifications.insert_one(verification)
+        await bump_stats(users=1, pending_verifications=1)
+    else:
+        await bump_stats(users=1)
     
-    access_token = create_token({"sub": user_id, "role": data.role}, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    refresh_token = create_token({"sub": user_id, "type": "refresh"}, timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+    access_token, refresh_token = await issue_session(user)
     
     user_response = serialize_doc(user)
     del user_response["password_hash"]
@@ -498,16 +1223,20 @@ async def register(data: UserCreate):
     return TokenResponse(access_token=access_token, refresh_token=refresh_token, user=user_response)
 
 @api_router.post("/auth/login", response_model=TokenResponse)
-async def login(data: UserLogin):
+async def login(data: UserLogin, request: FastAPIRequest):
+    email_key = data.email.strip().lower()
+    # La tentative est comptée avant la vérification (sinon une rafale parallèle passe
+    # entière sous la limite) puis rendue si le mot de passe est bon
+    await enforce_rate_limits([("login_ip", get_client_ip(request)), ("login_email", email_key)])
     user = await db.users.find_one({"email": data.email})
-    if not user or not verify_password(data.password, user.get("password_hash", "")):
+    if not user or not await verify_password(data.password, user.get("password_hash", "")):
         raise HTTPException(status_code=401, detail="Email ou mot de passe incorrect")
+    await rate_limiters["login_email"].refund(email_key)
     
     if user.get("status") == UserStatus.SUSPENDED.value:
         raise HTTPException(status_code=403, detail="Compte suspendu")
     
-    access_token = create_token({"sub": user["id"], "role": user["role"]}, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    refresh_token = create_token({"sub": user["id"], "type": "refresh"}, timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+    access_token, refresh_token = await issue_session(user)
     
     user_response = serialize_doc(user)
     del user_response["password_hash"]
@@ -520,19 +1249,61 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Depends(secu
     if payload.get("type") != "refresh":
         raise HTTPException(status_code=400, detail="Token de rafraîchissement invalide")
     
-    user = await db.users.find_one({"id": payload.get("sub")}, {"_id": 0})
+    user = await load_user(payload.get("sub"))
     if not user:
         raise HTTPException(status_code=401, detail="Utilisateur non trouvé")
+    check_token_version(payload, user)
+    if user.get("status") == UserStatus.SUSPENDED.value:
+        raise HTTPException(status_code=403, detail="Compte suspendu")
     
-    access_token = create_token({"sub": user["id"], "role": user["role"]}, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    return {"access_token": access_token, "token_type": "bearer"}
+    family_id = payload.get("fam")
+    if payload.get("jti"):
+        if await is_family_revoked(family_id):
+            raise HTTPException(status_code=401, detail="Token révoqué")
+        # Rotation : chaque refresh token ne sert qu'une fois
+        consumed = await db.refresh_tokens.find_one_and_update(
+            {"jti": payload["jti"], "used_at": None},
+            {"$set": {"used_at": now_utc()}}
+        )
+        if not consumed:
+            # Token déjà utilisé (ou inconnu) : probablement volé, toute la session est révoquée
+            await revoke_token_family(family_id, user["id"], "reuse")
+            logger.warning(f"Refresh token reuse detected for user {user['id']}, family {family_id} revoked")
+            raise HTTPException(status_code=401, detail="Token révoqué")
+    else:
+        # Refresh token émis avant la rotation (sans jti) : accepté une seule fois, pour ouvrir une famille
+        try:
+            await db.used_legacy_refresh_tokens.insert_one({
+                "token_hash": hashlib.sha256(credentials.credentials.encode()).hexdigest(),
+                "user_id": user["id"],
+                "used_at": now_utc(),
+                "expires_at": datetime.fromtimestamp(payload["exp"], timezone.utc)
+            })
+        except DuplicateKeyError:
+            logger.warning(f"Legacy refresh token reuse for user {user['id']}")
+            raise HTTPException(status_code=401, detail="Token révoqué")
+    refresh, family_id = await issue_refresh_token(user, family_id if payload.get("jti") else None)
+    return {"access_token": issue_access_token(user, family_id), "refresh_token": refresh, "token_type": "bearer"}
 
 @api_router.post("/auth/logout")
-async def logout(user: dict = Depends(get_current_user)):
+async def logout(
+    user: dict = Depends(get_current_user),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    family_id = decode_token(credentials.credentials).get("fam")
+    if family_id:
+        await revoke_token_family(family_id, user["id"], "logout")
+    else:
+        # Token émis avant les familles : seule la version permet de l'invalider
+        await revoke_user_tokens(user["id"])
     return {"message": "Déconnexion réussie"}
 
 @api_router.post("/auth/request-password-reset")
-async def request_password_reset(data: PasswordResetRequest):
+async def request_password_reset(data: PasswordResetRequest, request: FastAPIRequest):
+    await enforce_rate_limits([
+        ("reset_ip", get_client_ip(request)),
+        ("reset_email", data.email.strip().lower())
+    ])
     user = await db.users.find_one({"email": data.email})
     if user:
         reset_token = create_token({"sub": user["id"], "type": "password_reset"}, timedelta(hours=1))
@@ -547,14 +1318,16 @@ async def reset_password(data: PasswordReset):
     
     await db.users.update_one(
         {"id": payload.get("sub")},
-        {"$set": {"password_hash": hash_password(data.new_password)}}
+        {"$set": {"password_hash": await hash_password(data.new_password)}}
     )
+    await revoke_user_tokens(payload.get("sub"))
     return {"message": "Mot de passe réinitialisé avec succès"}
 
 @api_router.post("/auth/verify-phone")
 async def verify_phone(data: PhoneVerify, user: dict = Depends(get_current_user)):
     if data.code == "123456":
         await db.users.update_one({"id": user["id"]}, {"$set": {"phone_verified": True}})
+        await invalidate_user(user["id"])
         return {"message": "Téléphone vérifié"}
     raise HTTPException(status_code=400, detail="Code invalide")
 
@@ -566,9 +1339,18 @@ async def get_me(user: dict = Depends(get_current_user)):
 @api_router.patch("/users/me")
 async def update_me(data: UserUpdate, user: dict = Depends(get_current_user)):
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
-    if update_data:
-        await db.users.update_one({"id": user["id"]}, {"$set": update_data})
-    updated = await db.users.find_one({"id": user["id"]}, {"_id": 0, "password_hash": 0})
+    if not update_data:
+        return await db.users.find_one({"id": user["id"]}, {"_id": 0, "password_hash": 0})
+    update = {"$set": update_data}
+    if any(k in update_data for k in SENDER_FIELDS):
+        update["$inc"] = {"profile_version": 1}
+    updated = await db.users.find_one_and_update(
+        {"id": user["id"]}, update,
+        projection={"_id": 0, "password_hash": 0}, return_document=ReturnDocument.AFTER
+    )
+    await invalidate_user(user["id"])
+    if "$inc" in update:
+        run_in_background(refresh_sender_snapshots(updated), f"sender-snapshots:{user['id']}")
     return updated
 
 @api_router.get("/users/{user_id}")
@@ -583,17 +1365,38 @@ async def get_user_public(user_id: str):
 
 @api_router.post("/users/me/avatar")
 async def upload_avatar(file: UploadFile = File(...), user: dict = Depends(get_current_user)):
-    ext = file.filename.split(".")[-1] if file.filename else "jpg"
-    filename = f"{user['id']}_avatar.{ext}"
-    filepath = UPLOAD_DIR / filename
-    
-    with open(filepath, "wb") as f:
-        shutil.copyfileobj(file.file, f)
-    
-    avatar_url = f"/uploads/{filename}"
-    await db.users.update_one({"id": user["id"]}, {"$set": {"avatar_url": avatar_url}})
+    avatar_url = await save_image_upload(file, "avatar")
+    updated = await db.users.find_one_and_update(
+        {"id": user["id"]},
+        {"$set": {"avatar_url": avatar_url}, "$unset": {"avatar_variants": ""}, "$inc": {"profile_version": 1}},
+        projection={"_id": 0, "password_hash": 0}, return_document=ReturnDocument.AFTER
+    )
+    await release_uploads(user.get("avatar_url"), *upload_urls(user.get("avatar_variants")))
+    await invalidate_user(user["id"])
+    run_in_background(refresh_sender_snapshots(updated), f"sender-snapshots:{user['id']}")
+    run_in_background(process_avatar_variants(user["id"], avatar_url), f"avatar-variants:{user['id']}")
     return {"avatar_url": avatar_url}
 
+async def refresh_sender_snapshots(user: dict):
+    """Propager un changement de profil sur les messages déjà envoyés (tâche de fond)
+
+    Deux modifications rapprochées lancent deux tâches qui peuvent se terminer
+    dans le désordre : un message n'est réécrit que si sa copie n'est pas plus
+    récente que la version du profil propagée.
+    """
+    user_id = user["id"]
+    fields = sender_fields(user)
+    try:
+        result = await db.messages.update_many(
+            {"sender_id": user_id, "sender_version": {"$not": {"$gt": fields["sender_version"]}}},
+            {"$set": fields}
+        )
+        # Les pages de messages déjà en cache chez les clients portent l'ancien profil : changer leur ETag
+        await db.conversations.update_many({"participants": user_id}, {"$inc": {"snapshot_version": 1}})
+        logger.info(f"Sender snapshot refreshed on {result.modified_count} messages for user {user_id}")
+    except PyMongoError as e:
+        logger.error(f"Failed to refresh sender snapshots for user {user_id}: {str(e)}")
+
 @api_router.get("/users/{user_id}/reviews")
 async def get_user_reviews(user_id: str):
     reviews = await db.reviews.find({"reviewee_id": user_id}, {"_id": 0}).to_list(100)
@@ -622,6 +1425,7 @@ async def create_verification(data: ProVerificationCreate, user: dict = Depends(
             "created_at": now_utc()
         }
         await db.pro_verifications.insert_one(verification)
+        await bump_stats(pending_verifications=1)
     
     return {"message": "Vérification soumise"}
 
@@ -630,14 +1434,7 @@ async def upload_verification_doc(file: UploadFile = File(...), user: dict = Dep
     if user["role"] != "CARRIER_PRO":
         raise HTTPException(status_code=403, detail="Réservé aux transporteurs pro")
     
-    ext = file.filename.split(".")[-1] if file.filename else "pdf"
-    filename = f"{user['id']}_doc_{uuid.uuid4()}.{ext}"
-    filepath = UPLOAD_DIR / filename
-    
-    with open(filepath, "wb") as f:
-        shutil.copyfileobj(file.file, f)
-    
-    doc_url = f"/uploads/{filename}"
+    doc_url = await save_upload(file, "document")
     await db.pro_verifications.update_one(
         {"user_id": user["id"]},
         {"$push": {"documents": doc_url}}
@@ -645,7 +1442,7 @@ async def upload_verification_doc(file: UploadFile = File(...), user: dict = Dep
     return {"document_url": doc_url}
 
 @api_router.get("/users/me/verification")
-async def get_my_verification(user: dict = Depends(get_current_user)):
+async def get_my_verification(user: dict = Depends(get_current_principal)):
     if user["role"] != "CARRIER_PRO":
         raise HTTPException(status_code=403, detail="Réservé aux transporteurs pro")
     
@@ -705,7 +1502,7 @@ async def submit_carrier_verification(data: CarrierVerificationCreate, user: dic
     # Envoyer notification à l'admin
     user_name = f"{data.identity_first_name} {data.identity_last_name}"
     doc_type_label = doc_type_labels.get(data.identity_doc_type.value, data.identity_doc_type.value)
-    asyncio.create_task(send_admin_verification_alert(user_name, user.get("email", ""), doc_type_label))
+    run_in_background(send_admin_verification_alert(user_name, user.get("email", ""), doc_type_label), "admin-verification-alert")
     
     return serialize_doc(verification)
 
@@ -728,17 +1525,12 @@ async def upload_identity_document(
     if ext not in allowed_extensions:
         raise HTTPException(status_code=400, detail="Format accepté: JPG, PNG, PDF")
     
-    filename = f"identity_{user['id']}_{uuid.uuid4()}.{ext}"
-    filepath = UPLOAD_DIR / filename
-    
-    with open(filepath, "wb") as f:
-        shutil.copyfileobj(file.file, f)
-    
-    doc_url = f"/uploads/{filename}"
+    doc_url = await save_upload(file, "document")
     await db.carrier_verifications.update_one(
         {"user_id": user["id"]},
         {"$set": {"identity_doc_url": doc_url, "updated_at": now_utc()}}
     )
+    await release_uploads(verification.get("identity_doc_url"))
     
     return {"identity_doc_url": doc_url, "message": "Pièce d'identité uploadée"}
 
@@ -776,13 +1568,7 @@ async def upload_address_proof(
     if ext not in allowed_extensions:
         raise HTTPException(status_code=400, detail="Format accepté: JPG, PNG, PDF")
     
-    filename = f"address_{user['id']}_{uuid.uuid4()}.{ext}"
-    filepath = UPLOAD_DIR / filename
-    
-    with open(filepath, "wb") as f:
-        shutil.copyfileobj(file.file, f)
-    
-    doc_url = f"/uploads/{filename}"
+    doc_url = await save_upload(file, "document")
     await db.carrier_verifications.update_one(
         {"user_id": user["id"]},
         {"$set": {
@@ -791,11 +1577,12 @@ async def upload_address_proof(
             "updated_at": now_utc()
         }}
     )
+    await release_uploads(verification.get("address_proof_url"))
     
     return {"address_proof_url": doc_url, "message": "Justificatif de domicile uploadé"}
 
 @api_router.get("/carriers/verification/status")
-async def get_carrier_verification_status(user: dict = Depends(get_current_user)):
+async def get_carrier_verification_status(user: dict = Depends(get_current_principal)):
     """Obtenir le statut de vérification du transporteur"""
     if user["role"] not in ["CARRIER_INDIVIDUAL", "CARRIER_PRO", "SHIPPER_CARRIER"]:
         raise HTTPException(status_code=403, detail="Réservé aux transporteurs")
@@ -817,7 +1604,7 @@ async def get_carrier_verification_status(user: dict = Depends(get_current_user)
 # ==================== ADMIN CARRIER VERIFICATION ====================
 @api_router.get("/admin/carrier-verifications")
 async def admin_list_carrier_verifications(
-    user: dict = Depends(get_current_user),
+    user: dict = Depends(get_current_principal),
     status: Optional[str] = None,
     page: int = 1,
     limit: int = 20
@@ -834,12 +1621,9 @@ async def admin_list_carrier_verifications(
     total = await db.carrier_verifications.count_documents(query)
     
     # Enrichir avec les données utilisateur
+    await attach_users(verifications, {"first_name": 1, "last_name": 1, "email": 1, "phone": 1, "role": 1, "created_at": 1})
     for v in verifications:
-        carrier = await db.users.find_one(
-            {"id": v["user_id"]},
-            {"_id": 0, "first_name": 1, "last_name": 1, "email": 1, "phone": 1, "role": 1, "created_at": 1}
-        )
-        v["user"] = carrier
+        carrier = v["user"]
         
         # Vérifier la correspondance des noms
         if carrier:
@@ -865,7 +1649,7 @@ async def admin_list_carrier_verifications(
     return {"items": verifications, "total": total, "page": page, "pages": (total + limit - 1) // limit}
 
 @api_router.get("/admin/carrier-verifications/{verification_id}")
-async def admin_get_carrier_verification(verification_id: str, user: dict = Depends(get_current_user)):
+async def admin_get_carrier_verification(verification_id: str, user: dict = Depends(get_current_principal)):
     """Détails d'une demande de vérification"""
     await require_role(user, ["ADMIN"])
     
@@ -919,12 +1703,13 @@ async def admin_approve_carrier_verification(verification_id: str, user: dict =
         {"id": verification["user_id"]},
         {"$set": {"identity_verified": True, "identity_verified_at": now_utc()}}
     )
+    await invalidate_user(verification["user_id"])
     
     # Récupérer les infos de l'utilisateur pour l'email
     carrier = await db.users.find_one({"id": verification["user_id"]}, {"_id": 0})
     if carrier:
         user_name = f"{carrier.get('first_name', '')} {carrier.get('last_name', '')}"
-        asyncio.create_task(send_verification_approved_email(carrier.get("email", ""), user_name))
+        run_in_background(send_verification_approved_email(carrier.get("email", ""), user_name), "verification-approved-email")
     
     # Log d'audit
     await db.audit_logs.insert_one({
@@ -967,7 +1752,7 @@ async def admin_reject_carrier_verification(
     carrier = await db.users.find_one({"id": verification["user_id"]}, {"_id": 0})
     if carrier:
         user_name = f"{carrier.get('first_name', '')} {carrier.get('last_name', '')}"
-        asyncio.create_task(send_verification_rejected_email(carrier.get("email", ""), user_name, reason))
+        run_in_background(send_verification_rejected_email(carrier.get("email", ""), user_name, reason), "verification-rejected-email")
     
     # Log d'audit
     await db.audit_logs.insert_one({
@@ -1000,6 +1785,8 @@ async def create_request(data: RequestCreate, user: dict = Depends(get_current_u
         "created_at": now_utc()
     }
     await db.requests.insert_one(request_doc)
+    await bump_stats(requests=1)
+    await index_request(request_doc)
     return serialize_doc(request_doc)
 
 @api_router.get("/requests")
@@ -1011,7 +1798,9 @@ async def list_requests(
     max_weight: Optional[float] = None,
     status: Optional[RequestStatus] = None,
     page: int = Query(1, ge=1),
-    limit: int = Query(20, ge=1, le=100)
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = True
 ):
     query = {"hidden": {"$ne": True}}
     if origin_country:
@@ -1027,18 +1816,12 @@ async def list_requests(
     if status:
         query["status"] = status.value
     
-    skip = (page - 1) * limit
-    requests = await db.requests.find(query, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
-    total = await db.requests.count_documents(query)
-    
-    for req in requests:
-        user = await db.users.find_one({"id": req["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1, "rating_sum": 1, "rating_count": 1})
-        req["user"] = user
-    
-    return {"items": requests, "total": total, "page": page, "pages": (total + limit - 1) // limit}
+    result = await paginate(db.requests, query, {"_id": 0}, page, limit, cursor, include_total)
+    await attach_users(result["items"], {"first_name": 1, "last_name": 1, "avatar_url": 1, "avatar_variants": 1, "rating_sum": 1, "rating_count": 1})
+    return result
 
 @api_router.get("/requests/mine")
-async def list_my_requests(user: dict = Depends(get_current_user), page: int = 1, limit: int = 20):
+async def list_my_requests(user: dict = Depends(get_current_principal), page: int = 1, limit: int = 20):
     skip = (page - 1) * limit
     requests = await db.requests.find({"user_id": user["id"]}, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
     total = await db.requests.count_documents({"user_id": user["id"]})
@@ -1050,7 +1833,7 @@ async def get_request(request_id: str):
     if not req:
         raise HTTPException(status_code=404, detail="Demande non trouvée")
     
-    user = await db.users.find_one({"id": req["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1, "rating_sum": 1, "rating_count": 1, "city": 1, "country": 1})
+    user = await db.users.find_one({"id": req["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1, "avatar_variants": 1, "rating_sum": 1, "rating_count": 1, "city": 1, "country": 1})
     req["user"] = user
     return req
 
@@ -1073,7 +1856,9 @@ async def update_request(request_id: str, data: RequestUpdate, user: dict = Depe
     if update_data:
         await db.requests.update_one({"id": request_id}, {"$set": update_data})
     
-    return await db.requests.find_one({"id": request_id}, {"_id": 0})
+    updated = await db.requests.find_one({"id": request_id}, {"_id": 0})
+    await index_request(updated)
+    return updated
 
 @api_router.delete("/requests/{request_id}")
 async def delete_request(request_id: str, user: dict = Depends(get_current_user)):
@@ -1083,7 +1868,11 @@ async def delete_request(request_id: str, user: dict = Depends(get_current_user)
     if req["user_id"] != user["id"] and user["role"] != "ADMIN":
         raise HTTPException(status_code=403, detail="Non autorisé")
     
-    await db.requests.delete_one({"id": request_id})
+    result = await db.requests.delete_one({"id": request_id})
+    if result.deleted_count:
+        await bump_stats(requests=-1)
+    await unindex_request(request_id)
+    await release_uploads(*upload_urls(req.get("photos")), *upload_urls(req.get("photo_variants")))
     return {"message": "Demande supprimée"}
 
 @api_router.post("/requests/{request_id}/photos")
@@ -1094,15 +1883,9 @@ async def upload_request_photo(request_id: str, file: UploadFile = File(...), us
     if req["user_id"] != user["id"]:
         raise HTTPException(status_code=403, detail="Non autorisé")
     
-    ext = file.filename.split(".")[-1] if file.filename else "jpg"
-    filename = f"request_{request_id}_{uuid.uuid4()}.{ext}"
-    filepath = UPLOAD_DIR / filename
-    
-    with open(filepath, "wb") as f:
-        shutil.copyfileobj(file.file, f)
-    
-    photo_url = f"/uploads/{filename}"
+    photo_url = await save_image_upload(file, "photo")
     await db.requests.update_one({"id": request_id}, {"$push": {"photos": photo_url}})
+    run_in_background(process_photo_variants(request_id, photo_url), f"photo-variants:{request_id}")
     return {"photo_url": photo_url}
 
 # ==================== OFFERS ROUTES ====================
@@ -1131,6 +1914,8 @@ async def create_offer(data: OfferCreate, user: dict = Depends(get_current_user)
         "created_at": now_utc()
     }
     await db.offers.insert_one(offer_doc)
+    await bump_stats(offers=1)
+    await index_offer(offer_doc)
     return serialize_doc(offer_doc)
 
 @api_router.get("/offers")
@@ -1141,7 +1926,9 @@ async def list_offers(
     min_capacity: Optional[float] = None,
     status: Optional[OfferStatus] = None,
     page: int = Query(1, ge=1),
-    limit: int = Query(20, ge=1, le=100)
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = True
 ):
     query = {"hidden": {"$ne": True}, "status": OfferStatus.ACTIVE.value}
     if origin_country:
@@ -1155,18 +1942,12 @@ async def list_offers(
     if status:
         query["status"] = status.value
     
-    skip = (page - 1) * limit
-    offers = await db.offers.find(query, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
-    total = await db.offers.count_documents(query)
-    
-    for offer in offers:
-        user = await db.users.find_one({"id": offer["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1, "rating_sum": 1, "rating_count": 1, "role": 1})
-        offer["user"] = user
-    
-    return {"items": offers, "total": total, "page": page, "pages": (total + limit - 1) // limit}
+    result = await paginate(db.offers, query, {"_id": 0}, page, limit, cursor, include_total)
+    await attach_users(result["items"], {"first_name": 1, "last_name": 1, "avatar_url": 1, "avatar_variants": 1, "rating_sum": 1, "rating_count": 1, "role": 1})
+    return result
 
 @api_router.get("/offers/mine")
-async def list_my_offers(user: dict = Depends(get_current_user), page: int = 1, limit: int = 20):
+async def list_my_offers(user: dict = Depends(get_current_principal), page: int = 1, limit: int = 20):
     skip = (page - 1) * limit
     offers = await db.offers.find({"user_id": user["id"]}, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
     total = await db.offers.count_documents({"user_id": user["id"]})
@@ -1178,7 +1959,7 @@ async def get_offer(offer_id: str):
     if not offer:
         raise HTTPException(status_code=404, detail="Offre non trouvée")
     
-    user = await db.users.find_one({"id": offer["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1, "rating_sum": 1, "rating_count": 1, "city": 1, "country": 1, "role": 1})
+    user = await db.users.find_one({"id": offer["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1, "avatar_variants": 1, "rating_sum": 1, "rating_count": 1, "city": 1, "country": 1, "role": 1})
     offer["user"] = user
     return offer
 
@@ -1203,7 +1984,9 @@ async def update_offer(offer_id: str, data: OfferUpdate, user: dict = Depends(ge
     if update_data:
         await db.offers.update_one({"id": offer_id}, {"$set": update_data})
     
-    return await db.offers.find_one({"id": offer_id}, {"_id": 0})
+    updated = await db.offers.find_one({"id": offer_id}, {"_id": 0})
+    await index_offer(updated)
+    return updated
 
 @api_router.delete("/offers/{offer_id}")
 async def delete_offer(offer_id: str, user: dict = Depends(get_current_user)):
@@ -1213,9 +1996,98 @@ async def delete_offer(offer_id: str, user: dict = Depends(get_current_user)):
     if offer["user_id"] != user["id"] and user["role"] != "ADMIN":
         raise HTTPException(status_code=403, detail="Non autorisé")
     
-    await db.offers.delete_one({"id": offer_id})
+    result = await db.offers.delete_one({"id": offer_id})
+    if result.deleted_count:
+        await bump_stats(offers=-1)
+    await unindex_offer(offer_id)
     return {"message": "Offre supprimée"}
 
+# ==================== MATCHING ENGINE ====================
+MATCHING_INDEX_REFRESH_SECONDS = int(os.environ.get("MATCHING_INDEX_REFRESH_SECONDS", "300"))
+MATCHING_FALLBACK_LIMIT = 1000
+MATCHING_CHANNEL = "matching:changes"
+matching_index = CorridorIndex()
+settings_cache = TTLCache(maxsize=8, ttl=60)
+
+async def get_matching_weights() -> dict:
+    """Profil de pondération du score de matching (paramètres plateforme, mis en cache 60 s)"""
+    weights = settings_cache.get("matching_weights")
+    if weights is None:
+        settings = await db.platform_settings.find_one({"key": "main"}, {"_id": 0, "matching_weights": 1})
+        weights = {**DEFAULT_MATCHING_WEIGHTS, **((settings or {}).get("matching_weights") or {})}
+        settings_cache.set("matching_weights", weights)
+    return weights
+
+async def load_matching_index():
+    """Charger en mémoire les offres actives et demandes ouvertes, par corridor"""
+    # Les modifications appliquées pendant les deux lectures sont rejouées sur l'instantané
+    matching_index.begin_load()
+    try:
+        offers = await db.offers.find({"status": OfferStatus.ACTIVE.value, "hidden": {"$ne": True}}, {"_id": 0}).to_list(None)
+        requests = await db.requests.find({"status": RequestStatus.OPEN.value, "hidden": {"$ne": True}}, {"_id": 0}).to_list(None)
+    except BaseException:
+        matching_index.cancel_load()
+        raise
+    matching_index.load(offers, requests)
+    logger.info(f"Matching index loaded: {len(offers)} offers, {len(requests)} requests")
+
+async def index_offer(offer: dict):
+    matching_index.upsert_offer(offer)
+    await publish_matching_change("offer", offer["id"])
+
+async def unindex_offer(offer_id: str):
+    matching_index.remove_offer(offer_id)
+    await publish_matching_change("offer", offer_id)
+
+async def index_request(req: dict):
+    matching_index.upsert_request(req)
+    await publish_matching_change("request", req["id"])
+
+async def unindex_request(request_id: str):
+    matching_index.remove_request(request_id)
+    await publish_matching_change("request", request_id)
+
+async def publish_matching_change(kind: str, doc_id: str):
+    """Signaler aux autres workers qu'une offre ou demande a changé (ils la relisent en base)"""
+    await hub.publish(MATCHING_CHANNEL, {"origin": WORKER_ID, "kind": kind, "id": doc_id})
+
+async def apply_matching_change(event: dict):
+    collection = db.offers if event["kind"] == "offer" else db.requests
+    doc = await collection.find_one({"id": event["id"]}, {"_id": 0})
+    if event["kind"] == "offer":
+        if doc:
+            matching_index.upsert_offer(doc)
+        else:
+            matching_index.remove_offer(event["id"])
+    elif doc:
+        matching_index.upsert_request(doc)
+    else:
+        matching_index.remove_request(event["id"])
+
+async def consume_matching_events(queue: asyncio.Queue):
+    """Appliquer à l'index local les modifications publiées par les autres workers"""
+    while True:
+        _, event = await queue.get()
+        if event.get("origin") == WORKER_ID:
+            continue
+        try:
+            await apply_matching_change(event)
+        except Exception as e:
+            logger.error(f"Matching index update failed for {event.get('kind')} {event.get('id')}: {str(e)}")
+
+async def refresh_matching_index():
+    # Rechargement périodique : filet de sécurité si un événement du hub a été perdu
+    while True:
+        try:
+            await load_matching_index()
+        except Exception as e:
+            logger.error(f"Matching index refresh failed: {str(e)}")
+        await asyncio.sleep(MATCHING_INDEX_REFRESH_SECONDS)
+
+@app.on_event("startup")
+async def start_matching_index():
+    app.state.matching_index_task = asyncio.create_task(refresh_matching_index())
+
 # ==================== MATCHING ROUTES ====================
 @api_router.get("/matching/requests/{request_id}/offers")
 async def get_matching_offers(request_id: str, page: int = 1, limit: int = 20):
@@ -1223,22 +2095,37 @@ async def get_matching_offers(request_id: str, page: int = 1, limit: int = 20):
     if not req:
         raise HTTPException(status_code=404, detail="Demande non trouvée")
     
-    query = {
-        "status": OfferStatus.ACTIVE.value,
-        "hidden": {"$ne": True},
-        "origin_country": req["origin_country"],
-        "destination_country": req["destination_country"],
-        "mode": req["mode"],
-        "capacity_kg": {"$gte": req["weight"]}
-    }
+    if matching_index.ready:
+        # Filtrage et score sur les colonnes de l'index : seule la page est copiée
+        candidates = matching_index.match_offer_columns(req)
+        documents = None
+    else:
+        query = {
+            "status": OfferStatus.ACTIVE.value,
+            "hidden": {"$ne": True},
+            "origin_country": req["origin_country"],
+            "destination_country": req["destination_country"],
+            "mode": req["mode"],
+            "capacity_kg": {"$gte": req["weight"]}
+        }
+        found = await db.offers.find(query, {"_id": 0}).sort([("capacity_kg", 1), ("departure_date", 1)]).to_list(MATCHING_FALLBACK_LIMIT)
+        found = [o for o in found if dates_compatible(o, req)]
+        candidates = OfferColumns.from_offers(found)
+        documents = {o["id"]: o for o in found}
     
+    # Les transporteurs de tous les candidats servent au score (note) puis à l'enrichissement de la page
+    carriers = await fetch_users(candidates.user_ids(), {"first_name": 1, "last_name": 1, "avatar_url": 1, "avatar_variants": 1, "rating_sum": 1, "rating_count": 1, "role": 1})
     skip = (page - 1) * limit
-    offers = await db.offers.find(query, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
-    total = await db.offers.count_documents(query)
+    # Seules les offres jusqu'à la fin de la page demandée sont triées
+    ranked_ids, scores = rank_offer_columns(req, candidates, carriers, await get_matching_weights(), limit=skip + limit)
     
-    for offer in offers:
-        user = await db.users.find_one({"id": offer["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1, "rating_sum": 1, "rating_count": 1, "role": 1})
-        offer["user"] = user
+    total = len(candidates)
+    offers = []
+    for offer_id, score in zip(ranked_ids[skip:], scores[skip:]):
+        offer = documents[offer_id] if documents is not None else matching_index.get_offer(offer_id)
+        offer["match_score"] = round(float(score), 4)
+        offer["user"] = carriers.get(offer["user_id"])
+        offers.append(offer)
     
     return {"items": offers, "total": total, "page": page, "request": req}
 
@@ -1248,25 +2135,204 @@ async def get_matching_requests(offer_id: str, page: int = 1, limit: int = 20):
     if not offer:
         raise HTTPException(status_code=404, detail="Offre non trouvée")
     
-    query = {
-        "status": RequestStatus.OPEN.value,
-        "hidden": {"$ne": True},
-        "origin_country": offer["origin_country"],
-        "destination_country": offer["destination_country"],
-        "mode": offer["mode"],
-        "weight": {"$lte": offer["capacity_kg"]}
-    }
+    if matching_index.ready:
+        candidates = matching_index.match_requests(offer)
+    else:
+        query = {
+            "status": RequestStatus.OPEN.value,
+            "hidden": {"$ne": True},
+            "origin_country": offer["origin_country"],
+            "destination_country": offer["destination_country"],
+            "mode": offer["mode"],
+            "weight": {"$lte": offer["capacity_kg"]}
+        }
+        candidates = await db.requests.find(query, {"_id": 0}).sort([("weight", 1), ("deadline", 1)]).to_list(MATCHING_FALLBACK_LIMIT)
+        candidates = [r for r in candidates if dates_compatible(offer, r)]
     
+    total = len(candidates)
     skip = (page - 1) * limit
-    requests = await db.requests.find(query, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
-    total = await db.requests.count_documents(query)
+    requests = candidates[skip:skip + limit]
     
-    for req in requests:
-        user = await db.users.find_one({"id": req["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1, "rating_sum": 1, "rating_count": 1})
-        req["user"] = user
+    await attach_users(requests, {"first_name": 1, "last_name": 1, "avatar_url": 1, "avatar_variants": 1, "rating_sum": 1, "rating_count": 1})
     
     return {"items": requests, "total": total, "page": page, "offer": offer}
 
+# ==================== REAL-TIME MESSAGING ====================
+hub = RedisPubSubHub(REDIS_URL) if REDIS_URL else PubSubHub()
+WS_OUTBOX_SIZE = 256
+
+@app.on_event("startup")
+async def start_hub():
+    if not REDIS_URL and WORKER_COUNT > 1:
+        logger.warning(
+            f"REDIS_URL is not set with {WORKER_COUNT} workers: WebSocket events, cache invalidations "
+            "and matching index updates stay inside each worker (clients fall back to polling)"
+        )
+    await hub.start()
+    # Invalidations du cache utilisateur publiées par les autres workers
+    auth_events = asyncio.Queue()
+    await hub.subscribe(USER_INVALIDATION_CHANNEL, auth_events)
+    await hub.subscribe(TOKEN_VERSION_CHANNEL, auth_events)
+    await hub.subscribe(TOKEN_REVOKED_CHANNEL, auth_events)
+    app.state.auth_events_task = asyncio.create_task(consume_auth_events(auth_events))
+    matching_events = asyncio.Queue()
+    await hub.subscribe(MATCHING_CHANNEL, matching_events)
+    app.state.matching_events_task = asyncio.create_task(consume_matching_events(matching_events))
+
+async def consume_auth_events(queue: asyncio.Queue):
+    """Appliquer les invalidations de cache et les révocations de tokens publiées par les autres workers"""
+    while True:
+        channel, event = await queue.get()
+        if channel == TOKEN_REVOKED_CHANNEL:
+            remember_revoked_family(event["family_id"])
+            await revalidate_websockets(family_id=event["family_id"])
+            continue
+        if channel == TOKEN_VERSION_CHANNEL:
+            user_id = event.get("user_id")
+            token_versions[user_id] = max(token_versions.get(user_id, 0), event.get("version", 0))
+        user_cache.pop(event.get("user_id"))
+        # Suspension, changement de mot de passe... : les flux ouverts sont réautorisés
+        await revalidate_websockets(user_id=event.get("user_id"))
+
+@app.on_event("shutdown")
+async def stop_hub():
+    await hub.stop()
+
+def conversation_channel(conversation_id: str) -> str:
+    return f"conversation:{conversation_id}"
+
+async def publish_message(message: dict):
+    """Pousser un nouveau message aux connexions WebSocket abonnées à la conversation"""
+    await hub.publish(conversation_channel(message["conversation_id"]), {
+        "type": "message",
+        "conversation_id": message["conversation_id"],
+        "message": message
+    })
+
+async def authorize_websocket(payload: dict) -> Optional[dict]:
+    """Utilisateur du token s'il a toujours le droit de recevoir des événements, sinon None"""
+    if payload.get("type"):
+        return None
+    user = await load_user(payload.get("sub"))
+    if not user or user.get("status") == UserStatus.SUSPENDED.value:
+        return None
+    try:
+        check_token_version(payload, user)
+    except HTTPException:
+        return None
+    if await is_family_revoked(payload.get("fam")):
+        return None
+    return user
+
+class WebSocketSession:
+    """Connexion WebSocket ouverte : file d'envoi bornée et fermeture demandée par d'autres tâches"""
+
+    def __init__(self, websocket: WebSocket, payload: dict):
+        self.websocket = websocket
+        self.payload = payload
+        self.outbox = asyncio.Queue(maxsize=WS_OUTBOX_SIZE)
+        self.subscriptions = set()
+        self.close_code: Optional[int] = None
+        self.closed = asyncio.Event()
+
+    def send(self, event: dict):
+        try:
+            self.outbox.put_nowait((None, event))
+        except asyncio.QueueFull:
+            # Client qui ne lit plus : fermer proprement plutôt que d'accumuler
+            self.close(WS_CLOSE_TRY_AGAIN_LATER)
+
+    def close(self, code: int):
+        if self.close_code is None:
+            self.close_code = code
+            self.closed.set()
+
+# Connexions ouvertes dans ce worker, par utilisateur (session -> token)
+websocket_sessions: Dict[str, set] = {}
+WS_CLOSE_UNAUTHORIZED = 4401
+WS_CLOSE_TRY_AGAIN_LATER = 1013
+
+async def revalidate_websockets(user_id: Optional[str] = None, family_id: Optional[str] = None):
+    """Fermer les connexions de ce worker dont le token n'autorise plus la réception"""
+    for owner, sessions in list(websocket_sessions.items()):
+        if user_id is not None and owner != user_id:
+            continue
+        for session in list(sessions):
+            if family_id is not None and session.payload.get("fam") != family_id:
+                continue
+            if session.close_code is None and await authorize_websocket(session.payload) is None:
+                session.close(WS_CLOSE_UNAUTHORIZED)
+
+async def _pump_outbox(session: WebSocketSession):
+    while True:
+        _, event = await session.outbox.get()
+        await session.websocket.send_json(event)
+
+async def _receive_actions(session: WebSocketSession, user: dict):
+    while True:
+        try:
+            data = await session.websocket.receive_json()
+        except ValueError:
+            session.send({"type": "error", "detail": "JSON invalide"})
+            continue
+        action = data.get("type") if isinstance(data, dict) else None
+        conversation_id = data.get("conversation_id") if isinstance(data, dict) else None
+        
+        if action == "subscribe" and conversation_id:
+            conv = await db.conversations.find_one({"id": conversation_id}, {"_id": 0, "participants": 1})
+            if not conv or user["id"] not in conv["participants"]:
+                session.send({"type": "error", "conversation_id": conversation_id, "detail": "Non autorisé"})
+                continue
+            await hub.subscribe(conversation_channel(conversation_id), session.outbox)
+            session.subscriptions.add(conversation_id)
+            session.send({"type": "subscribed", "conversation_id": conversation_id})
+        elif action == "unsubscribe" and conversation_id:
+            await hub.unsubscribe(conversation_channel(conversation_id), session.outbox)
+            session.subscriptions.discard(conversation_id)
+        elif action == "ping":
+            session.send({"type": "pong"})
+        else:
+            session.send({"type": "error", "detail": "Action inconnue"})
+
+@api_router.websocket("/ws/conversations")
+async def conversations_websocket(websocket: WebSocket, token: Optional[str] = None):
+    """Flux temps réel des conversations : {"type": "subscribe"|"unsubscribe", "conversation_id": ...}"""
+    try:
+        payload = decode_token(token) if token else None
+    except HTTPException:
+        payload = None
+    user = await authorize_websocket(payload) if payload else None
+    if not user:
+        await websocket.close(code=WS_CLOSE_UNAUTHORIZED)
+        return
+    await websocket.accept()
+    
+    session = WebSocketSession(websocket, payload)
+    websocket_sessions.setdefault(user["id"], set()).add(session)
+    tasks = [
+        asyncio.create_task(_receive_actions(session, user)),
+        asyncio.create_task(_pump_outbox(session)),
+        asyncio.create_task(session.closed.wait()),
+    ]
+    try:
+        # Déconnexion du client, échec d'envoi, ou fermeture demandée (révocation, file pleine)
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for conversation_id in session.subscriptions:
+            await hub.unsubscribe(conversation_channel(conversation_id), session.outbox)
+        sessions = websocket_sessions.get(user["id"], set())
+        sessions.discard(session)
+        if not sessions:
+            websocket_sessions.pop(user["id"], None)
+        if session.close_code is not None:
+            try:
+                await websocket.close(code=session.close_code)
+            except (RuntimeError, WebSocketDisconnect):
+                pass
+
 # ==================== MESSAGING ROUTES ====================
 @api_router.post("/conversations")
 async def create_conversation(data: ConversationCreate, user: dict = Depends(get_current_user)):
@@ -1294,62 +2360,194 @@ async def create_conversation(data: ConversationCreate, user: dict = Depends(get
     await db.conversations.insert_one(conversation)
     return serialize_doc(conversation)
 
+def other_participant(conv: dict, user_id: str) -> Optional[str]:
+    return next((p for p in conv["participants"] if p != user_id), None)
+
+def present_read_state(conv: dict, user_id: str) -> dict:
+    """Remplacer les compteurs par participant par ceux du lecteur (et l'accusé de lecture de l'autre)"""
+    conv["unread_count"] = conv.pop("unread_counts", {}).get(user_id, 0)
+    last_read = conv.pop("last_read", {})
+    conv["other_last_read"] = last_read.get(other_participant(conv, user_id))
+    return conv
+
+async def record_message(conv: dict, message: dict, preview: str):
+    """Insérer le message et mettre à jour la conversation en une écriture atomique :
+    aperçu, compteurs de non-lus des destinataires, pointeur de lecture de l'expéditeur"""
+    await db.messages.insert_one(message)
+    sender_id = message["sender_id"]
+    await db.conversations.update_one(
+        {"id": conv["id"]},
+        {
+            "$set": {
+                "last_message": preview,
+                "last_message_at": message["created_at"],
+                "last_message_id": message["id"],
+                f"unread_counts.{sender_id}": 0,
+                f"last_read.{sender_id}": message["id"]
+            },
+            "$inc": {f"unread_counts.{p}": 1 for p in conv["participants"] if p != sender_id}
+        }
+    )
+    message = serialize_doc(message)
+    await publish_message(message)
+    return message
+
 @api_router.get("/conversations")
-async def list_conversations(user: dict = Depends(get_current_user)):
-    conversations = await db.conversations.find(
-        {"participants": user["id"]},
-        {"_id": 0}
-    ).sort("last_message_at", -1).to_list(100)
+async def list_conversations(
+    page: int = 1,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    user: dict = Depends(get_current_principal)
+):
+    result = await paginate(
+        db.conversations, {"participants": user["id"]}, {"_id": 0},
+        page, limit, cursor, include_total, sort_field="last_message_at"
+    )
+    conversations = result["items"]
     
+    # Une requête par collection référencée, quelle que soit la taille de la page
+    users, requests, offers = await asyncio.gather(
+        fetch_users((other_participant(c, user["id"]) for c in conversations), {"first_name": 1, "last_name": 1, "avatar_url": 1, "avatar_variants": 1}),
+        fetch_by_ids(db.requests, (c.get("request_id") for c in conversations), {"origin_city": 1, "destination_city": 1, "package_type": 1}),
+        fetch_by_ids(db.offers, (c.get("offer_id") for c in conversations), {"origin_city": 1, "destination_city": 1})
+    )
     for conv in conversations:
-        other_id = [p for p in conv["participants"] if p != user["id"]][0]
-        other_user = await db.users.find_one({"id": other_id}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1})
-        conv["other_user"] = other_user
-        
+        conv["other_user"] = users.get(other_participant(conv, user["id"]))
         if conv.get("request_id"):
-            req = await db.requests.find_one({"id": conv["request_id"]}, {"_id": 0, "origin_city": 1, "destination_city": 1, "package_type": 1})
-            conv["request"] = req
+            conv["request"] = requests.get(conv["request_id"])
         if conv.get("offer_id"):
-            offer = await db.offers.find_one({"id": conv["offer_id"]}, {"_id": 0, "origin_city": 1, "destination_city": 1})
-            conv["offer"] = offer
-    
-    return conversations
+            conv["offer"] = offers.get(conv["offer_id"])
+        present_read_state(conv, user["id"])
+    
+    return result
+
+@api_router.get("/conversations/unread-summary")
+async def unread_summary(user: dict = Depends(get_current_principal)):
+    """Résumé léger des non-lus pour le tableau de bord, sans charger la boîte de réception"""
+    counter = f"unread_counts.{user['id']}"
+    unread, total = await asyncio.gather(
+        db.conversations.find(
+            {"participants": user["id"], counter: {"$gt": 0}},
+            {"_id": 0, "id": 1, counter: 1}
+        ).to_list(1000),
+        db.conversations.count_documents({"participants": user["id"]})
+    )
+    by_conversation = {c["id"]: c["unread_counts"][user["id"]] for c in unread}
+    return {
+        "conversations": total,
+        "unread_conversations": len(by_conversation),
+        "unread_messages": sum(by_conversation.values()),
+        "by_conversation": by_conversation
+    }
 
 @api_router.get("/conversations/{conversation_id}")
-async def get_conversation(conversation_id: str, user: dict = Depends(get_current_user)):
+async def get_conversation(conversation_id: str, user: dict = Depends(get_current_principal)):
     conv = await db.conversations.find_one({"id": conversation_id}, {"_id": 0})
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation non trouvée")
     if user["id"] not in conv["participants"]:
         raise HTTPException(status_code=403, detail="Non autorisé")
     
-    other_id = [p for p in conv["participants"] if p != user["id"]][0]
-    other_user = await db.users.find_one({"id": other_id}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1})
-    conv["other_user"] = other_user
+    other_id = other_participant(conv, user["id"])
+    conv["other_user"] = (await fetch_users([other_id], {"first_name": 1, "last_name": 1, "avatar_url": 1, "avatar_variants": 1})).get(other_id)
+    present_read_state(conv, user["id"])
     
     return conv
 
 @api_router.get("/conversations/{conversation_id}/messages")
-async def get_messages(conversation_id: str, page: int = 1, limit: int = 50, user: dict = Depends(get_current_user)):
-    conv = await db.conversations.find_one({"id": conversation_id})
+async def get_messages(
+    conversation_id: str,
+    request: FastAPIRequest,
+    page: int = 1,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    since: Optional[str] = None,
+    after_id: Optional[str] = None,
+    user: dict = Depends(get_current_principal)
+):
+    conv = await db.conversations.find_one(
+        {"id": conversation_id}, {"_id": 0, "participants": 1, "last_message_at": 1, "snapshot_version": 1}
+    )
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation non trouvée")
     if user["id"] not in conv["participants"]:
         raise HTTPException(status_code=403, detail="Non autorisé")
     
-    skip = (page - 1) * limit
-    messages = await db.messages.find(
-        {"conversation_id": conversation_id},
-        {"_id": 0}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    # L'ETag change dès qu'un message est ajouté ou qu'un profil d'expéditeur est recopié :
+    # un client à jour reçoit 304 sans lecture des messages
+    version = f"{conv.get('last_message_at')}|{conv.get('snapshot_version', 0)}|{request.url.query}"
+    etag = '"' + hashlib.sha1(version.encode()).hexdigest() + '"'
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cache_headers)
     
-    total = await db.messages.count_documents({"conversation_id": conversation_id})
-    
-    for msg in messages:
-        sender = await db.users.find_one({"id": msg["sender_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1})
-        msg["sender"] = sender
+    if since or after_id:
+        result = await fetch_messages_after(conversation_id, since, after_id, limit)
+    else:
+        result = await paginate(db.messages, {"conversation_id": conversation_id}, {"_id": 0}, page, limit, cursor, include_total)
+        # Ordre chronologique pour l'affichage ; next_cursor pointe vers les messages plus anciens
+        result["items"].reverse()
+    
+    # Les messages portent leur expéditeur ; seuls les anciens messages sans copie sont complétés
+    legacy = [msg for msg in result["items"] if "sender" not in msg]
+    if legacy:
+        await attach_users(legacy, {k: 1 for k in SENDER_FIELDS}, fields=(("sender_id", "sender"),))
+    
+    return JSONResponse(result, headers=cache_headers)
+
+async def fetch_messages_after(conversation_id: str, since: Optional[str], after_id: Optional[str], limit: int) -> dict:
+    """Messages postérieurs à un message (after_id) ou à une date (since), en ordre chronologique, sans comptage"""
+    if after_id:
+        anchor = await db.messages.find_one(
+            {"id": after_id, "conversation_id": conversation_id},
+            {"_id": 0, "id": 1, "created_at": 1}
+        )
+        if not anchor:
+            raise HTTPException(status_code=404, detail="Message non trouvé")
+        query = {"conversation_id": conversation_id, "$or": [
+            {"created_at": {"$gt": anchor["created_at"]}},
+            {"created_at": anchor["created_at"], "id": {"$gt": anchor["id"]}}
+        ]}
+    else:
+        try:
+            since_dt = datetime.fromisoformat(since.replace('Z', '+00:00'))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Format de date invalide")
+        if since_dt.tzinfo is None:
+            since_dt = since_dt.replace(tzinfo=timezone.utc)
+        # Même format que now_utc() pour comparer les chaînes ISO stockées
+        query = {"conversation_id": conversation_id, "created_at": {"$gt": since_dt.astimezone(timezone.utc).isoformat()}}
+    
+    items = await db.messages.find(query, {"_id": 0}).sort([("created_at", 1), ("id", 1)]).limit(limit + 1).to_list(limit + 1)
+    return {"items": items[:limit], "total": None, "has_more": len(items) > limit}
+
+@api_router.post("/conversations/{conversation_id}/read")
+async def mark_conversation_read(conversation_id: str, user: dict = Depends(get_current_principal)):
+    # Mise à jour en pipeline : last_read reprend le dernier message tel qu'il est au moment
+    # de l'écriture, et le compteur est remis à zéro dans la même écriture (pas de message
+    # arrivé entre une lecture et l'écriture qui serait compté comme lu)
+    conv = await db.conversations.find_one_and_update(
+        {"id": conversation_id, "participants": user["id"]},
+        [{"$set": {f"unread_counts.{user['id']}": 0, f"last_read.{user['id']}": {"$ifNull": ["$last_message_id", None]}}}],
+        projection={"_id": 0, "id": 1, "last_message_id": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if conv is None:
+        if await db.conversations.count_documents({"id": conversation_id}, limit=1):
+            raise HTTPException(status_code=403, detail="Non autorisé")
+        raise HTTPException(status_code=404, detail="Conversation non trouvée")
     
-    return {"items": list(reversed(messages)), "total": total, "page": page}
+    last_read = conv.get("last_message_id")
+    # Accusé de lecture poussé à l'autre participant
+    await hub.publish(conversation_channel(conversation_id), {
+        "type": "read",
+        "conversation_id": conversation_id,
+        "user_id": user["id"],
+        "message_id": last_read
+    })
+    return {"conversation_id": conversation_id, "last_read": last_read, "unread_count": 0}
 
 @api_router.post("/conversations/{conversation_id}/messages")
 async def send_message(conversation_id: str, data: MessageCreate, user: dict = Depends(get_current_user)):
@@ -1363,18 +2561,12 @@ async def send_message(conversation_id: str, data: MessageCreate, user: dict = D
         "id": str(uuid.uuid4()),
         "conversation_id": conversation_id,
         "sender_id": user["id"],
+        **sender_fields(user),
         "text": data.text,
         "attachments": [],
         "created_at": now_utc()
     }
-    await db.messages.insert_one(message)
-    
-    await db.conversations.update_one(
-        {"id": conversation_id},
-        {"$set": {"last_message": data.text[:100], "last_message_at": now_utc()}}
-    )
-    
-    return serialize_doc(message)
+    return await record_message(conv, message, data.text[:100])
 
 @api_router.post("/conversations/{conversation_id}/messages/attachment")
 async def upload_message_attachment(
@@ -1388,31 +2580,18 @@ async def upload_message_attachment(
     if user["id"] not in conv["participants"]:
         raise HTTPException(status_code=403, detail="Non autorisé")
     
-    ext = file.filename.split(".")[-1] if file.filename else "jpg"
-    filename = f"msg_{conversation_id}_{uuid.uuid4()}.{ext}"
-    filepath = UPLOAD_DIR / filename
-    
-    with open(filepath, "wb") as f:
-        shutil.copyfileobj(file.file, f)
-    
-    attachment_url = f"/uploads/{filename}"
+    attachment_url = await save_upload(file, "attachment")
     
     message = {
         "id": str(uuid.uuid4()),
         "conversation_id": conversation_id,
         "sender_id": user["id"],
+        **sender_fields(user),
         "text": "",
         "attachments": [attachment_url],
         "created_at": now_utc()
     }
-    await db.messages.insert_one(message)
-    
-    await db.conversations.update_one(
-        {"id": conversation_id},
-        {"$set": {"last_message": "[Pièce jointe]", "last_message_at": now_utc()}}
-    )
-    
-    return serialize_doc(message)
+    return await record_message(conv, message, "[Pièce jointe]")
 
 # ==================== CONTRACTS ROUTES ====================
 @api_router.post("/contracts")
@@ -1453,13 +2632,15 @@ async def create_contract(data: ContractCreate, user: dict = Depends(get_current
         "created_at": now_utc()
     }
     await db.contracts.insert_one(contract)
+    await bump_stats(contracts=1)
     
     await db.requests.update_one({"id": data.request_id}, {"$set": {"status": RequestStatus.IN_NEGOTIATION.value}})
+    await unindex_request(data.request_id)
     
     return serialize_doc(contract)
 
 @api_router.get("/contracts")
-async def list_contracts(user: dict = Depends(get_current_user), status: Optional[ContractStatus] = None):
+async def list_contracts(user: dict = Depends(get_current_principal), status: Optional[ContractStatus] = None):
     query = {"$or": [{"shipper_id": user["id"]}, {"carrier_id": user["id"]}]}
     if status:
         query["status"] = status.value
@@ -1469,16 +2650,13 @@ async def list_contracts(user: dict = Depends(get_current_user), status: Optiona
     for contract in contracts:
         req = await db.requests.find_one({"id": contract["request_id"]}, {"_id": 0})
         contract["request"] = req
-        
-        shipper = await db.users.find_one({"id": contract["shipper_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1})
-        carrier = await db.users.find_one({"id": contract["carrier_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1})
-        contract["shipper"] = shipper
-        contract["carrier"] = carrier
+    
+    await attach_users(contracts, {"first_name": 1, "last_name": 1, "avatar_url": 1, "avatar_variants": 1}, fields=(("shipper_id", "shipper"), ("carrier_id", "carrier")))
     
     return contracts
 
 @api_router.get("/contracts/{contract_id}")
-async def get_contract(contract_id: str, user: dict = Depends(get_current_user)):
+async def get_contract(contract_id: str, user: dict = Depends(get_current_principal)):
     contract = await db.contracts.find_one({"id": contract_id}, {"_id": 0})
     if not contract:
         raise HTTPException(status_code=404, detail="Contrat non trouvé")
@@ -1493,8 +2671,8 @@ async def get_contract(contract_id: str, user: dict = Depends(get_current_user))
         offer = await db.offers.find_one({"id": contract["offer_id"]}, {"_id": 0})
         contract["offer"] = offer
     
-    shipper = await db.users.find_one({"id": contract["shipper_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1, "phone": 1})
-    carrier = await db.users.find_one({"id": contract["carrier_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1, "phone": 1})
+    shipper = await db.users.find_one({"id": contract["shipper_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1, "avatar_variants": 1, "phone": 1})
+    carrier = await db.users.find_one({"id": contract["carrier_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1, "avatar_variants": 1, "phone": 1})
     contract["shipper"] = shipper
     contract["carrier"] = carrier
     
@@ -1524,6 +2702,7 @@ async def accept_contract(contract_id: str, user: dict = Depends(get_current_use
     )
     
     await db.requests.update_one({"id": contract["request_id"]}, {"$set": {"status": RequestStatus.ACCEPTED.value}})
+    await unindex_request(contract["request_id"])
     
     return {"message": "Contrat accepté"}
 
@@ -1548,6 +2727,7 @@ async def pickup_contract(contract_id: str, user: dict = Depends(get_current_use
     )
     
     await db.requests.update_one({"id": contract["request_id"]}, {"$set": {"status": RequestStatus.IN_TRANSIT.value}})
+    await unindex_request(contract["request_id"])
     
     return {"message": "Prise en charge confirmée"}
 
@@ -1572,6 +2752,7 @@ async def deliver_contract(contract_id: str, user: dict = Depends(get_current_us
     )
     
     await db.requests.update_one({"id": contract["request_id"]}, {"$set": {"status": RequestStatus.DELIVERED.value}})
+    await unindex_request(contract["request_id"])
     
     return {"message": "Livraison confirmée"}
 
@@ -1596,6 +2777,7 @@ async def cancel_contract(contract_id: str, user: dict = Depends(get_current_use
     )
     
     await db.requests.update_one({"id": contract["request_id"]}, {"$set": {"status": RequestStatus.CANCELLED.value}})
+    await unindex_request(contract["request_id"])
     
     return {"message": "Contrat annulé"}
 
@@ -1635,6 +2817,7 @@ async def create_review(contract_id: str, data: ReviewCreate, user: dict = Depen
         {"id": reviewee_id},
         {"$inc": {"rating_sum": data.rating, "rating_count": 1}}
     )
+    await invalidate_user(reviewee_id)
     
     return serialize_doc(review)
 
@@ -1652,12 +2835,13 @@ async def create_report(data: ReportCreate, user: dict = Depends(get_current_use
         "created_at": now_utc()
     }
     await db.reports.insert_one(report)
+    await bump_stats(open_reports=1)
     return serialize_doc(report)
 
 # ==================== ADMIN ROUTES ====================
 @api_router.get("/admin/users")
 async def admin_list_users(
-    user: dict = Depends(get_current_user),
+    user: dict = Depends(get_current_principal),
     role: Optional[UserRole] = None,
     status: Optional[UserStatus] = None,
     page: int = 1,
@@ -1682,6 +2866,7 @@ async def admin_suspend_user(user_id: str, user: dict = Depends(get_current_user
     await require_role(user, ["ADMIN"])
     
     await db.users.update_one({"id": user_id}, {"$set": {"status": UserStatus.SUSPENDED.value}})
+    await revoke_user_tokens(user_id)
     
     await db.audit_logs.insert_one({
         "id": str(uuid.uuid4()),
@@ -1699,6 +2884,7 @@ async def admin_unsuspend_user(user_id: str, user: dict = Depends(get_current_us
     await require_role(user, ["ADMIN"])
     
     await db.users.update_one({"id": user_id}, {"$set": {"status": UserStatus.ACTIVE.value}})
+    await invalidate_user(user_id)
     
     await db.audit_logs.insert_one({
         "id": str(uuid.uuid4()),
@@ -1713,7 +2899,7 @@ async def admin_unsuspend_user(user_id: str, user: dict = Depends(get_current_us
 
 @api_router.get("/admin/verifications")
 async def admin_list_verifications(
-    user: dict = Depends(get_current_user),
+    user: dict = Depends(get_current_principal),
     status: Optional[VerificationStatus] = None,
     page: int = 1,
     limit: int = 20
@@ -1728,9 +2914,7 @@ async def admin_list_verifications(
     verifications = await db.pro_verifications.find(query, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
     total = await db.pro_verifications.count_documents(query)
     
-    for v in verifications:
-        u = await db.users.find_one({"id": v["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "email": 1})
-        v["user"] = u
+    await attach_users(verifications, {"first_name": 1, "last_name": 1, "email": 1})
     
     return {"items": verifications, "total": total, "page": page, "pages": (total + limit - 1) // limit}
 
@@ -1738,7 +2922,15 @@ async def admin_list_verifications(
 async def admin_approve_verification(verification_id: str, user: dict = Depends(get_current_user)):
     await require_role(user, ["ADMIN"])
     
-    await db.pro_verifications.update_one({"id": verification_id}, {"$set": {"status": VerificationStatus.VERIFIED.value}})
+    # Filtrer sur l'état courant : seule une vraie transition depuis PENDING décrémente le compteur
+    pending = await db.pro_verifications.update_one(
+        {"id": verification_id, "status": VerificationStatus.PENDING.value},
+        {"$set": {"status": VerificationStatus.VERIFIED.value}}
+    )
+    if pending.modified_count:
+        await bump_stats(pending_verifications=-1)
+    else:
+        await db.pro_verifications.update_one({"id": verification_id}, {"$set": {"status": VerificationStatus.VERIFIED.value}})
     
     await db.audit_logs.insert_one({
         "id": str(uuid.uuid4()),
@@ -1755,7 +2947,15 @@ async def admin_approve_verification(verification_id: str, user: dict = Depends(
 async def admin_reject_verification(verification_id: str, user: dict = Depends(get_current_user)):
     await require_role(user, ["ADMIN"])
     
-    await db.pro_verifications.update_one({"id": verification_id}, {"$set": {"status": VerificationStatus.REJECTED.value}})
+    # Filtrer sur l'état courant : seule une vraie transition depuis PENDING décrémente le compteur
+    pending = await db.pro_verifications.update_one(
+        {"id": verification_id, "status": VerificationStatus.PENDING.value},
+        {"$set": {"status": VerificationStatus.REJECTED.value}}
+    )
+    if pending.modified_count:
+        await bump_stats(pending_verifications=-1)
+    else:
+        await db.pro_verifications.update_one({"id": verification_id}, {"$set": {"status": VerificationStatus.REJECTED.value}})
     
     await db.audit_logs.insert_one({
         "id": str(uuid.uuid4()),
@@ -1770,7 +2970,7 @@ async def admin_reject_verification(verification_id: str, user: dict = Depends(g
 
 @api_router.get("/admin/reports")
 async def admin_list_reports(
-    user: dict = Depends(get_current_user),
+    user: dict = Depends(get_current_principal),
     status: Optional[ReportStatus] = None,
     page: int = 1,
     limit: int = 20
@@ -1785,9 +2985,7 @@ async def admin_list_reports(
     reports = await db.reports.find(query, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
     total = await db.reports.count_documents(query)
     
-    for r in reports:
-        reporter = await db.users.find_one({"id": r["reporter_id"]}, {"_id": 0, "first_name": 1, "last_name": 1})
-        r["reporter"] = reporter
+    await attach_users(reports, {"first_name": 1, "last_name": 1}, fields=(("reporter_id", "reporter"),))
     
     return {"items": reports, "total": total, "page": page, "pages": (total + limit - 1) // limit}
 
@@ -1795,7 +2993,12 @@ async def admin_list_reports(
 async def admin_close_report(report_id: str, user: dict = Depends(get_current_user)):
     await require_role(user, ["ADMIN"])
     
-    await db.reports.update_one({"id": report_id}, {"$set": {"status": ReportStatus.CLOSED.value}})
+    result = await db.reports.update_one(
+        {"id": report_id, "status": ReportStatus.OPEN.value},
+        {"$set": {"status": ReportStatus.CLOSED.value}}
+    )
+    if result.modified_count:
+        await bump_stats(open_reports=-1)
     
     await db.audit_logs.insert_one({
         "id": str(uuid.uuid4()),
@@ -1809,16 +3012,14 @@ async def admin_close_report(report_id: str, user: dict = Depends(get_current_us
     return {"message": "Signalement clôturé"}
 
 @api_router.get("/admin/requests")
-async def admin_list_requests(user: dict = Depends(get_current_user), page: int = 1, limit: int = 20):
+async def admin_list_requests(user: dict = Depends(get_current_principal), page: int = 1, limit: int = 20):
     await require_role(user, ["ADMIN"])
     
     skip = (page - 1) * limit
     requests = await db.requests.find({}, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
     total = await db.requests.count_documents({})
     
-    for req in requests:
-        u = await db.users.find_one({"id": req["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "email": 1})
-        req["user"] = u
+    await attach_users(requests, {"first_name": 1, "last_name": 1, "email": 1})
     
     return {"items": requests, "total": total, "page": page, "pages": (total + limit - 1) // limit}
 
@@ -1827,6 +3028,7 @@ async def admin_delete_request(request_id: str, user: dict = Depends(get_current
     await require_role(user, ["ADMIN"])
     
     await db.requests.update_one({"id": request_id}, {"$set": {"hidden": True}})
+    await unindex_request(request_id)
     
     await db.audit_logs.insert_one({
         "id": str(uuid.uuid4()),
@@ -1840,16 +3042,14 @@ async def admin_delete_request(request_id: str, user: dict = Depends(get_current
     return {"message": "Demande masquée"}
 
 @api_router.get("/admin/offers")
-async def admin_list_offers(user: dict = Depends(get_current_user), page: int = 1, limit: int = 20):
+async def admin_list_offers(user: dict = Depends(get_current_principal), page: int = 1, limit: int = 20):
     await require_role(user, ["ADMIN"])
     
     skip = (page - 1) * limit
     offers = await db.offers.find({}, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
     total = await db.offers.count_documents({})
     
-    for offer in offers:
-        u = await db.users.find_one({"id": offer["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "email": 1})
-        offer["user"] = u
+    await attach_users(offers, {"first_name": 1, "last_name": 1, "email": 1})
     
     return {"items": offers, "total": total, "page": page, "pages": (total + limit - 1) // limit}
 
@@ -1858,6 +3058,7 @@ async def admin_delete_offer(offer_id: str, user: dict = Depends(get_current_use
     await require_role(user, ["ADMIN"])
     
     await db.offers.update_one({"id": offer_id}, {"$set": {"hidden": True}})
+    await unindex_offer(offer_id)
     
     await db.audit_logs.insert_one({
         "id": str(uuid.uuid4()),
@@ -1871,23 +3072,32 @@ async def admin_delete_offer(offer_id: str, user: dict = Depends(get_current_use
     return {"message": "Offre masquée"}
 
 @api_router.get("/admin/stats")
-async def admin_stats(user: dict = Depends(get_current_user)):
+async def admin_stats(user: dict = Depends(get_current_principal)):
     await require_role(user, ["ADMIN"])
     
-    users_count = await db.users.count_documents({})
-    requests_count = await db.requests.count_documents({})
-    offers_count = await db.offers.count_documents({})
-    contracts_count = await db.contracts.count_documents({})
-    pending_verifications = await db.pro_verifications.count_documents({"status": "PENDING"})
-    open_reports = await db.reports.count_documents({"status": "OPEN"})
+    counters = await db.stats_counters.find_one({"id": STATS_COUNTERS_ID}, {"_id": 0})
+    if counters is None:
+        counters = (await reconcile_stats_counters())["counters"]
+    return {name: counters.get(name, 0) for name in STATS_COUNTER_QUERIES}
+
+@api_router.get("/admin/metrics")
+async def admin_metrics(user: dict = Depends(get_current_principal)):
+    """Métriques internes du worker qui répond (pas d'agrégation entre workers)"""
+    await require_role(user, ["ADMIN"])
     
     return {
-        "users": users_count,
-        "requests": requests_count,
-        "offers": offers_count,
-        "contracts": contracts_count,
-        "pending_verifications": pending_verifications,
-        "open_reports": open_reports
+        "pid": os.getpid(),
+        "password_hasher": password_hasher.stats(),
+        "rate_limits": {
+            "backend": rate_limit_store.backend,
+            **{name: limiter.stats() for name, limiter in rate_limiters.items()}
+        },
+        "user_cache": {"size": len(user_cache), "hits": user_cache.hits, "misses": user_cache.misses},
+        "uploads": upload_service.stats(),
+        "image_pipeline": image_pipeline.stats(),
+        "visit_queue": visit_queue.stats(),
+        "pubsub": hub.stats(),
+        "matching_index": {"ready": matching_index.ready, "documents": len(matching_index)}
     }
 
 # ==================== COUNTRIES MANAGEMENT ====================
@@ -1933,7 +3143,7 @@ async def create_country(data: CountryCreate, user: dict = Depends(get_current_u
     return serialize_doc(country)
 
 @api_router.get("/admin/countries")
-async def admin_list_countries(user: dict = Depends(get_current_user)):
+async def admin_list_countries(user: dict = Depends(get_current_principal)):
     await require_role(user, ["ADMIN"])
     countries = await db.countries.find({}, {"_id": 0}).sort("name", 1).to_list(100)
     return countries
@@ -1978,7 +3188,7 @@ async def delete_country(country_id: str, user: dict = Depends(get_current_user)
 
 # ==================== PLATFORM SETTINGS (COMMISSION) ====================
 @api_router.get("/admin/settings")
-async def get_settings(user: dict = Depends(get_current_user)):
+async def get_settings(user: dict = Depends(get_current_principal)):
     await require_role(user, ["ADMIN"])
     
     settings = await db.platform_settings.find_one({"key": "main"}, {"_id": 0})
@@ -1988,6 +3198,7 @@ async def get_settings(user: dict = Depends(get_current_user)):
             "commission_enabled": False,
             "shipper_commission_rate": 0.01,
             "carrier_commission_rate": 0.01,
+            "matching_weights": DEFAULT_MATCHING_WEIGHTS,
             "created_at": now_utc()
         }
         await db.platform_settings.insert_one(new_settings)
@@ -2006,14 +3217,20 @@ async def update_settings(data: PlatformSettingsUpdate, user: dict = Depends(get
             "commission_enabled": False,
             "shipper_commission_rate": 0.01,
             "carrier_commission_rate": 0.01,
+            "matching_weights": DEFAULT_MATCHING_WEIGHTS,
             "created_at": now_utc()
         }
         await db.platform_settings.insert_one(new_settings)
     
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
+    # Mise à jour partielle du profil de pondération du matching
+    for name, weight in update_data.pop("matching_weights", {}).items():
+        if weight is not None:
+            update_data[f"matching_weights.{name}"] = weight
     if update_data:
         update_data["updated_at"] = now_utc()
         await db.platform_settings.update_one({"key": "main"}, {"$set": update_data})
+        settings_cache.clear()
     
     await db.audit_logs.insert_one({
         "id": str(uuid.uuid4()),
@@ -2154,7 +3371,7 @@ async def execute_payment(payment_id: str, payer_id: str, user: dict = Depends(g
         raise HTTPException(status_code=500, detail=f"Erreur lors de l'exécution du paiement: {payment.error}")
 
 @api_router.get("/payments/contract/{contract_id}")
-async def get_contract_payment(contract_id: str, user: dict = Depends(get_current_user)):
+async def get_contract_payment(contract_id: str, user: dict = Depends(get_current_principal)):
     contract = await db.contracts.find_one({"id": contract_id})
     if not contract:
         raise HTTPException(status_code=404, detail="Contrat non trouvé")
@@ -2166,43 +3383,77 @@ async def get_contract_payment(contract_id: str, user: dict = Depends(get_curren
     return payment
 
 @api_router.get("/admin/payments")
-async def admin_list_payments(user: dict = Depends(get_current_user), page: int = 1, limit: int = 20):
+async def admin_list_payments(
+    user: dict = Depends(get_current_principal),
+    page: int = 1,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    include_total: bool = True
+):
     await require_role(user, ["ADMIN"])
     
-    skip = (page - 1) * limit
-    payments = await db.payments.find({}, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
-    total = await db.payments.count_documents({})
+    result = await paginate(db.payments, {}, {"_id": 0}, page, limit, cursor, include_total)
+    payments = result["items"]
     
-    for p in payments:
-        shipper = await db.users.find_one({"id": p["shipper_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "email": 1})
-        carrier = await db.users.find_one({"id": p["carrier_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "email": 1})
-        p["shipper"] = shipper
-        p["carrier"] = carrier
+    await attach_users(payments, {"first_name": 1, "last_name": 1, "email": 1}, fields=(("shipper_id", "shipper"), ("carrier_id", "carrier")))
     
     total_commission = await db.payments.aggregate([
         {"$match": {"status": "completed", "commission_enabled": True}},
         {"$group": {"_id": None, "total": {"$sum": {"$add": ["$shipper_commission", "$carrier_commission"]}}}}
     ]).to_list(1)
     
-    return {
-        "items": payments,
-        "total": total,
-        "page": page,
-        "pages": (total + limit - 1) // limit,
-        "total_commission": total_commission[0]["total"] if total_commission else 0
-    }
+    result["total_commission"] = total_commission[0]["total"] if total_commission else 0
+    return result
 
 # ==================== VISITOR ANALYTICS ====================
-from fastapi import Request as FastAPIRequest
+# Les visites passent par une file bornée : le handler répond sans attendre
+# Mongo, une tâche de fond les insère par lots et fusionne les incréments de
+# daily_stats (visites, registres HyperLogLog des visiteurs uniques du jour).
+# Une visite peut attendre dans la file bien plus longtemps que l'intervalle de
+# vidage (contre-pression, Mongo lent) : l'agrégation ne suit donc pas son
+# horodatage mais `ingested_at`, fixé au moment de l'insertion.
+async def flush_visits(visits: List[dict]):
+    """Insérer un lot de visites et appliquer un seul incrément par jour"""
+    started_at = time.perf_counter()
+    ingested_at = now_utc()
+    for visit in visits:
+        visit["ingested_at"] = ingested_at
+    await db.visitor_analytics.insert_many(visits, ordered=False)
+    elapsed = time.perf_counter() - started_at
+    if elapsed > ANALYTICS_ROLLUP_LAG_SECONDS:
+        # Le lot a pu devenir visible après le passage de l'agrégation sur son ingested_at
+        logger.warning(f"Visit batch took {elapsed:.1f}s to insert, above ANALYTICS_ROLLUP_LAG_SECONDS: "
+                       f"{len(visits)} visits may be missing from the rollups")
+    days: Dict[str, dict] = {}
+    for visit in visits:
+        delta = days.setdefault(visit["timestamp"][:10], {"visits": 0, "hll": HyperLogLog()})
+        delta["visits"] += 1
+        delta["hll"].add(visit["ip"])
+    await asyncio.gather(*(
+        db.daily_stats.update_one(
+            {"date": date},
+            {
+                "$inc": {"visits": delta["visits"]},
+                "$max": {f"hll.{index}": rank for index, rank in delta["hll"].registers().items()},
+                "$setOnInsert": {"date": date, "created_at": now_utc()}
+            },
+            upsert=True
+        )
+        for date, delta in days.items()
+    ))
+
+visit_queue = BatchQueue(
+    flush_visits,
+    maxsize=int(os.environ.get("ANALYTICS_QUEUE_SIZE", "10000")),
+    batch_size=int(os.environ.get("ANALYTICS_BATCH_SIZE", "500")),
+    interval=float(os.environ.get("ANALYTICS_FLUSH_SECONDS", "1")),
+    # Contre-pression : attente maximale d'une place quand la file est pleine (0 = abandon immédiat)
+    put_timeout=float(os.environ.get("ANALYTICS_QUEUE_TIMEOUT", "0")),
+)
 
 @api_router.post("/analytics/track")
 async def track_visitor(data: VisitorTrack, request: FastAPIRequest):
-    # Get client IP from headers (considering reverse proxy)
-    forwarded_for = request.headers.get("x-forwarded-for")
-    if forwarded_for:
-        client_ip = forwarded_for.split(",")[0].strip()
-    else:
-        client_ip = request.client.host if request.client else "unknown"
+    client_ip = get_client_ip(request)
     
     visit = {
         "id": str(uuid.uuid4()),
@@ -2216,95 +3467,111 @@ async def track_visitor(data: VisitorTrack, request: FastAPIRequest):
         "timestamp": now_utc()
     }
     
-    await db.visitor_analytics.insert_one(visit)
-    
-    # Update daily stats
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    await db.daily_stats.update_one(
-        {"date": today},
-        {
-            "$inc": {"visits": 1, "unique_ips": 0},
-            "$addToSet": {"ips": client_ip},
-            "$setOnInsert": {"date": today, "created_at": now_utc()}
-        },
-        upsert=True
-    )
-    
-    # Update unique IPs count
-    stats = await db.daily_stats.find_one({"date": today})
-    if stats:
-        unique_count = len(stats.get("ips", []))
-        await db.daily_stats.update_one(
-            {"date": today},
-            {"$set": {"unique_ips": unique_count}}
-        )
-    
+    if not await visit_queue.put(visit):
+        return {"status": "dropped"}
     return {"status": "tracked"}
 
+# Agrégats de visites : le tableau de bord lit des documents pré-calculés par
+# heure et par jour, jamais la collection brute (voir analytics.py).
+ANALYTICS_ROLLUP_SECONDS = int(os.environ.get("ANALYTICS_ROLLUP_SECONDS", "60"))
+# Délai avant agrégation : ingested_at est fixé juste avant l'insert_many, qui doit avoir abouti
+ANALYTICS_ROLLUP_LAG_SECONDS = int(os.environ.get("ANALYTICS_ROLLUP_LAG_SECONDS", "30"))
+visit_rollup = VisitRollup(
+    db,
+    lag_seconds=ANALYTICS_ROLLUP_LAG_SECONDS,
+    # Bail d'une fenêtre réservée : passé ce délai, un autre worker la reprend (worker arrêté en cours de passe)
+    lease_seconds=int(os.environ.get("ANALYTICS_ROLLUP_LEASE_SECONDS", "300")),
+    hourly_retention_days=int(os.environ.get("ANALYTICS_HOURLY_RETENTION_DAYS", "14")),
+)
+
+async def backfill_visit_ingestion_times():
+    """Visites enregistrées avant ingested_at : leur horodatage en tient lieu (celles déjà agrégées restent avant le point de reprise)"""
+    result = await db.visitor_analytics.update_many(
+        {"ingested_at": {"$exists": False}}, [{"$set": {"ingested_at": "$timestamp"}}]
+    )
+    if result.modified_count:
+        logger.info(f"Backfilled ingested_at on {result.modified_count} visits")
+
+async def rollup_visitor_analytics_periodically():
+    try:
+        await backfill_visit_ingestion_times()
+    except PyMongoError as e:
+        logger.error(f"Failed to backfill visit ingestion times: {str(e)}")
+    while True:
+        try:
+            while (await visit_rollup.run())["behind"]:
+                pass
+        except PyMongoError as e:
+            logger.error(f"Failed to roll up visitor analytics: {str(e)}")
+        await asyncio.sleep(ANALYTICS_ROLLUP_SECONDS)
+
+@app.on_event("startup")
+async def start_analytics_rollup():
+    app.state.analytics_rollup_task = asyncio.create_task(rollup_visitor_analytics_periodically())
+
+@app.on_event("startup")
+async def drop_daily_ip_lists():
+    # Anciens documents daily_stats : listes d'IP complètes, remplacées par les registres HyperLogLog
+    try:
+        await db.daily_stats.update_many({"ips": {"$exists": True}}, {"$unset": {"ips": "", "unique_ips": ""}})
+    except PyMongoError as e:
+        logger.error(f"Failed to drop legacy daily IP lists: {str(e)}")
+
+def rollup_stats(rollup: dict) -> dict:
+    return {
+        "visits": rollup.get("visits", 0),
+        "unique_ips": HyperLogLog(registers=rollup.get("hll")).count(),
+    }
+
 @api_router.get("/admin/analytics")
-async def get_analytics(user: dict = Depends(get_current_user), days: int = 30):
+async def get_analytics(user: dict = Depends(get_current_principal), days: int = Query(30, ge=1, le=366)):
     await require_role(user, ["ADMIN"])
     
-    # Get date range
-    end_date = datetime.now(timezone.utc)
-    start_date = end_date - timedelta(days=days)
-    
-    # Get daily stats
-    daily_stats = await db.daily_stats.find(
-        {"date": {"$gte": start_date.strftime("%Y-%m-%d")}},
-        {"_id": 0}
-    ).sort("date", -1).to_list(days)
-    
-    # Get total stats
-    total_visits = await db.visitor_analytics.count_documents({})
-    
-    # Get unique IPs (all time)
-    unique_ips_pipeline = [
-        {"$group": {"_id": "$ip"}},
-        {"$count": "total"}
-    ]
-    unique_ips_result = await db.visitor_analytics.aggregate(unique_ips_pipeline).to_list(1)
-    total_unique_ips = unique_ips_result[0]["total"] if unique_ips_result else 0
-    
-    # Get top pages
-    top_pages_pipeline = [
-        {"$group": {"_id": "$page", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": 10}
-    ]
-    top_pages = await db.visitor_analytics.aggregate(top_pages_pipeline).to_list(10)
-    
-    # Get recent visits with IP info
-    recent_visits = await db.visitor_analytics.find(
-        {},
-        {"_id": 0, "id": 1, "ip": 1, "page": 1, "timestamp": 1, "user_agent": 1, "language": 1}
-    ).sort("timestamp", -1).limit(50).to_list(50)
-    
-    # Get IP statistics
-    ip_stats_pipeline = [
-        {"$group": {"_id": "$ip", "visits": {"$sum": 1}, "last_visit": {"$max": "$timestamp"}}},
-        {"$sort": {"visits": -1}},
-        {"$limit": 100}
-    ]
-    ip_stats = await db.visitor_analytics.aggregate(ip_stats_pipeline).to_list(100)
-    
-    # Today's stats
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    today_stats = await db.daily_stats.find_one({"date": today}, {"_id": 0})
+    now = datetime.now(timezone.utc)
+    today = now.strftime("%Y-%m-%d")
+    first_day = (now - timedelta(days=days)).strftime("%Y-%m-%d")
+    first_hour = (now - timedelta(hours=23)).strftime("%Y-%m-%dT%H")
+    
+    # Quelques centaines de petits documents au plus, quel que soit le volume de visites
+    totals, daily, hourly, top_pages, recent_visits, ip_stats, today_stats = await asyncio.gather(
+        db.analytics_rollups.find_one({"id": ANALYTICS_TOTALS_ID}, {"_id": 0}),
+        db.analytics_rollups.find(
+            {"granularity": "day", "period": {"$gte": first_day}}, {"_id": 0}
+        ).sort("period", -1).to_list(days + 1),
+        db.analytics_rollups.find(
+            {"granularity": "hour", "period": {"$gte": first_hour}}, {"_id": 0}
+        ).sort("period", -1).to_list(24),
+        db.visitor_pages.find({}, {"_id": 0, "page": 1, "visits": 1}).sort("visits", -1).limit(10).to_list(10),
+        db.visitor_analytics.find(
+            {},
+            {"_id": 0, "id": 1, "ip": 1, "page": 1, "timestamp": 1, "user_agent": 1, "language": 1}
+        ).sort("timestamp", -1).limit(50).to_list(50),
+        db.visitor_ips.find({}, {"_id": 0, "ip": 1, "visits": 1, "last_visit": 1}).sort("visits", -1).limit(100).to_list(100),
+        # Compteur du jour tenu en temps réel par track_visitor
+        db.daily_stats.find_one({"date": today}, {"_id": 0, "visits": 1, "hll": 1}),
+    )
+    totals = totals or {}
+    today_stats = today_stats or {}
     
     return {
-        "total_visits": total_visits,
-        "total_unique_ips": total_unique_ips,
-        "today": today_stats or {"visits": 0, "unique_ips": 0},
-        "daily_stats": daily_stats,
-        "top_pages": [{"page": p["_id"], "count": p["count"]} for p in top_pages],
+        "total_visits": totals.get("visits", 0),
+        "total_unique_ips": HyperLogLog(registers=totals.get("hll")).count(),
+        "aggregated_until": totals.get("watermark"),
+        "today": {
+            "date": today,
+            "visits": today_stats.get("visits", 0),
+            "unique_ips": HyperLogLog(registers=today_stats.get("hll")).count(),
+        },
+        "daily_stats": [{"date": r["period"], **rollup_stats(r)} for r in daily],
+        "hourly_stats": [{"hour": r["period"], **rollup_stats(r)} for r in hourly],
+        "top_pages": [{"page": p["page"], "count": p["visits"]} for p in top_pages],
         "recent_visits": recent_visits,
-        "ip_stats": [{"ip": ip["_id"], "visits": ip["visits"], "last_visit": ip["last_visit"]} for ip in ip_stats]
+        "ip_stats": ip_stats
     }
 
 # ==================== GOOGLE ADS SETTINGS ====================
 @api_router.get("/admin/ads-settings")
-async def get_ads_settings(user: dict = Depends(get_current_user)):
+async def get_ads_settings(user: dict = Depends(get_current_principal)):
     await require_role(user, ["ADMIN"])
     
     settings = await db.ads_settings.find_one({"key": "google_ads"}, {"_id": 0})
@@ -2375,6 +3642,64 @@ async def get_public_ads_config():
         "in_content_ad_slot": settings.get("in_content_ad_slot", "")
     }
 
+# ==================== ADMIN DASHBOARD ====================
+# Sections du panneau admin : chacune réutilise le handler de la route dédiée
+ADMIN_DASHBOARD_SECTIONS = {
+    "stats": lambda user, days: admin_stats(user),
+    "users": lambda user, days: admin_list_users(user),
+    "verifications": lambda user, days: admin_list_verifications(user),
+    "carrier_verifications": lambda user, days: admin_list_carrier_verifications(user),
+    "reports": lambda user, days: admin_list_reports(user),
+    "requests": lambda user, days: admin_list_requests(user),
+    "offers": lambda user, days: admin_list_offers(user),
+    "countries": lambda user, days: admin_list_countries(user),
+    "settings": lambda user, days: get_settings(user),
+    "payments": lambda user, days: admin_list_payments(user),
+    "analytics": lambda user, days: get_analytics(user, days=days),
+    "ads_settings": lambda user, days: get_ads_settings(user),
+}
+
+@api_router.get("/admin/dashboard")
+async def admin_dashboard(
+    user: dict = Depends(get_current_principal),
+    sections: Optional[str] = Query(None, description="Sections séparées par des virgules (toutes par défaut)"),
+    days: int = Query(30, ge=1, le=366)
+):
+    """Données du panneau admin en un appel : sections en parallèle, utilisateurs chargés en commun"""
+    await require_role(user, ["ADMIN"])
+    
+    names = [name.strip() for name in sections.split(",") if name.strip()] if sections else list(ADMIN_DASHBOARD_SECTIONS)
+    unknown = [name for name in names if name not in ADMIN_DASHBOARD_SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Sections inconnues: {', '.join(unknown)}")
+    
+    batch = UserBatch(len(names))
+    
+    async def run(name: str):
+        try:
+            return await ADMIN_DASHBOARD_SECTIONS[name](user, days)
+        finally:
+            batch.leave()
+    
+    token = user_batch.set(batch)
+    try:
+        results = await asyncio.gather(*(run(name) for name in names), return_exceptions=True)
+    finally:
+        user_batch.reset(token)
+    
+    payload, errors = {}, {}
+    for name, result in zip(names, results):
+        if isinstance(result, HTTPException):
+            errors[name] = result.detail
+        elif isinstance(result, Exception):
+            logger.error(f"Admin dashboard section {name} failed: {str(result)}")
+            errors[name] = "Erreur interne"
+        else:
+            payload[name] = result
+    if errors:
+        payload["errors"] = errors
+    return payload
+
 # ==================== SEED DATA ====================
 @api_router.post("/seed")
 async def seed_data():
@@ -2386,7 +3711,7 @@ async def seed_data():
     admin = {
         "id": admin_id,
         "email": "admin@logimatch.com",
-        "password_hash": hash_password("admin123"),
+        "password_hash": await hash_password("admin123"),
         "role": "ADMIN",
         "status": "ACTIVE",
         "phone_verified": True,
@@ -2407,7 +3732,7 @@ async def seed_data():
     shipper1 = {
         "id": shipper1_id,
         "email": "marie@example.com",
-        "password_hash": hash_password("password123"),
+        "password_hash": await hash_password("password123"),
         "role": "SHIPPER",
         "status": "ACTIVE",
         "phone_verified": True,
@@ -2428,7 +3753,7 @@ async def seed_data():
     shipper2 = {
         "id": shipper2_id,
         "email": "ahmed@example.com",
-        "password_hash": hash_password("password123"),
+        "password_hash": await hash_password("password123"),
         "role": "SHIPPER",
         "status": "ACTIVE",
         "phone_verified": True,
@@ -2449,7 +3774,7 @@ async def seed_data():
     carrier_pro = {
         "id": carrier_pro_id,
         "email": "transport.pro@example.com",
-        "password_hash": hash_password("password123"),
+        "password_hash": await hash_password("password123"),
         "role": "CARRIER_PRO",
         "status": "ACTIVE",
         "phone_verified": True,
@@ -2480,7 +3805,7 @@ async def seed_data():
     carrier_ind = {
         "id": carrier_ind_id,
         "email": "salim@example.com",
-        "password_hash": hash_password("password123"),
+        "password_hash": await hash_password("password123"),
         "role": "CARRIER_INDIVIDUAL",
         "status": "ACTIVE",
         "phone_verified": True,
@@ -2630,6 +3955,7 @@ async def seed_data():
         "participants": sorted([shipper1_id, carrier_pro_id]),
         "last_message": "D'accord, je confirme la prise en charge demain",
         "last_message_at": now_utc(),
+        "unread_counts": {shipper1_id: 1, carrier_pro_id: 0},
         "created_at": now_utc()
     })
     
@@ -2693,11 +4019,246 @@ async def seed_data():
             "commission_enabled": False,
             "shipper_commission_rate": 0.01,
             "carrier_commission_rate": 0.01,
+            "matching_weights": DEFAULT_MATCHING_WEIGHTS,
             "created_at": now_utc()
         })
     
+    await load_matching_index()
+    await reconcile_stats_counters()
+    
     return {"message": "Données de test créées avec succès"}
 
+# ==================== DATABASE INDEXES ====================
+def _id_index() -> IndexModel:
+    return IndexModel([("id", ASCENDING)], name="id_unique", unique=True)
+
+# Registre déclaratif : chaque collection liste les index attendus par les filtres et tris des routes
+MONGO_INDEXES = {
+    "users": [
+        _id_index(),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("role", ASCENDING), ("status", ASCENDING)], name="role_status"),
+        # Rechargement périodique de token_versions : seuls les utilisateurs déjà révoqués sont indexés
+        IndexModel([("token_version", ASCENDING)], name="token_version_revoked",
+                   partialFilterExpression={"token_version": {"$gt": 0}}),
+    ],
+    "requests": [
+        _id_index(),
+        IndexModel([("origin_country", ASCENDING), ("destination_country", ASCENDING), ("mode", ASCENDING),
+                    ("status", ASCENDING), ("hidden", ASCENDING), ("weight", ASCENDING)], name="corridor_filter"),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_created_at"),
+    ],
+    "offers": [
+        _id_index(),
+        IndexModel([("origin_country", ASCENDING), ("destination_country", ASCENDING), ("mode", ASCENDING),
+                    ("status", ASCENDING), ("hidden", ASCENDING), ("capacity_kg", ASCENDING)], name="corridor_filter"),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_created_at"),
+    ],
+    "contracts": [
+        _id_index(),
+        IndexModel([("shipper_id", ASCENDING), ("created_at", DESCENDING)], name="shipper_created_at"),
+        IndexModel([("carrier_id", ASCENDING), ("created_at", DESCENDING)], name="carrier_created_at"),
+        IndexModel([("request_id", ASCENDING)], name="request_id"),
+    ],
+    "conversations": [
+        _id_index(),
+        IndexModel([("participants", ASCENDING), ("last_message_at", DESCENDING), ("id", DESCENDING)], name="participants_last_message_at_id"),
+    ],
+    "refresh_tokens": [
+        IndexModel([("jti", ASCENDING)], name="jti_unique", unique=True),
+        IndexModel([("family_id", ASCENDING)], name="family_id"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "stats_counters": [
+        _id_index(),
+    ],
+    "blobs": [
+        _id_index(),
+        IndexModel([("key", ASCENDING)], name="key"),
+    ],
+    "revoked_tokens": [
+        _id_index(),
+        IndexModel([("created_at", ASCENDING)], name="created_at"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "used_legacy_refresh_tokens": [
+        IndexModel([("token_hash", ASCENDING)], name="token_hash_unique", unique=True),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "messages": [
+        _id_index(),
+        IndexModel([("conversation_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="conversation_created_at_id"),
+        IndexModel([("sender_id", ASCENDING)], name="sender_id"),
+    ],
+    "reviews": [
+        _id_index(),
+        IndexModel([("reviewee_id", ASCENDING)], name="reviewee_id"),
+        IndexModel([("contract_id", ASCENDING), ("reviewer_id", ASCENDING)], name="contract_reviewer"),
+    ],
+    "reports": [
+        _id_index(),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)], name="status_created_at"),
+    ],
+    "pro_verifications": [
+        _id_index(),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        IndexModel([("status", ASCENDING)], name="status"),
+    ],
+    "carrier_verifications": [
+        _id_index(),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)], name="status_created_at"),
+    ],
+    "payments": [
+        _id_index(),
+        IndexModel([("paypal_payment_id", ASCENDING)], name="paypal_payment_id"),
+        IndexModel([("contract_id", ASCENDING), ("status", ASCENDING)], name="contract_status"),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+    ],
+    "countries": [
+        _id_index(),
+        IndexModel([("code", ASCENDING)], name="code"),
+        IndexModel([("active", ASCENDING), ("name", ASCENDING)], name="active_name"),
+    ],
+    "audit_logs": [
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+    ],
+    "visitor_analytics": [
+        IndexModel([("timestamp", DESCENDING)], name="timestamp"),
+        IndexModel([("ingested_at", ASCENDING)], name="ingested_at"),
+    ],
+    "daily_stats": [
+        IndexModel([("date", ASCENDING)], name="date_unique", unique=True),
+    ],
+    "analytics_rollups": [
+        _id_index(),
+        IndexModel([("granularity", ASCENDING), ("period", DESCENDING)], name="granularity_period"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "visitor_ips": [
+        IndexModel([("ip", ASCENDING)], name="ip_unique", unique=True),
+        IndexModel([("visits", DESCENDING)], name="visits"),
+    ],
+    "visitor_pages": [
+        IndexModel([("page", ASCENDING)], name="page_unique", unique=True),
+        IndexModel([("visits", DESCENDING)], name="visits"),
+    ],
+    "platform_settings": [
+        IndexModel([("key", ASCENDING)], name="key_unique", unique=True),
+    ],
+    "ads_settings": [
+        IndexModel([("key", ASCENDING)], name="key_unique", unique=True),
+    ],
+}
+
+async def ensure_indexes(dry_run: bool = False, drop_unknown: bool = False) -> dict:
+    """Aligner les index sur le registre : créer les manquants, signaler (ou supprimer) ceux qui n'y sont plus
+
+    Renvoie {"missing", "unknown", "failed"}, noms d'index par collection. Un index
+    inconnu est le plus souvent un ancien index renommé ou élargi depuis : il ralentit
+    les écritures sans plus servir aux requêtes. Les index sont créés un par un : un
+    index unique impossible à créer (doublons en base) n'empêche pas les autres.
+    """
+    result = {"missing": {}, "unknown": {}, "failed": {}}
+    for collection_name, models in MONGO_INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        existing_keys = {tuple(tuple(k) for k in info["key"]) for info in existing.values()}
+        registry_keys = {tuple(m.document["key"].items()) for m in models}
+        todo = [m for m in models if tuple(m.document["key"].items()) not in existing_keys]
+        for m in models:
+            state = "missing" if m in todo else "present"
+            logger.info(f"[indexes] {collection_name}.{m.document['name']} {dict(m.document['key'])} {state}")
+        unknown = [
+            name for name, info in existing.items()
+            if name != "_id_" and tuple(tuple(k) for k in info["key"]) not in registry_keys
+        ]
+        if unknown:
+            result["unknown"][collection_name] = unknown
+            for name in unknown:
+                logger.warning(f"[indexes] {collection_name}.{name} is not in the registry"
+                               + (" (dropped)" if drop_unknown and not dry_run else ""))
+                if drop_unknown and not dry_run:
+                    try:
+                        await collection.drop_index(name)
+                    except PyMongoError as e:
+                        logger.error(f"[indexes] Failed to drop {collection_name}.{name}: {str(e)}")
+        if not todo:
+            continue
+        result["missing"][collection_name] = [m.document["name"] for m in todo]
+        if dry_run:
+            continue
+        for m in todo:
+            try:
+                await collection.create_indexes([m])
+            except PyMongoError as e:
+                result["failed"].setdefault(collection_name, []).append(m.document["name"])
+                logger.error(f"[indexes] Failed to create {collection_name}.{m.document['name']}: {str(e)}")
+    return result
+
+@app.on_event("startup")
+async def provision_indexes():
+    mode = os.environ.get("MONGO_INDEXES", "apply")
+    if mode == "off":
+        return
+    result = await ensure_indexes(dry_run=(mode == "dry-run"))
+    if result["missing"] and mode == "dry-run":
+        logger.warning(f"[indexes] Missing indexes: {result['missing']}")
+    if result["unknown"]:
+        logger.warning(f"[indexes] Indexes not in the registry (drop them with `indexes --drop-unknown`): {result['unknown']}")
+
+# ==================== UPLOADS GC ====================
+# Champs qui référencent des uploads : (collection, chemin)
+UPLOAD_REFERENCES = (
+    ("users", "avatar_url"),
+    ("users", "avatar_variants"),
+    ("messages", "sender.avatar_url"),
+    ("messages", "sender.avatar_variants"),
+    ("messages", "attachments"),
+    ("requests", "photos"),
+    ("requests", "photo_variants"),
+    ("pro_verifications", "documents"),
+    ("carrier_verifications", "identity_doc_url"),
+    ("carrier_verifications", "address_proof_url"),
+)
+
+async def count_blob_references() -> Dict[str, int]:
+    """Phase de marquage : nombre de références vers chaque blob, d'après les documents"""
+    refs: Dict[str, int] = {}
+    for collection_name, path in UPLOAD_REFERENCES:
+        async for doc in db[collection_name].find({path: {"$ne": None}}, {"_id": 0, path: 1}):
+            value = doc
+            for part in path.split("."):
+                value = (value or {}).get(part)
+            for url in upload_urls(value):
+                key = blob_key_from_url(url)
+                if key:
+                    refs[key] = refs.get(key, 0) + 1
+    return refs
+
+async def collect_upload_garbage(grace_seconds: float = 3600, dry_run: bool = False) -> dict:
+    """Marquer les blobs référencés, recaler les compteurs puis supprimer les orphelins"""
+    refs = await count_blob_references()
+    recounted = 0
+    async for blob in db.blobs.find({}, {"_id": 0, "id": 1, "key": 1, "refs": 1}):
+        actual = refs.get(blob["key"], 0)
+        if blob.get("refs") != actual:
+            recounted += 1
+            if not dry_run:
+                await db.blobs.update_one({"id": blob["id"]}, {"$set": {"refs": actual}})
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(
+        None, lambda: sweep_blobs(upload_storage, refs, grace_seconds=grace_seconds, dry_run=dry_run, spool_dir=UPLOAD_DIR)
+    )
+    removed = [key for key in result["removed"] if key.startswith("blobs/")]
+    if removed and not dry_run:
+        await db.blobs.delete_many({"key": {"$in": removed}})
+    result["referenced"] = len(refs)
+    result["recounted"] = recounted
+    return result
+
 # ==================== ROOT & STATIC ====================
 @api_router.get("/")
 async def root():
@@ -2705,7 +4266,81 @@ async def root():
 
 app.include_router(api_router)
 
-app.mount("/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
+# Blobs nommés par leur empreinte : leur contenu ne change jamais
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Préfixe d'une location nginx `internal` : nginx envoie alors le fichier (sendfile, Range)
+UPLOADS_ACCEL_REDIRECT = os.environ.get("UPLOADS_ACCEL_REDIRECT")
+UPLOAD_READ_CHUNK = 256 * 1024
+
+def stat_upload(key: str):
+    """(chemin, stat) du fichier local désigné par la clé, None s'il est absent ou hors de UPLOAD_DIR"""
+    if any(part.startswith(".") for part in key.split("/")):
+        return None
+    root = UPLOAD_DIR.resolve()
+    path = (UPLOAD_DIR / key).resolve()
+    if not path.is_relative_to(root) or not path.is_file():
+        return None
+    return path, path.stat()
+
+def read_upload_chunk(path: Path, offset: int, length: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+async def iter_upload_range(path: Path, start: int, end: int):
+    loop = asyncio.get_running_loop()
+    position = start
+    while position <= end:
+        chunk = await loop.run_in_executor(None, read_upload_chunk, path, position, min(UPLOAD_READ_CHUNK, end - position + 1))
+        if not chunk:
+            break
+        position += len(chunk)
+        yield chunk
+
+@app.api_route("/uploads/{key:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_upload(key: str, request: FastAPIRequest):
+    """Fichiers uploadés : cache immutable et ETag fort pour les blobs, requêtes Range, délégation nginx"""
+    etag = blob_etag(key)
+    if etag and upload_storage.backend != "local":
+        # Le navigateur peut réutiliser la redirection tant que l'URL pré-signée reste valide
+        return RedirectResponse(
+            upload_storage.presigned_url(key), status_code=307,
+            headers={"Cache-Control": f"private, max-age={max(0, upload_storage.presign_expires - 60)}"}
+        )
+    found = await asyncio.get_running_loop().run_in_executor(None, stat_upload, key)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Fichier non trouvé")
+    path, stat = found
+    if etag:
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        # Anciens noms de fichiers : revalidation à chaque vue, 304 tant que rien n'a changé
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        cache_control = "no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    content_type = content_type_for(key)
+    if UPLOADS_ACCEL_REDIRECT:
+        headers["X-Accel-Redirect"] = f"{UPLOADS_ACCEL_REDIRECT.rstrip('/')}/{key}"
+        return Response(headers=headers, media_type=content_type)
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() != etag:
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, stat.st_size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{stat.st_size}"})
+    if byte_range is None:
+        return FileResponse(path, media_type=content_type, headers=headers, stat_result=stat)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    if request.method == "HEAD":
+        return Response(status_code=206, headers=headers, media_type=content_type)
+    return StreamingResponse(iter_upload_range(path, start, end), status_code=206, headers=headers, media_type=content_type)
 
 app.add_middleware(
     CORSMiddleware,
@@ -2713,8 +4348,66 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-DB-Queries", "ETag", "Content-Range", "Accept-Ranges"],
 )
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    # Écrire les visites encore en file avant de fermer la connexion
+    await visit_queue.close()
+    if background_tasks:
+        await asyncio.wait(background_tasks, timeout=10)
     client.close()
+    password_hasher.shutdown()
+    image_pipeline.shutdown()
+
+# ==================== CLI ====================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Outils d'administration Waselni")
+    commands = parser.add_subparsers(dest="command", required=True)
+    indexes_cmd = commands.add_parser("indexes", help="Créer les index MongoDB du registre")
+    indexes_cmd.add_argument("--dry-run", action="store_true", help="Afficher le plan sans rien créer")
+    indexes_cmd.add_argument("--drop-unknown", action="store_true", help="Supprimer les index absents du registre")
+    gc_cmd = commands.add_parser("gc-uploads", help="Supprimer les blobs d'uploads qui ne sont plus référencés")
+    gc_cmd.add_argument("--dry-run", action="store_true", help="Lister les orphelins sans rien supprimer")
+    gc_cmd.add_argument("--grace", type=float, default=3600, help="Épargner les fichiers plus récents (secondes)")
+    commands.add_parser("reconcile-counters", help="Recalculer les compteurs du tableau de bord admin")
+    commands.add_parser("rollup-analytics", help="Agréger les visites en attente dans les statistiques horaires et journalières")
+    args = parser.parse_args(argv)
+
+    if args.command == "indexes":
+        result = asyncio.run(ensure_indexes(dry_run=args.dry_run, drop_unknown=args.drop_unknown))
+        for collection_name, names in result["missing"].items():
+            print(f"{collection_name}: {', '.join(names)}")
+        for collection_name, names in result["unknown"].items():
+            state = "dropped" if args.drop_unknown and not args.dry_run else "unknown"
+            print(f"{collection_name} ({state}): {', '.join(names)}")
+        for collection_name, names in result["failed"].items():
+            print(f"{collection_name} (failed): {', '.join(names)}")
+        if result["failed"] or (args.dry_run and result["missing"]):
+            return 1
+    elif args.command == "reconcile-counters":
+        result = asyncio.run(reconcile_stats_counters())
+        for name, value in result["counters"].items():
+            drift = result["drift"].get(name)
+            print(f"{name}: {value}" + (f" (corrigé de {drift:+d})" if drift else ""))
+    elif args.command == "rollup-analytics":
+        async def rollup_all():
+            total = 0
+            while True:
+                result = await visit_rollup.run()
+                total += result["visits"]
+                if not result["behind"]:
+                    return total
+        print(f"{asyncio.run(rollup_all())} visits aggregated")
+    elif args.command == "gc-uploads":
+        result = asyncio.run(collect_upload_garbage(grace_seconds=args.grace, dry_run=args.dry_run))
+        for key in result["removed"]:
+            print(f"{'orphan' if args.dry_run else 'removed'}: {key}")
+        print(f"{result['scanned']} blobs, {result['live']} referenced, {result['recent']} recent, "
+              f"{len(result['removed'])} {'orphans' if args.dry_run else 'removed'} ({result['bytes_freed']} bytes), "
+              f"{result['recounted']} counters fixed")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Structures probabilistes compactes.
+
+`BloomFilter` répond « absent » sans faux négatif : utilisé devant les
+collections de révocation pour que le cas courant (token non révoqué) ne
+coûte aucun aller-retour Mongo ; un « présent » doit être confirmé en base.
+
+`HyperLogLog` estime un nombre d'éléments distincts (IP des visiteurs) en
+mémoire constante. Ses registres se fusionnent par maximum, ce qui permet de
+les stocker en base sous forme creuse (`{"<index>": rang}`) et de les tenir à
+jour par `$max` sans relire le document.
+"""
+import hashlib
+import math
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+
+
+class BloomFilter:
+    """Filtre de Bloom à `capacity` éléments pour un taux de faux positifs `error_rate`"""
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _positions(self, item: str) -> Iterable[int]:
+        # Double hachage (Kirsch-Mitzenmacher) à partir d'un seul condensat
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def saturated(self) -> bool:
+        """Au-delà de la capacité, le taux de faux positifs n'est plus garanti : reconstruire le filtre"""
+        return self.count > self.capacity
+
+
+class HyperLogLog:
+    """Estimateur de cardinalité à 2^`precision` registres (erreur type ≈ 1,04 / √m)"""
+
+    def __init__(self, precision: int = 12, registers: Optional[Mapping[str, int]] = None):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision doit être comprise entre 4 et 16")
+        self.precision = precision
+        self.m = 1 << precision
+        self._registers = bytearray(self.m)
+        if registers:
+            self.update(registers)
+
+    def position(self, item: str) -> Tuple[int, int]:
+        """(index du registre, rang) de `item` : position du premier bit à 1 après l'index"""
+        value = int.from_bytes(hashlib.blake2b(item.encode(), digest_size=8).digest(), "little")
+        index = value & (self.m - 1)
+        bits = 64 - self.precision
+        rank = bits - (value >> self.precision).bit_length() + 1
+        return index, rank
+
+    def add(self, item: str):
+        index, rank = self.position(item)
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def update(self, registers: Mapping[str, int]):
+        """Fusionner des registres creux (clés en chaîne, comme stockés en base)"""
+        for index, rank in registers.items():
+            index = int(index)
+            if rank > self._registers[index]:
+                self._registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        if other.precision != self.precision:
+            raise ValueError("Fusion de HyperLogLog de précisions différentes")
+        self._registers = bytearray(max(a, b) for a, b in zip(self._registers, other._registers))
+
+    def registers(self) -> Dict[str, int]:
+        """Registres non nuls, sous forme creuse sérialisable"""
+        return {str(index): rank for index, rank in enumerate(self._registers) if rank}
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -rank for rank in self._registers)
+        zeros = self._registers.count(0)
+        # Petites cardinalités : le comptage linéaire est plus précis
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
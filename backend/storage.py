@@ -0,0 +1,163 @@
+"""
+Stockage des fichiers uploadés : disque local ou objet compatible S3.
+
+Les deux pilotes exposent la même interface synchrone (à appeler depuis un
+pool de threads) sur des clés relatives du type `blobs/ab/cd/<sha>.<ext>` :
+`put_file` publie un fichier temporaire déjà complet, `read`, `exists`, `touch`,
+`delete`, `list` (clé, taille, date de modification) et `presigned_url`.
+
+`LocalStorage` renomme le fichier dans son répertoire racine, servi par
+l'application. `S3Storage` envoie le fichier par `upload_file` (multipart
+au-delà de `multipart_threshold`) et renvoie des URL pré-signées : le client
+télécharge directement depuis le stockage, sans passer par l'API.
+`S3_ENDPOINT_URL` permet de viser MinIO ou tout autre service compatible.
+"""
+import os
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+
+class LocalStorage:
+    """Fichiers rangés sous `root`, servis par l'application"""
+
+    backend = "local"
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path(self, key: str) -> Path:
+        return self.root / key
+
+    def put_file(self, tmp_path: Path, key: str, content_type: str):
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, path)
+
+    def read(self, key: str) -> bytes:
+        return (self.root / key).read_bytes()
+
+    def exists(self, key: str) -> bool:
+        return (self.root / key).is_file()
+
+    def touch(self, key: str):
+        os.utime(self.root / key)
+
+    def delete(self, key: str):
+        (self.root / key).unlink(missing_ok=True)
+        # Retirer les répertoires de répartition devenus vides
+        parent = (self.root / key).parent
+        while parent != self.root:
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+            parent = parent.parent
+
+    def list(self, prefix: str = "") -> Iterator[Tuple[str, int, float]]:
+        base = self.root / prefix
+        if not base.is_dir():
+            return
+        for path in base.rglob("*"):
+            if path.is_file():
+                stat = path.stat()
+                yield path.relative_to(self.root).as_posix(), stat.st_size, stat.st_mtime
+
+    def presigned_url(self, key: str, expires_in: int = 3600) -> Optional[str]:
+        # Pas d'URL directe : le fichier est servi par /uploads
+        return None
+
+
+class S3Storage:
+    """Objets dans un bucket S3 (ou compatible : MinIO, Ceph, R2...)"""
+
+    backend = "s3"
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region_name: Optional[str] = None, client=None,
+                 multipart_threshold: int = 8 * 1024 * 1024, multipart_chunksize: int = 8 * 1024 * 1024,
+                 presign_expires: int = 3600):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND=s3 nécessite le paquet 'boto3'") from e
+        self.bucket = bucket
+        self.prefix = prefix
+        self.presign_expires = presign_expires
+        self._s3 = client or boto3.client("s3", endpoint_url=endpoint_url, region_name=region_name)
+        self._transfer = TransferConfig(multipart_threshold=multipart_threshold, multipart_chunksize=multipart_chunksize)
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def put_file(self, tmp_path: Path, key: str, content_type: str):
+        self._s3.upload_file(
+            str(tmp_path), self.bucket, self._key(key),
+            ExtraArgs={"ContentType": content_type},
+            Config=self._transfer,
+        )
+        Path(tmp_path).unlink(missing_ok=True)
+
+    def read(self, key: str) -> bytes:
+        from botocore.exceptions import ClientError
+        try:
+            return self._s3.get_object(Bucket=self.bucket, Key=self._key(key))["Body"].read()
+        except ClientError as e:
+            # Même erreur que LocalStorage pour un blob absent (supprimé entre-temps)
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            self._s3.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def touch(self, key: str):
+        # Une copie sur place avec remplacement des métadonnées met à jour LastModified
+        head = self._s3.head_object(Bucket=self.bucket, Key=self._key(key))
+        self._s3.copy_object(
+            Bucket=self.bucket, Key=self._key(key),
+            CopySource={"Bucket": self.bucket, "Key": self._key(key)},
+            MetadataDirective="REPLACE",
+            ContentType=head.get("ContentType", "application/octet-stream"),
+            Metadata=head.get("Metadata", {}),
+        )
+
+    def delete(self, key: str):
+        self._s3.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def list(self, prefix: str = "") -> Iterator[Tuple[str, int, float]]:
+        paginator = self._s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for obj in page.get("Contents", []):
+                yield obj["Key"][len(self.prefix):], obj["Size"], obj["LastModified"].timestamp()
+
+    def presigned_url(self, key: str, expires_in: Optional[int] = None) -> Optional[str]:
+        return self._s3.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(key)},
+            ExpiresIn=expires_in or self.presign_expires,
+        )
+
+
+def storage_from_env(upload_dir: Path, environ=os.environ):
+    """Pilote choisi par STORAGE_BACKEND (local par défaut)"""
+    if environ.get("STORAGE_BACKEND", "local") != "s3":
+        return LocalStorage(upload_dir)
+    bucket = environ.get("S3_BUCKET")
+    if not bucket:
+        raise RuntimeError("STORAGE_BACKEND=s3 nécessite S3_BUCKET")
+    return S3Storage(
+        bucket,
+        prefix=environ.get("S3_PREFIX", ""),
+        endpoint_url=environ.get("S3_ENDPOINT_URL") or None,
+        region_name=environ.get("S3_REGION") or None,
+        multipart_threshold=int(environ.get("S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024))),
+        presign_expires=int(environ.get("S3_PRESIGN_EXPIRES", "3600")),
+    )
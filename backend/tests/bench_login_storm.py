@@ -0,0 +1,95 @@
+"""
+Benchmark: latency of unrelated endpoints during a login storm.
+
+Fires concurrent logins (bcrypt-bound) while a probe thread measures the
+latency of a cheap endpoint, then prints p50/p99 for both and the password
+hasher metrics reported by /api/admin/metrics. With bcrypt on the event loop
+the probe p99 grows with the storm; with the dedicated pool it stays flat.
+
+The server must run with login throttling relaxed (e.g. RATE_LIMIT_LOGIN_IP=100000/60),
+otherwise the storm is answered with 429 before reaching bcrypt.
+
+Usage:
+    REACT_APP_BACKEND_URL=http://localhost:8001 python tests/bench_login_storm.py --logins 200 --concurrency 32
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+ADMIN_EMAIL = "admin@logimatch.com"
+ADMIN_PASSWORD = "admin123"
+USER_EMAIL = "marie@example.com"
+USER_PASSWORD = "password123"
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    response = fn()
+    return (time.perf_counter() - start) * 1000, response.status_code
+
+
+def login():
+    return requests.post(f"{BASE_URL}/api/auth/login", json={"email": USER_EMAIL, "password": USER_PASSWORD})
+
+
+def probe(path, stop, samples):
+    session = requests.Session()
+    while not stop.is_set():
+        elapsed, _ = timed(lambda: session.get(f"{BASE_URL}{path}"))
+        samples.append(elapsed)
+        time.sleep(0.01)
+
+
+def report(label, samples):
+    print(f"{label:<16} n={len(samples):<5} p50={percentile(samples, 50):8.1f} ms  "
+          f"p99={percentile(samples, 99):8.1f} ms  max={max(samples, default=0):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--probe-path", default="/api/countries")
+    args = parser.parse_args()
+
+    baseline = [timed(lambda: requests.get(f"{BASE_URL}{args.probe_path}"))[0] for _ in range(50)]
+
+    stop, probe_samples = threading.Event(), []
+    prober = threading.Thread(target=probe, args=(args.probe_path, stop, probe_samples))
+    prober.start()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda _: timed(login), range(args.logins)))
+    stop.set()
+    prober.join()
+
+    login_samples = [elapsed for elapsed, status in results if status == 200]
+    statuses = statistics.multimode(status for _, status in results)
+    report("probe (idle)", baseline)
+    report("probe (storm)", probe_samples)
+    report("login", login_samples)
+    print(f"login statuses: {sorted(set(s for _, s in results))} (most common {statuses})")
+
+    admin = requests.post(f"{BASE_URL}/api/auth/login", json={"email": ADMIN_EMAIL, "password": ADMIN_PASSWORD})
+    if admin.status_code == 200:
+        headers = {"Authorization": f"Bearer {admin.json()['access_token']}"}
+        metrics = requests.get(f"{BASE_URL}/api/admin/metrics", headers=headers)
+        if metrics.status_code == 200:
+            print(f"password hasher: {metrics.json()['password_hasher']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Backend API Tests for the admin dashboard bootstrap endpoint:
+- All sections in one call, same payloads as the dedicated routes
+- Section selection and validation
+- Admin only
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+ADMIN_EMAIL = "admin@logimatch.com"
+ADMIN_PASSWORD = "admin123"
+USER_EMAIL = "marie@example.com"
+USER_PASSWORD = "password123"
+
+SECTIONS = {
+    "stats": "/api/admin/stats",
+    "users": "/api/admin/users",
+    "verifications": "/api/admin/verifications",
+    "carrier_verifications": "/api/admin/carrier-verifications",
+    "reports": "/api/admin/reports",
+    "requests": "/api/admin/requests",
+    "offers": "/api/admin/offers",
+    "countries": "/api/admin/countries",
+    "settings": "/api/admin/settings",
+    "payments": "/api/admin/payments",
+    "analytics": "/api/admin/analytics?days=30",
+    "ads_settings": "/api/admin/ads-settings",
+}
+
+
+def auth_headers(email, password):
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={"email": email, "password": password})
+    if response.status_code != 200:
+        pytest.skip(f"Login failed for {email}: {response.text}")
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+class TestAdminDashboard:
+    """GET /api/admin/dashboard"""
+
+    @pytest.fixture
+    def admin(self):
+        return auth_headers(ADMIN_EMAIL, ADMIN_PASSWORD)
+
+    def test_all_sections(self, admin):
+        response = requests.get(f"{BASE_URL}/api/admin/dashboard", headers=admin)
+        assert response.status_code == 200, f"Expected 200, got {response.status_code}: {response.text}"
+        data = response.json()
+        assert "errors" not in data, data.get("errors")
+        assert set(data) == set(SECTIONS)
+
+    def test_sections_match_dedicated_routes(self, admin):
+        data = requests.get(f"{BASE_URL}/api/admin/dashboard?sections=users,reports,countries", headers=admin).json()
+        assert set(data) == {"users", "reports", "countries"}
+        for name in data:
+            direct = requests.get(f"{BASE_URL}{SECTIONS[name]}", headers=admin).json()
+            assert data[name] == direct, f"Section {name} differs from {SECTIONS[name]}"
+
+    def test_unknown_section_rejected(self, admin):
+        response = requests.get(f"{BASE_URL}/api/admin/dashboard?sections=stats,nope", headers=admin)
+        assert response.status_code == 400
+
+    def test_admin_only(self):
+        user = auth_headers(USER_EMAIL, USER_PASSWORD)
+        response = requests.get(f"{BASE_URL}/api/admin/dashboard", headers=user)
+        assert response.status_code == 403
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
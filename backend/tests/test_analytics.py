@@ -0,0 +1,190 @@
+"""
+Unit Tests for the visit rollups (backend/analytics.py), run against mongomock:
+- First pass from an empty watermark
+- Retry after a failed bulk write without double counting
+- Takeover of a window whose lease expired
+- Catch-up across several one-day windows (`behind`)
+"""
+import asyncio
+import sys
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from pymongo.errors import BulkWriteError  # noqa: E402
+
+from analytics import ANALYTICS_TOTALS_ID, VisitRollup  # noqa: E402
+
+NOW = datetime.now(timezone.utc)
+
+
+def make_visit(ingested_hours_ago, ip="10.0.0.1", page="/"):
+    at = (NOW - timedelta(hours=ingested_hours_ago)).isoformat()
+    return {"id": str(uuid.uuid4()), "ip": ip, "page": page, "timestamp": at, "ingested_at": at}
+
+
+def new_db():
+    return mongomock_motor.AsyncMongoMockClient()[f"analytics_{uuid.uuid4().hex}"]
+
+
+class FlakyDb:
+    """Base dont la première `bulk_write` sur une collection échoue"""
+
+    def __init__(self, db, collection):
+        self._db = db
+        self._collection = collection
+        self.failures = 1
+
+    def __getattr__(self, name):
+        collection = getattr(self._db, name)
+        return FlakyCollection(self, collection) if name == self._collection else collection
+
+
+class FlakyCollection:
+    def __init__(self, owner, collection):
+        self._owner = owner
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    async def bulk_write(self, requests, ordered=True):
+        if self._owner.failures:
+            self._owner.failures -= 1
+            raise BulkWriteError({"writeErrors": [], "nInserted": 0})
+        return await self._collection.bulk_write(requests, ordered=ordered)
+
+
+async def drain(rollup):
+    runs = 0
+    while True:
+        result = await rollup.run()
+        runs += 1
+        if not result["behind"]:
+            return runs
+
+
+async def totals(db):
+    return await db.analytics_rollups.find_one({"id": ANALYTICS_TOTALS_ID}, {"_id": 0})
+
+
+async def day_visits(db):
+    docs = await db.analytics_rollups.find({"granularity": "day"}, {"_id": 0}).to_list(None)
+    return sum(doc["visits"] for doc in docs)
+
+
+class TestVisitRollup:
+    """Windows are claimed, applied once and advance the watermark"""
+
+    def test_first_run_from_empty_watermark(self):
+        async def scenario():
+            db = new_db()
+            rollup = VisitRollup(db, lag_seconds=0)
+            assert await rollup.run() == {"visits": 0, "behind": False}
+
+            visits = [
+                make_visit(2, ip="10.0.0.1", page="/"),
+                make_visit(1, ip="10.0.0.2", page="/"),
+                make_visit(1, ip="10.0.0.1", page="/offers"),
+            ]
+            await db.visitor_analytics.insert_many(visits)
+            assert await rollup.run() == {"visits": 3, "behind": False}
+
+            state = await totals(db)
+            assert state["visits"] == 3
+            assert "pending" not in state
+            assert state["watermark"] > max(visit["ingested_at"] for visit in visits)
+            assert await day_visits(db) == 3
+            ip = await db.visitor_ips.find_one({"ip": "10.0.0.1"}, {"_id": 0})
+            assert ip["visits"] == 2
+            page = await db.visitor_pages.find_one({"page": "/"}, {"_id": 0})
+            assert page["visits"] == 2
+
+            # Rien de nouveau : la passe suivante n'agrège rien
+            assert (await rollup.run())["visits"] == 0
+            assert (await totals(db))["visits"] == 3
+
+        asyncio.run(scenario())
+
+    def test_retry_after_failed_bulk_write_does_not_double_count(self):
+        async def scenario():
+            db = new_db()
+            await db.visitor_analytics.insert_many(
+                [make_visit(1, ip=f"10.0.0.{i % 3}", page=f"/p{i % 2}") for i in range(10)]
+            )
+            flaky = FlakyDb(db, "visitor_ips")
+            rollup = VisitRollup(flaky, lag_seconds=0)
+
+            # Les agrégats horaires/journaliers et les pages sont écrits, pas les IP
+            with pytest.raises(BulkWriteError):
+                await rollup.run()
+            state = await totals(db)
+            assert state["pending"]["lease_until"] is None
+            assert state["watermark"] is None
+            assert await day_visits(db) == 10
+
+            # La fenêtre rendue est reprise aussitôt, avec les mêmes bornes
+            assert (await rollup.run())["visits"] == 10
+            assert (await totals(db))["visits"] == 10
+            assert await day_visits(db) == 10
+            pages = await db.visitor_pages.find({}, {"_id": 0}).to_list(None)
+            assert sum(page["visits"] for page in pages) == 10
+            ips = await db.visitor_ips.find({}, {"_id": 0}).to_list(None)
+            assert sum(ip["visits"] for ip in ips) == 10
+
+        asyncio.run(scenario())
+
+    def test_expired_lease_is_taken_over(self):
+        async def scenario():
+            db = new_db()
+            await db.visitor_analytics.insert_many([make_visit(1) for _ in range(4)])
+            crashed = VisitRollup(db, lag_seconds=0)
+            survivor = VisitRollup(db, lag_seconds=0)
+
+            window = await crashed.claim()
+            assert window is not None
+            # Bail en cours : personne d'autre ne prend la fenêtre
+            assert await survivor.claim() is None
+
+            expired = (NOW - timedelta(minutes=1)).isoformat()
+            await db.analytics_rollups.update_one(
+                {"id": ANALYTICS_TOTALS_ID}, {"$set": {"pending.lease_until": expired}}
+            )
+            taken = await survivor.claim()
+            assert (taken["start"], taken["end"]) == (window["start"], window["end"])
+            assert await survivor.apply(taken) == 4
+
+            # Le worker qu'on croyait arrêté termine en retard : rien n'est compté deux fois
+            assert await crashed.apply(window) == 0
+            assert (await totals(db))["visits"] == 4
+            assert await day_visits(db) == 4
+
+        asyncio.run(scenario())
+
+    def test_behind_catches_up_one_day_at_a_time(self):
+        async def scenario():
+            db = new_db()
+            visits = [make_visit(hours) for hours in (24 * 3 + 5, 24 * 2 + 3, 24 + 1, 2)]
+            await db.visitor_analytics.insert_many(visits)
+            rollup = VisitRollup(db, lag_seconds=0)
+
+            first = await rollup.run()
+            assert first == {"visits": 1, "behind": True}
+            runs = await drain(rollup)
+
+            assert runs >= 3
+            assert (await totals(db))["visits"] == 4
+            assert await day_visits(db) == 4
+            assert (await rollup.run())["visits"] == 0
+
+        asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
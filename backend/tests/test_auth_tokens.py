@@ -0,0 +1,95 @@
+"""
+Backend API Tests for access-token claims and versioning:
+- Access tokens carry role, status and token version claims
+- Logout and refresh honour the token version
+- Refresh-token rotation, reuse detection and per-session logout
+"""
+import base64
+import json
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+USER_EMAIL = "transport.pro@example.com"
+USER_PASSWORD = "password123"
+
+
+def claims(token):
+    payload = token.split('.')[1]
+    return json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+
+
+@pytest.fixture
+def session():
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={"email": USER_EMAIL, "password": USER_PASSWORD})
+    if response.status_code != 200:
+        pytest.skip(f"Login failed: {response.text}")
+    return response.json()
+
+
+class TestTokenClaims:
+    """Authorization claims embedded in access tokens"""
+
+    def test_access_token_claims(self, session):
+        payload = claims(session['access_token'])
+        assert payload['sub'] == session['user']['id']
+        assert payload['role'] == session['user']['role']
+        assert payload['status'] == "ACTIVE"
+        assert isinstance(payload['ver'], int)
+
+    def test_refresh_token_rejected_as_access(self, session):
+        headers = {"Authorization": f"Bearer {session['refresh_token']}"}
+        response = requests.get(f"{BASE_URL}/api/contracts", headers=headers)
+        assert response.status_code in (401, 403)
+
+
+class TestRefreshRotation:
+    """Each refresh token is single-use; replaying one revokes the session"""
+
+    def refresh(self, token):
+        return requests.post(f"{BASE_URL}/api/auth/refresh", headers={"Authorization": f"Bearer {token}"})
+
+    def test_refresh_rotates(self, session):
+        response = self.refresh(session['refresh_token'])
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data['refresh_token'] != session['refresh_token']
+        assert claims(data['refresh_token'])['fam'] == claims(session['refresh_token'])['fam']
+
+    def test_reuse_revokes_family(self, session):
+        rotated = self.refresh(session['refresh_token']).json()
+
+        assert self.refresh(session['refresh_token']).status_code == 401
+
+        assert self.refresh(rotated['refresh_token']).status_code == 401
+        headers = {"Authorization": f"Bearer {rotated['access_token']}"}
+        assert requests.get(f"{BASE_URL}/api/contracts", headers=headers).status_code == 401
+
+
+class TestTokenRevocation:
+    """Logout revokes the current session only"""
+
+    def test_logout_revokes_tokens(self, session):
+        headers = {"Authorization": f"Bearer {session['access_token']}"}
+        assert requests.get(f"{BASE_URL}/api/contracts", headers=headers).status_code == 200
+
+        assert requests.post(f"{BASE_URL}/api/auth/logout", headers=headers).status_code == 200
+
+        assert requests.get(f"{BASE_URL}/api/contracts", headers=headers).status_code == 401
+        refresh = requests.post(f"{BASE_URL}/api/auth/refresh",
+                                headers={"Authorization": f"Bearer {session['refresh_token']}"})
+        assert refresh.status_code == 401
+
+    def test_logout_keeps_other_sessions(self, session):
+        other = requests.post(f"{BASE_URL}/api/auth/login", json={"email": USER_EMAIL, "password": USER_PASSWORD}).json()
+        headers = {"Authorization": f"Bearer {session['access_token']}"}
+        assert requests.post(f"{BASE_URL}/api/auth/logout", headers=headers).status_code == 200
+
+        other_headers = {"Authorization": f"Bearer {other['access_token']}"}
+        assert requests.get(f"{BASE_URL}/api/contracts", headers=other_headers).status_code == 200
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,119 @@
+"""
+Unit Tests for the buffered batch writer (backend/batching.py):
+- Items are flushed in batches, by size or after the interval
+- A full queue drops (or waits, with backpressure) and counts drops
+- close() drains what is left; a failing flush is counted, not fatal
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+
+from batching import BatchQueue  # noqa: E402
+
+
+class Sink:
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.batches = []
+        self.delay = delay
+        self.fail = fail
+
+    async def __call__(self, batch):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("mongo down")
+        self.batches.append(list(batch))
+
+
+class TestBatchQueue:
+    """Visit ingestion buffer"""
+
+    def test_batches_by_size_and_interval(self):
+        async def scenario():
+            sink = Sink()
+            queue = BatchQueue(sink, batch_size=10, interval=0.05)
+            for i in range(25):
+                assert await queue.put(i)
+            await asyncio.sleep(0.2)
+            stats = queue.stats()
+            await queue.close()
+            return sink.batches, stats
+
+        batches, stats = asyncio.run(scenario())
+        assert [len(b) for b in batches] == [10, 10, 5]
+        assert sum(batches, []) == list(range(25))
+        assert stats["flushed"] == 25 and stats["batches"] == 3 and stats["queued"] == 0
+
+    def test_put_does_not_wait_for_flush(self):
+        async def scenario():
+            sink = Sink(delay=0.1)
+            queue = BatchQueue(sink, batch_size=1, interval=0.01)
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            for i in range(5):
+                await queue.put(i)
+            elapsed = loop.time() - started
+            await queue.close()
+            return elapsed, sink.batches
+
+        elapsed, batches = asyncio.run(scenario())
+        assert elapsed < 0.1
+        assert len(batches) == 5
+
+    def test_full_queue_drops(self):
+        async def scenario():
+            sink = Sink(delay=0.2)
+            queue = BatchQueue(sink, maxsize=3, batch_size=1, interval=0.01)
+            results = [await queue.put(i) for i in range(10)]
+            await queue.close()
+            return results, queue.stats(), sink.batches
+
+        results, stats, batches = asyncio.run(scenario())
+        # put ne cède pas la main : la tâche de fond n'a encore rien retiré
+        assert results == [True] * 3 + [False] * 7
+        assert stats["dropped"] == 7 and stats["enqueued"] == 3
+        assert len(batches) == 3
+
+    def test_backpressure_waits_for_room(self):
+        async def scenario():
+            sink = Sink(delay=0.02)
+            queue = BatchQueue(sink, maxsize=2, batch_size=1, interval=0.01, put_timeout=1.0)
+            results = [await queue.put(i) for i in range(6)]
+            await queue.close()
+            return results, queue.stats()
+
+        results, stats = asyncio.run(scenario())
+        assert all(results)
+        assert stats["dropped"] == 0 and stats["flushed"] == 6
+
+    def test_close_drains_and_rejects(self):
+        async def scenario():
+            sink = Sink()
+            queue = BatchQueue(sink, batch_size=100, interval=60)
+            for i in range(7):
+                await queue.put(i)
+            await queue.close()
+            accepted = await queue.put("late")
+            return sink.batches, accepted, queue.stats()
+
+        batches, accepted, stats = asyncio.run(scenario())
+        assert batches == [list(range(7))]
+        assert accepted is False and stats["dropped"] == 1
+
+    def test_failed_flush_is_counted(self):
+        async def scenario():
+            queue = BatchQueue(Sink(fail=True), batch_size=5, interval=0.01)
+            for i in range(5):
+                await queue.put(i)
+            await queue.close()
+            return queue.stats()
+
+        stats = asyncio.run(scenario())
+        assert stats["failed"] == 5 and stats["flushed"] == 0 and stats["batches"] == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
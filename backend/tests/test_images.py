@@ -0,0 +1,118 @@
+"""
+Unit Tests for the image variant pipeline (backend/images.py):
+- One variant per size, longest side bounded, no upscaling
+- EXIF orientation applied, metadata stripped (variants and full-size originals)
+- Rendering through the process pool
+"""
+import asyncio
+import io
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+
+Image = pytest.importorskip("PIL.Image")
+
+from images import ImagePipeline, InvalidImage, render_variants, strip_metadata  # noqa: E402
+
+
+def jpeg_with_exif(width, height, orientation=1, fmt="JPEG"):
+    image = Image.new("RGB", (width, height), (200, 30, 30))
+    exif = Image.Exif()
+    exif[0x0112] = orientation  # Orientation
+    exif[0x010F] = "PhoneMaker"  # Make
+    exif[0x8825] = {1: "N", 2: (48.0, 51.0, 24.0)}  # GPSInfo
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+class TestRenderVariants:
+    """Resizing and metadata stripping"""
+
+    def test_sizes_and_no_upscaling(self):
+        variants = render_variants(jpeg_with_exif(2000, 1000))
+        assert sorted(variants) == [64, 256, 1024]
+        assert (variants[64]["width"], variants[64]["height"]) == (64, 32)
+        assert (variants[1024]["width"], variants[1024]["height"]) == (1024, 512)
+
+        small = render_variants(jpeg_with_exif(100, 50))
+        assert (small[1024]["width"], small[1024]["height"]) == (100, 50)
+
+    def test_exif_orientation_applied_and_stripped(self):
+        # Orientation 6 : l'image doit être tournée de 90°
+        variants = render_variants(jpeg_with_exif(400, 200, orientation=6), sizes=(256,))
+        variant = variants[256]
+        assert (variant["width"], variant["height"]) == (128, 256)
+        with Image.open(io.BytesIO(variant["data"])) as image:
+            assert not image.getexif()
+            assert image.format in ("WEBP", "JPEG")
+            assert variant["content_type"] == f"image/{image.format.lower()}"
+
+    def test_transparency_kept_in_webp(self):
+        image = Image.new("RGBA", (300, 300), (0, 0, 0, 0))
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG")
+        variant = render_variants(buffer.getvalue(), sizes=(64,))[64]
+        with Image.open(io.BytesIO(variant["data"])) as out:
+            if out.format == "WEBP":
+                assert out.mode == "RGBA"
+
+
+class TestStripMetadata:
+    """Full-size originals re-encoded before publication"""
+
+    @pytest.mark.parametrize("fmt", ["JPEG", "PNG"])
+    def test_original_keeps_size_and_loses_exif(self, fmt):
+        raw = jpeg_with_exif(400, 200, orientation=6, fmt=fmt)
+        assert b"PhoneMaker" in raw
+        clean = strip_metadata(raw)
+        assert b"PhoneMaker" not in clean["data"]
+        with Image.open(io.BytesIO(clean["data"])) as image:
+            assert image.format == fmt and clean["content_type"] == f"image/{fmt.lower()}"
+            assert image.size == (200, 400)
+            assert not image.getexif()
+
+    def test_undecodable_content_raises_invalid_image(self):
+        with pytest.raises(InvalidImage):
+            strip_metadata(b"\xff\xd8\xff" + b"\x00" * 64)
+
+    def test_gif_returned_unchanged(self):
+        buffer = io.BytesIO()
+        Image.new("P", (10, 10)).save(buffer, "GIF")
+        assert strip_metadata(buffer.getvalue()) == {"data": buffer.getvalue(), "content_type": "image/gif"}
+
+
+class TestImagePipeline:
+    """Rendering in the process pool"""
+
+    def test_render_in_process_pool(self):
+        async def scenario():
+            pipeline = ImagePipeline(workers=1, sizes=(64,))
+            try:
+                variants = await pipeline.render(jpeg_with_exif(640, 480))
+            finally:
+                pipeline.shutdown()
+            return variants, pipeline.stats()
+
+        variants, stats = asyncio.run(scenario())
+        assert variants[64]["width"] == 64
+        assert stats["completed"] == 1 and stats["failed"] == 0
+
+    def test_invalid_image_counts_as_failure(self):
+        async def scenario():
+            pipeline = ImagePipeline(workers=1)
+            try:
+                with pytest.raises(Exception):
+                    await pipeline.render(b"not an image")
+            finally:
+                pipeline.shutdown()
+            return pipeline.stats()
+
+        assert asyncio.run(scenario())["failed"] == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,265 @@
+"""
+Unit Tests for the matching engine (backend/matching.py):
+- Corridor index filtering (capacity, deadline/arrival compatibility)
+- Incremental updates and reloads racing with writes
+- Lookup latency on a large index
+- Ranking and vectorized scoring benchmark
+"""
+import sys
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+
+from matching import CorridorIndex, rank_offer_columns, rank_offers, score_arrays, top_order  # noqa: E402
+
+NOW = datetime.now(timezone.utc)
+
+
+def make_offer(capacity=50, arrival_days=5, **kwargs):
+    offer = {
+        "id": str(uuid.uuid4()),
+        "user_id": "carrier",
+        "origin_country": "France",
+        "destination_country": "Tunisie",
+        "mode": "TERRESTRIAL",
+        "capacity_kg": capacity,
+        "price_per_kg": 8.0,
+        "departure_date": (NOW + timedelta(days=arrival_days - 2)).isoformat(),
+        "arrival_date": (NOW + timedelta(days=arrival_days)).isoformat(),
+        "status": "ACTIVE",
+        "hidden": False,
+    }
+    offer.update(kwargs)
+    return offer
+
+
+def make_request(weight=10, deadline_days=14, **kwargs):
+    req = {
+        "id": str(uuid.uuid4()),
+        "user_id": "shipper",
+        "origin_country": "France",
+        "destination_country": "Tunisie",
+        "mode": "TERRESTRIAL",
+        "weight": weight,
+        "deadline": (NOW + timedelta(days=deadline_days)).isoformat(),
+        "status": "OPEN",
+        "hidden": False,
+    }
+    req.update(kwargs)
+    return req
+
+
+class TestCorridorIndex:
+    """Filtering rules of the corridor index"""
+
+    def test_match_offers_filters_capacity_and_dates(self):
+        small = make_offer(capacity=5)
+        late = make_offer(capacity=100, arrival_days=30)
+        good = make_offer(capacity=20)
+        other_corridor = make_offer(capacity=100, mode="AIR")
+        index = CorridorIndex()
+        index.load([small, late, good, other_corridor], [])
+
+        matches = index.match_offers(make_request(weight=10, deadline_days=14))
+        assert [o["id"] for o in matches] == [good["id"]]
+
+    def test_match_offers_sorted_by_capacity(self):
+        offers = [make_offer(capacity=c) for c in (80, 15, 40)]
+        index = CorridorIndex()
+        index.load(offers, [])
+
+        matches = index.match_offers(make_request(weight=10))
+        assert [o["capacity_kg"] for o in matches] == [15, 40, 80]
+
+    def test_match_requests_filters_weight_and_deadline(self):
+        heavy = make_request(weight=60)
+        too_soon = make_request(weight=5, deadline_days=2)
+        good = make_request(weight=5)
+        closed = make_request(weight=5, status="ACCEPTED")
+        index = CorridorIndex()
+        index.load([], [heavy, too_soon, good, closed])
+
+        matches = index.match_requests(make_offer(capacity=50, arrival_days=5))
+        assert [r["id"] for r in matches] == [good["id"]]
+
+    def test_incremental_updates(self):
+        index = CorridorIndex()
+        index.load([], [])
+        offer = make_offer(capacity=20)
+        req = make_request(weight=10)
+
+        index.upsert_offer(offer)
+        assert len(index.match_offers(req)) == 1
+
+        index.upsert_offer({**offer, "capacity_kg": 5})
+        assert index.match_offers(req) == []
+
+        index.upsert_offer({**offer, "capacity_kg": 30, "status": "PAUSED"})
+        assert index.match_offers(req) == []
+
+        index.upsert_offer({**offer, "capacity_kg": 30})
+        assert len(index.match_offers(req)) == 1
+
+        index.remove_offer(offer["id"])
+        assert index.match_offers(req) == []
+
+    def test_reload_replays_changes_made_during_the_read(self):
+        stale = make_offer(capacity=20)
+        added = make_offer(capacity=30)
+        removed = make_request(weight=5)
+        index = CorridorIndex()
+        index.load([stale], [removed])
+
+        # Snapshot read before the writes below
+        index.begin_load()
+        snapshot = ([dict(stale)], [dict(removed)])
+        index.upsert_offer({**stale, "status": "PAUSED"})
+        index.upsert_offer(added)
+        index.remove_request(removed["id"])
+        index.load(*snapshot)
+
+        req = make_request(weight=10)
+        assert [o["id"] for o in index.match_offers(req)] == [added["id"]]
+        assert index.match_requests(make_offer(capacity=50)) == []
+
+        # The journal is cleared: a plain reload replays nothing
+        index.load([stale], [])
+        assert [o["id"] for o in index.match_offers(req)] == [stale["id"]]
+
+    def test_returned_documents_are_copies(self):
+        offer = make_offer()
+        index = CorridorIndex()
+        index.load([offer], [])
+
+        index.match_offers(make_request())[0]["user"] = {"first_name": "X"}
+        assert "user" not in index.match_offers(make_request())[0]
+
+
+class TestCorridorIndexLatency:
+    """Lookups must stay sub-millisecond on a realistic corridor"""
+
+    def test_match_offers_sub_millisecond(self):
+        offers = [make_offer(capacity=1 + (i % 200), arrival_days=1 + (i % 37)) for i in range(10_000)]
+        offers += [make_offer(capacity=50, mode="AIR") for _ in range(50_000)]
+        index = CorridorIndex()
+        index.load(offers, [])
+        req = make_request(weight=180, deadline_days=10)
+
+        runs = 200
+        start = time.perf_counter()
+        for _ in range(runs):
+            matches = index.match_offers(req)
+        elapsed_ms = (time.perf_counter() - start) * 1000 / runs
+        print(f"match_offers: {len(matches)} matches in {elapsed_ms:.3f} ms")
+        assert matches
+        assert elapsed_ms < 1.0
+
+
+class TestRanking:
+    """Ranking of candidate offers for a request"""
+
+    def test_cheaper_offer_ranks_first(self):
+        cheap = make_offer(price_per_kg=5.0)
+        expensive = make_offer(price_per_kg=20.0)
+        ranked = rank_offers(make_request(), [expensive, cheap], {})
+        assert [o["id"] for o in ranked] == [cheap["id"], expensive["id"]]
+        assert ranked[0]["match_score"] >= ranked[1]["match_score"]
+
+    def test_city_match_and_rating_break_ties(self):
+        req = make_request(origin_city="Lyon", destination_city="Tunis")
+        plain = make_offer(user_id="new", origin_city="Marseille", destination_city="Sfax")
+        local = make_offer(user_id="rated", origin_city="lyon", destination_city="Tunis")
+        carriers = {"rated": {"rating_sum": 15, "rating_count": 3}}
+        ranked = rank_offers(req, [plain, local], carriers)
+        assert ranked[0]["id"] == local["id"]
+
+    def test_weights_profile_is_applied(self):
+        req = make_request(origin_city="Lyon", destination_city="Tunis")
+        cheap = make_offer(price_per_kg=5.0, origin_city="Paris", destination_city="Sousse")
+        local = make_offer(price_per_kg=9.0, origin_city="Lyon", destination_city="Tunis")
+        price_only = rank_offers(req, [dict(cheap), dict(local)], {}, {"price": 1, "capacity": 0, "slack": 0, "city": 0, "rating": 0})
+        city_only = rank_offers(req, [dict(cheap), dict(local)], {}, {"price": 0, "capacity": 0, "slack": 0, "city": 1, "rating": 0})
+        assert price_only[0]["id"] == cheap["id"]
+        assert city_only[0]["id"] == local["id"]
+
+    def test_index_columns_rank_like_documents(self):
+        offers = [make_offer(capacity=10 + i, price_per_kg=5 + i % 7, user_id=f"c{i % 3}",
+                             origin_city="Lyon" if i % 4 == 0 else "Paris", arrival_days=2 + i % 9)
+                  for i in range(40)]
+        carriers = {"c1": {"rating_sum": 20, "rating_count": 4}}
+        req = make_request(weight=15, deadline_days=8, origin_city="lyon")
+        index = CorridorIndex()
+        index.load(offers, [])
+        ids, scores = rank_offer_columns(req, index.match_offer_columns(req), carriers)
+        expected = rank_offers(req, index.match_offers(req), carriers)
+        assert list(ids) == [o["id"] for o in expected]
+        assert [round(float(s), 4) for s in scores] == [o["match_score"] for o in expected]
+
+    def test_top_order_matches_stable_sort(self):
+        scores = np.array([0.5, 0.9, 0.5, 0.1, 0.9, 0.5, 0.7])
+        full = np.argsort(-scores, kind="stable")
+        for k in range(0, len(scores) + 2):
+            assert list(top_order(scores, k)) == list(full[:k])
+
+
+class TestScoringBenchmark:
+    """Matching and ranking 100k candidates must take under 50 ms"""
+
+    def test_score_100k_offers_under_50ms(self):
+        n = 100_000
+        rng = np.random.default_rng(42)
+        now = NOW.timestamp()
+        price = rng.uniform(3, 25, n)
+        capacity = rng.uniform(5, 200, n)
+        departure = now + rng.uniform(0, 30, n) * 86400
+        city = rng.choice([0.0, 0.5, 1.0], n)
+        r_sum = rng.integers(0, 100, n).astype(float)
+        r_count = np.minimum(r_sum, rng.integers(0, 20, n)).astype(float)
+
+        score_arrays(5.0, now + 14 * 86400, price, capacity, departure, city, r_sum, r_count)  # warm-up
+        runs = 10
+        start = time.perf_counter()
+        for _ in range(runs):
+            scores = score_arrays(5.0, now + 14 * 86400, price, capacity, departure, city, r_sum, r_count)
+            order = np.argsort(-scores, kind="stable")
+        elapsed_ms = (time.perf_counter() - start) * 1000 / runs
+        print(f"score + sort 100k offers: {elapsed_ms:.2f} ms")
+        assert order.shape == (n,)
+        assert np.all((scores >= 0) & (scores <= 1))
+        assert elapsed_ms < 50
+
+    def test_rank_100k_indexed_offers_end_to_end_under_50ms(self):
+        n = 100_000
+        rng = np.random.default_rng(7)
+        offers = [
+            make_offer(capacity=float(c), arrival_days=int(a), price_per_kg=float(p), user_id=f"carrier-{u}",
+                       origin_city="Lyon" if u % 5 == 0 else "Paris", destination_city="Tunis")
+            for c, a, p, u in zip(rng.uniform(5, 200, n), rng.integers(1, 12, n),
+                                  rng.uniform(3, 25, n), rng.integers(0, 2_000, n))
+        ]
+        carriers = {f"carrier-{u}": {"rating_sum": u % 50, "rating_count": u % 10} for u in range(2_000)}
+        index = CorridorIndex()
+        index.load(offers, [])
+        req = make_request(weight=1, deadline_days=30, origin_city="Lyon", destination_city="Tunis")
+
+        start = time.perf_counter()
+        index.match_offer_columns(req)  # première lecture : construction des colonnes du corridor
+        build_ms = (time.perf_counter() - start) * 1000
+        runs = 10
+        start = time.perf_counter()
+        for _ in range(runs):
+            candidates = index.match_offer_columns(req)
+            ids, scores = rank_offer_columns(req, candidates, carriers, limit=20)
+            page = [index.get_offer(offer_id) for offer_id in ids]
+        elapsed_ms = (time.perf_counter() - start) * 1000 / runs
+        print(f"match + rank 100k indexed offers: {elapsed_ms:.2f} ms (columns built in {build_ms:.0f} ms)")
+        assert len(candidates) == n and len(page) == 20
+        assert np.all(np.diff(scores) <= 0)
+        full_ids, full_scores = rank_offer_columns(req, candidates, carriers)
+        assert list(ids) == list(full_ids[:20])
+        assert elapsed_ms < 50
@@ -0,0 +1,72 @@
+"""
+Unit Tests for the bcrypt worker pool (backend/passwords.py):
+- Hash / verify round trip off the event loop
+- The event loop keeps running while hashes are computed
+- Bounded queue rejects excess work
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+
+from passwords import PasswordHasher, PasswordHasherBusy  # noqa: E402
+
+
+class TestPasswordHasher:
+    """Hashing through the dedicated pool"""
+
+    def test_hash_and_verify(self):
+        async def scenario():
+            hasher = PasswordHasher(rounds=4, workers=2)
+            hashed = await hasher.hash("secret")
+            assert hashed.startswith("$2b$04$")
+            assert await hasher.verify("secret", hashed)
+            assert not await hasher.verify("wrong", hashed)
+            assert not await hasher.verify("secret", "")
+            hasher.shutdown()
+            return hasher.stats()
+
+        stats = asyncio.run(scenario())
+        assert stats["completed"] == 4
+        assert stats["waiting"] == 0 and stats["running"] == 0
+
+    def test_event_loop_not_blocked(self):
+        async def scenario():
+            hasher = PasswordHasher(rounds=12, workers=1)
+            ticks = []
+
+            async def ticker():
+                while True:
+                    ticks.append(time.perf_counter())
+                    await asyncio.sleep(0.005)
+
+            task = asyncio.create_task(ticker())
+            await asyncio.gather(*(hasher.hash("secret") for _ in range(3)))
+            task.cancel()
+            hasher.shutdown()
+            return max(b - a for a, b in zip(ticks, ticks[1:]))
+
+        longest_gap = asyncio.run(scenario())
+        print(f"longest event loop stall: {longest_gap * 1000:.1f} ms")
+        assert longest_gap < 0.1
+
+    def test_queue_limit(self):
+        async def scenario():
+            hasher = PasswordHasher(rounds=10, workers=1, max_queue=2)
+            results = await asyncio.gather(*(hasher.hash("secret") for _ in range(5)), return_exceptions=True)
+            hasher.shutdown()
+            return results, hasher.stats()
+
+        results, stats = asyncio.run(scenario())
+        rejected = [r for r in results if isinstance(r, PasswordHasherBusy)]
+        assert len(rejected) == 2
+        assert stats["rejected"] == 2
+        assert stats["max_waiting"] == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
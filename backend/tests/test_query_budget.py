@@ -0,0 +1,153 @@
+"""
+Backend API Tests for query budgets:
+- List endpoints must cost O(1) Mongo round trips per page (X-DB-Queries header)
+- Keyset (cursor) pagination
+- Conversation inbox with unread counts
+"""
+import base64
+import json
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+ADMIN_EMAIL = "admin@logimatch.com"
+ADMIN_PASSWORD = "admin123"
+USER_EMAIL = "marie@example.com"
+USER_PASSWORD = "password123"
+
+# get_current_user (1) + find (1) + count (1) + user batch (1) + marge pour getMore/aggregate
+LIST_QUERY_BUDGET = 6
+
+
+def db_queries(response):
+    assert 'X-DB-Queries' in response.headers, "Response should expose X-DB-Queries"
+    return int(response.headers['X-DB-Queries'])
+
+
+class TestPublicListQueryBudget:
+    """Public lists must not issue one user lookup per row"""
+
+    @pytest.mark.parametrize("path", ["/api/requests", "/api/offers"])
+    def test_public_list_budget(self, path):
+        response = requests.get(f"{BASE_URL}{path}", params={"limit": 100})
+        assert response.status_code == 200, f"Expected 200, got {response.status_code}: {response.text}"
+
+        data = response.json()
+        queries = db_queries(response)
+        print(f"{path}: {len(data['items'])} items, {queries} queries")
+        assert queries <= LIST_QUERY_BUDGET, f"{path} issued {queries} queries for {len(data['items'])} items"
+
+        for item in data['items']:
+            assert 'user' in item, "Each item should be enriched with its user"
+
+    def test_matching_budget(self):
+        requests_response = requests.get(f"{BASE_URL}/api/requests")
+        items = requests_response.json().get('items', [])
+        if not items:
+            pytest.skip("No requests available")
+
+        response = requests.get(f"{BASE_URL}/api/matching/requests/{items[0]['id']}/offers", params={"limit": 100})
+        assert response.status_code == 200, f"Expected 200, got {response.status_code}: {response.text}"
+        assert db_queries(response) <= LIST_QUERY_BUDGET
+
+
+class TestCursorPagination:
+    """Cursor pagination walks a list without duplicates or skip/count costs"""
+
+    @pytest.mark.parametrize("path", ["/api/requests", "/api/offers"])
+    def test_cursor_walk(self, path):
+        seen = []
+        params = {"limit": 2, "include_total": "false"}
+        for _ in range(50):
+            response = requests.get(f"{BASE_URL}{path}", params=params)
+            assert response.status_code == 200, f"Expected 200, got {response.status_code}: {response.text}"
+            data = response.json()
+            assert data['total'] is None, "include_total=false should skip the count"
+            assert db_queries(response) <= LIST_QUERY_BUDGET - 1
+            seen.extend(item['id'] for item in data['items'])
+            if not data['next_cursor']:
+                break
+            params["cursor"] = data['next_cursor']
+        assert len(seen) == len(set(seen)), "Cursor pages should not overlap"
+
+    def test_invalid_cursor(self):
+        response = requests.get(f"{BASE_URL}/api/requests", params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize("payload", [[{"$gt": ""}, "x"], ["2024-01-01", {"$ne": None}], [True, "x"], [None, "x"]])
+    def test_cursor_with_operator_rejected(self, payload):
+        cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+        response = requests.get(f"{BASE_URL}/api/requests", params={"cursor": cursor})
+        assert response.status_code == 400
+
+
+class TestConversationListQueryBudget:
+    """The inbox is built with batched lookups, not one query per conversation"""
+
+    @pytest.fixture
+    def user_headers(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": USER_EMAIL,
+            "password": USER_PASSWORD
+        })
+        if response.status_code != 200:
+            pytest.skip(f"User login failed: {response.text}")
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    def test_inbox_budget(self, user_headers):
+        response = requests.get(f"{BASE_URL}/api/conversations", params={"limit": 100}, headers=user_headers)
+        assert response.status_code == 200, f"Expected 200, got {response.status_code}: {response.text}"
+
+        data = response.json()
+        # utilisateurs, demandes et offres en plus d'une liste simple ; les non-lus sont stockés
+        assert db_queries(response) <= LIST_QUERY_BUDGET + 2
+        for conv in data['items']:
+            assert 'other_user' in conv
+            assert isinstance(conv['unread_count'], int)
+
+    def test_inbox_cursor(self, user_headers):
+        response = requests.get(f"{BASE_URL}/api/conversations", params={"limit": 1, "include_total": "false"}, headers=user_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data['items']) <= 1
+        if data['next_cursor']:
+            following = requests.get(f"{BASE_URL}/api/conversations", params={"limit": 1, "cursor": data['next_cursor']}, headers=user_headers)
+            assert following.status_code == 200
+            assert following.json()['items'][0]['id'] != data['items'][0]['id']
+
+
+class TestAdminListQueryBudget:
+    """Admin lists must not issue one user lookup per row"""
+
+    @pytest.fixture
+    def admin_token(self):
+        """Get admin authentication token"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": ADMIN_EMAIL,
+            "password": ADMIN_PASSWORD
+        })
+        if response.status_code != 200:
+            pytest.skip(f"Admin login failed: {response.text}")
+        return response.json()['access_token']
+
+    @pytest.mark.parametrize("path", [
+        "/api/admin/requests",
+        "/api/admin/offers",
+        "/api/admin/reports",
+        "/api/admin/payments",
+    ])
+    def test_admin_list_budget(self, admin_token, path):
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = requests.get(f"{BASE_URL}{path}", params={"limit": 100}, headers=headers)
+        assert response.status_code == 200, f"Expected 200, got {response.status_code}: {response.text}"
+
+        queries = db_queries(response)
+        print(f"{path}: {len(response.json()['items'])} items, {queries} queries")
+        # admin/payments ajoute l'agrégation des commissions
+        assert queries <= LIST_QUERY_BUDGET + 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
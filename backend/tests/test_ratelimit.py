@@ -0,0 +1,176 @@
+"""
+Unit Tests for the sliding-window rate limiter (backend/ratelimit.py):
+- Limits per key inside a window, weighted carry-over from the previous window
+- check() does not record attempts
+- refund() gives back a reserved attempt, also across a window boundary
+- Shared Redis-style backend through a local stand-in client
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+
+from ratelimit import MemoryCounterStore, RedisCounterStore, SlidingWindowLimiter, parse_rate  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class LocalRedis:
+    """Stand-in minimal d'un client redis.asyncio (INCR, DECR, EXPIRE, GET, MGET, pipeline)"""
+
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self):
+        return LocalPipeline(self)
+
+    async def decr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) - 1
+        return self.data[key]
+
+    async def mget(self, *keys):
+        return [self.data.get(k) for k in keys]
+
+
+class LocalPipeline:
+    def __init__(self, redis):
+        self.redis, self.ops = redis, []
+
+    def incr(self, key):
+        self.ops.append(("incr", key))
+
+    def decr(self, key):
+        self.ops.append(("decr", key))
+
+    def expire(self, key, seconds):
+        self.ops.append(("expire", key))
+
+    def get(self, key):
+        self.ops.append(("get", key))
+
+    async def execute(self):
+        results = []
+        for op, key in self.ops:
+            if op in ("incr", "decr"):
+                self.redis.data[key] = int(self.redis.data.get(key, 0)) + (1 if op == "incr" else -1)
+                results.append(self.redis.data[key])
+            elif op == "expire":
+                results.append(True)
+            else:
+                value = self.redis.data.get(key)
+                results.append(None if value is None else str(value).encode())
+        return results
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request):
+    return MemoryCounterStore() if request.param == "memory" else RedisCounterStore(client=LocalRedis())
+
+
+class TestSlidingWindowLimiter:
+    """Sliding-window counting with both backends"""
+
+    def test_parse_rate(self):
+        assert parse_rate("20/60") == (20, 60.0)
+        assert parse_rate("5") == (5, 60.0)
+
+    def test_limit_per_key(self, store):
+        clock = FakeClock(1_000_020.0)
+        limiter = SlidingWindowLimiter("login", 3, 60, store, clock)
+
+        async def scenario():
+            results = [await limiter.hit("1.2.3.4") for _ in range(4)]
+            other = await limiter.hit("5.6.7.8")
+            return results, other
+
+        results, other = run(scenario())
+        assert results[:3] == [None, None, None]
+        assert results[3] is not None and 1 <= results[3] <= 60
+        assert other is None
+        assert limiter.rejected == 1
+
+    def test_previous_window_is_weighted(self, store):
+        clock = FakeClock(60 * 1000 + 50)
+        limiter = SlidingWindowLimiter("login", 4, 60, store, clock)
+
+        async def scenario():
+            for _ in range(4):
+                assert await limiter.hit("k") is None
+            # 30 s dans la fenêtre suivante : la précédente compte pour moitié (2)
+            clock.now = 60 * 1001 + 30
+            allowed = [await limiter.hit("k") for _ in range(3)]
+            # Deux fenêtres plus tard, tout est oublié
+            clock.now = 60 * 1003 + 1
+            fresh = await limiter.hit("k")
+            return allowed, fresh
+
+        allowed, fresh = run(scenario())
+        assert allowed[:2] == [None, None]
+        assert allowed[2] is not None
+        assert fresh is None
+
+    def test_check_does_not_record(self, store):
+        limiter = SlidingWindowLimiter("login_email", 2, 300, store, FakeClock())
+
+        async def scenario():
+            checks = [await limiter.check("marie") for _ in range(10)]
+            await limiter.hit("marie")
+            await limiter.hit("marie")
+            return checks, await limiter.check("marie")
+
+        checks, blocked = run(scenario())
+        assert checks == [None] * 10
+        assert blocked is not None
+
+    def test_refund_gives_back_reserved_attempts(self, store):
+        clock = FakeClock(1_000_000.0)
+        limiter = SlidingWindowLimiter("login_email", 2, 300, store, clock)
+
+        async def scenario():
+            # Connexions réussies : la tentative réservée est rendue
+            for _ in range(5):
+                assert await limiter.hit("marie") is None
+                await limiter.refund("marie")
+            await limiter.hit("marie")
+            # Changement de fenêtre entre la réservation et le remboursement
+            clock.now += 300
+            await limiter.refund("marie")
+            return await store.peek("login_email:marie", int(clock.now // 300), 300)
+
+        assert run(scenario()) == (0, 0)
+
+    def test_memory_store_is_bounded(self):
+        store = MemoryCounterStore(maxkeys=100)
+        limiter = SlidingWindowLimiter("login", 5, 60, store, FakeClock())
+
+        async def scenario():
+            for i in range(1000):
+                await limiter.hit(f"10.0.{i // 256}.{i % 256}")
+
+        run(scenario())
+        assert len(store) == 100
+
+    def test_backend_failure_fails_open(self):
+        class BrokenStore:
+            async def incr(self, *args):
+                raise ConnectionError("down")
+
+        limiter = SlidingWindowLimiter("login", 1, 60, BrokenStore(), FakeClock())
+        assert run(limiter.hit("k")) is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,162 @@
+"""
+Unit Tests for the pub/sub hub (backend/realtime.py):
+- Subscribe / publish / unsubscribe on the in-memory hub
+- Bounded subscriber queues drop instead of blocking the publisher
+- Redis hub subscribes only to channels with local subscribers (local stand-in client)
+"""
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+
+from realtime import PubSubHub, RedisPubSubHub  # noqa: E402
+
+
+class LocalBroker:
+    """Stand-in minimal d'un serveur Redis pub/sub partagé par plusieurs clients"""
+
+    def __init__(self):
+        self.pubsubs = []
+
+    async def publish(self, channel, data):
+        for pubsub in self.pubsubs:
+            if channel in pubsub.channels:
+                pubsub.inbox.put_nowait({"type": "message", "channel": channel.encode(), "data": data})
+
+
+class LocalRedis:
+    def __init__(self, broker):
+        self.broker = broker
+
+    def pubsub(self):
+        pubsub = LocalPubSub()
+        self.broker.pubsubs.append(pubsub)
+        return pubsub
+
+    async def publish(self, channel, data):
+        await self.broker.publish(channel, data)
+
+    async def close(self):
+        pass
+
+
+class LocalPubSub:
+    def __init__(self):
+        self.channels = set()
+        self.inbox = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self.channels.add(channel)
+
+    async def unsubscribe(self, channel):
+        self.channels.discard(channel)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        try:
+            return await asyncio.wait_for(self.inbox.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        pass
+
+
+async def next_event(queue):
+    return await asyncio.wait_for(queue.get(), 1.0)
+
+
+class TestPubSubHub:
+    """In-process fan-out"""
+
+    def test_publish_reaches_subscribers_of_the_channel_only(self):
+        async def scenario():
+            hub = PubSubHub()
+            a, b = asyncio.Queue(), asyncio.Queue()
+            await hub.subscribe("conversation:1", a)
+            await hub.subscribe("conversation:2", b)
+            await hub.publish("conversation:1", {"type": "message"})
+            return a.get_nowait(), b.empty(), hub.stats()
+
+        event, other_empty, stats = asyncio.run(scenario())
+        assert event == ("conversation:1", {"type": "message"})
+        assert other_empty
+        assert stats["published"] == 1 and stats["delivered"] == 1 and stats["channels"] == 2
+
+    def test_unsubscribe_removes_empty_channel(self):
+        async def scenario():
+            hub = PubSubHub()
+            queue = asyncio.Queue()
+            await hub.subscribe("c", queue)
+            await hub.unsubscribe("c", queue)
+            await hub.unsubscribe("c", queue)  # sans effet
+            await hub.publish("c", {"n": 1})
+            return queue.empty(), hub.stats()
+
+        empty, stats = asyncio.run(scenario())
+        assert empty
+        assert stats["channels"] == 0 and stats["delivered"] == 0
+
+    def test_full_queue_drops_message(self):
+        async def scenario():
+            hub = PubSubHub()
+            slow, fast = asyncio.Queue(maxsize=2), asyncio.Queue()
+            await hub.subscribe("c", slow)
+            await hub.subscribe("c", fast)
+            for i in range(5):
+                await hub.publish("c", {"n": i})
+            return slow.qsize(), fast.qsize(), hub.stats()
+
+        slow, fast, stats = asyncio.run(scenario())
+        assert slow == 2 and fast == 5
+        assert stats["dropped"] == 3 and stats["delivered"] == 7
+
+
+class TestRedisPubSubHub:
+    """Cross-worker relay"""
+
+    def test_relay_between_workers(self):
+        async def scenario():
+            broker = LocalBroker()
+            first, second = RedisPubSubHub("", client=LocalRedis(broker)), RedisPubSubHub("", client=LocalRedis(broker))
+            await first.start()
+            await second.start()
+            queue = asyncio.Queue()
+            await second.subscribe("conversation:1", queue)
+            await first.publish("conversation:1", {"type": "message"})
+            event = await next_event(queue)
+            await first.stop()
+            await second.stop()
+            return event
+
+        assert asyncio.run(scenario()) == ("conversation:1", {"type": "message"})
+
+    def test_subscribes_only_to_local_channels(self):
+        async def scenario():
+            broker = LocalBroker()
+            hub = RedisPubSubHub("", prefix="w:", client=LocalRedis(broker))
+            await hub.start()
+            pubsub = broker.pubsubs[0]
+            a, b = asyncio.Queue(), asyncio.Queue()
+            await hub.subscribe("c", a)
+            await hub.subscribe("c", b)
+            subscribed = set(pubsub.channels)
+            await hub.unsubscribe("c", a)
+            still = set(pubsub.channels)
+            await hub.unsubscribe("c", b)
+            after = set(pubsub.channels)
+            # Un canal sans abonné local n'est pas relayé vers ce worker
+            await broker.publish("w:other", json.dumps({"n": 1}))
+            await hub.stop()
+            return subscribed, still, after, pubsub.inbox.qsize()
+
+        subscribed, still, after, pending = asyncio.run(scenario())
+        assert subscribed == {"w:c"} and still == {"w:c"}
+        assert after == set() and pending == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
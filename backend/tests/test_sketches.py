@@ -0,0 +1,92 @@
+"""
+Unit Tests for the probabilistic sketches (backend/sketches.py):
+- Bloom filter: no false negatives, bounded false-positive rate
+- HyperLogLog: estimate accuracy, sparse registers round-trip and merge
+"""
+import sys
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+
+from sketches import BloomFilter, HyperLogLog  # noqa: E402
+
+
+class TestBloomFilter:
+    """Revocation front filter"""
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=10_000, error_rate=0.01)
+        items = [str(uuid.uuid4()) for _ in range(10_000)]
+        for item in items:
+            bloom.add(item)
+        assert all(item in bloom for item in items)
+        assert not bloom.saturated()
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(capacity=10_000, error_rate=0.01)
+        for _ in range(10_000):
+            bloom.add(str(uuid.uuid4()))
+        probes = 20_000
+        false_positives = sum(str(uuid.uuid4()) in bloom for _ in range(probes))
+        print(f"false positive rate: {false_positives / probes:.4f}")
+        assert false_positives / probes < 0.02
+
+    def test_compact(self):
+        bloom = BloomFilter(capacity=100_000, error_rate=0.01)
+        # ~9.6 bits par élément à 1 %
+        assert len(bloom._bits) < 125_000
+        assert bloom.hashes == 7
+
+
+class TestHyperLogLog:
+    """Distinct visitor counts"""
+
+    def test_empty_and_small(self):
+        hll = HyperLogLog()
+        assert hll.count() == 0
+        for ip in ("10.0.0.1", "10.0.0.2", "10.0.0.1"):
+            hll.add(ip)
+        assert hll.count() == 2
+
+    @pytest.mark.parametrize("n", [1_000, 50_000])
+    def test_accuracy(self, n):
+        hll = HyperLogLog(precision=12)
+        for i in range(n):
+            hll.add(f"ip-{i}")
+            hll.add(f"ip-{i}")
+        error = abs(hll.count() - n) / n
+        print(f"n={n} estimate={hll.count()} error={error:.4f}")
+        # 4 écarts types à p=12 (≈ 1,6 %)
+        assert error < 0.065
+
+    def test_sparse_round_trip_and_merge(self):
+        a, b = HyperLogLog(), HyperLogLog()
+        for i in range(3_000):
+            a.add(f"a-{i}")
+            b.add(f"b-{i}")
+        restored = HyperLogLog(registers=a.registers())
+        assert restored.count() == a.count()
+        assert all(isinstance(k, str) for k in a.registers())
+        restored.merge(b)
+        union = HyperLogLog(registers=a.registers())
+        union.update(b.registers())
+        assert restored.count() == union.count()
+        assert abs(union.count() - 6_000) / 6_000 < 0.065
+
+    def test_position_matches_add(self):
+        hll = HyperLogLog(precision=10)
+        index, rank = hll.position("192.168.1.1")
+        assert 0 <= index < 1024 and 1 <= rank <= 64 - 10 + 1
+        hll.add("192.168.1.1")
+        assert hll.registers() == {str(index): rank}
+
+    def test_precision_mismatch(self):
+        with pytest.raises(ValueError):
+            HyperLogLog(precision=10).merge(HyperLogLog(precision=12))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,62 @@
+"""
+Backend API Tests for the materialized admin counters:
+- /admin/stats reads the counters document
+- Report creation and closing move open_reports
+- Closing an already closed report does not decrement twice
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+ADMIN_EMAIL = "admin@logimatch.com"
+ADMIN_PASSWORD = "admin123"
+USER_EMAIL = "marie@example.com"
+USER_PASSWORD = "password123"
+
+
+def auth_headers(email, password):
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={"email": email, "password": password})
+    if response.status_code != 200:
+        pytest.skip(f"Login failed for {email}: {response.text}")
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+class TestStatsCounters:
+    """Counters follow create and status-transition handlers"""
+
+    @pytest.fixture
+    def admin(self):
+        return auth_headers(ADMIN_EMAIL, ADMIN_PASSWORD)
+
+    @pytest.fixture
+    def user(self):
+        return auth_headers(USER_EMAIL, USER_PASSWORD)
+
+    def stats(self, admin):
+        response = requests.get(f"{BASE_URL}/api/admin/stats", headers=admin)
+        assert response.status_code == 200, f"Expected 200, got {response.status_code}: {response.text}"
+        return response.json()
+
+    def test_stats_shape(self, admin):
+        stats = self.stats(admin)
+        for key in ("users", "requests", "offers", "contracts", "pending_verifications", "open_reports"):
+            assert isinstance(stats[key], int) and stats[key] >= 0
+
+    def test_report_lifecycle_moves_open_reports(self, admin, user):
+        before = self.stats(admin)["open_reports"]
+        response = requests.post(f"{BASE_URL}/api/reports", headers=user,
+                                 json={"target_type": "USER", "target_id": "TEST_counter", "reason": "TEST_counter"})
+        assert response.status_code == 200
+        report_id = response.json()["id"]
+        assert self.stats(admin)["open_reports"] == before + 1
+
+        for _ in range(2):
+            closed = requests.patch(f"{BASE_URL}/api/admin/reports/{report_id}/close", headers=admin)
+            assert closed.status_code == 200
+        assert self.stats(admin)["open_reports"] == before
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
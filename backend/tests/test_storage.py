@@ -0,0 +1,116 @@
+"""
+Unit Tests for the upload storage drivers (backend/storage.py), S3 side run against moto:
+- Put / exists / list / delete round trip
+- Multipart upload above the threshold
+- Presigned download URLs
+- Content-addressed uploads and orphan sweep through the S3 driver
+"""
+import asyncio
+import io
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from storage import LocalStorage, S3Storage, storage_from_env  # noqa: E402
+from uploads import UploadService, sweep_blobs  # noqa: E402
+
+BUCKET = "waselni-test"
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+class AsyncBytes:
+    """Minimal stand-in for UploadFile.read"""
+
+    def __init__(self, data: bytes):
+        self._buffer = io.BytesIO(data)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self._buffer.read(size)
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def write_tmp(tmp_path, data, name=".upload.part"):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return path
+
+
+class TestS3Storage:
+    """S3 driver against moto"""
+
+    def test_put_exists_list_delete(self, s3, tmp_path):
+        storage = S3Storage(BUCKET, prefix="uploads/", client=s3)
+        storage.put_file(write_tmp(tmp_path, PNG), "blobs/ab/cd/abcd.png", "image/png")
+        assert not (tmp_path / ".upload.part").exists()
+        assert storage.exists("blobs/ab/cd/abcd.png")
+        assert not storage.exists("blobs/ab/cd/other.png")
+        head = s3.head_object(Bucket=BUCKET, Key="uploads/blobs/ab/cd/abcd.png")
+        assert head["ContentType"] == "image/png"
+        assert [(key, size) for key, size, _ in storage.list("blobs/")] == [("blobs/ab/cd/abcd.png", len(PNG))]
+        assert storage.read("blobs/ab/cd/abcd.png") == PNG
+        storage.delete("blobs/ab/cd/abcd.png")
+        assert list(storage.list("blobs/")) == []
+        with pytest.raises(FileNotFoundError):
+            storage.read("blobs/ab/cd/abcd.png")
+
+    def test_large_file_uses_multipart(self, s3, tmp_path):
+        part = 5 * 1024 * 1024
+        storage = S3Storage(BUCKET, client=s3, multipart_threshold=part, multipart_chunksize=part)
+        data = b"x" * (2 * part + 10)
+        storage.put_file(write_tmp(tmp_path, data), "blobs/big.pdf", "application/pdf")
+        head = s3.head_object(Bucket=BUCKET, Key="blobs/big.pdf")
+        assert head["ContentLength"] == len(data)
+        # Les ETag multipart se terminent par "-<nombre de parties>"
+        assert head["ETag"].strip('"').endswith("-3")
+
+    def test_presigned_url(self, s3):
+        storage = S3Storage(BUCKET, prefix="uploads/", client=s3, presign_expires=120)
+        url = storage.presigned_url("blobs/ab/cd/abcd.png")
+        assert "uploads/blobs/ab/cd/abcd.png" in url
+        assert "Signature" in url or "X-Amz-Signature" in url
+        assert "Expires=" in url or "X-Amz-Expires=120" in url
+
+    def test_upload_service_on_s3(self, s3, tmp_path):
+        storage = S3Storage(BUCKET, client=s3)
+        service = UploadService(tmp_path, storage=storage)
+        first = asyncio.run(service.save(AsyncBytes(PNG), "photo"))
+        second = asyncio.run(service.save(AsyncBytes(PNG), "avatar"))
+        assert second["key"] == first["key"] and second["deduplicated"]
+        orphan = asyncio.run(service.save(AsyncBytes(PNG + b"orphan"), "photo"))["key"]
+        assert list(tmp_path.iterdir()) == []
+
+        result = sweep_blobs(storage, {first["key"]}, grace_seconds=3600, now=time.time() + 7200)
+        assert result["removed"] == [orphan]
+        assert [key for key, _, _ in storage.list("blobs/")] == [first["key"]]
+
+
+class TestStorageFromEnv:
+    """Driver selection"""
+
+    def test_local_by_default(self, tmp_path):
+        assert isinstance(storage_from_env(tmp_path, {}), LocalStorage)
+
+    def test_s3_requires_bucket(self, tmp_path):
+        with pytest.raises(RuntimeError):
+            storage_from_env(tmp_path, {"STORAGE_BACKEND": "s3"})
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
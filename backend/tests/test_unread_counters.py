@@ -0,0 +1,83 @@
+"""
+Backend API Tests for conversation read state:
+- Per-participant unread counters maintained by send_message
+- Mark-read endpoint and read receipts
+- Unread summary used by the dashboard
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+SHIPPER_EMAIL = "marie@example.com"
+CARRIER_EMAIL = "transport.pro@example.com"
+PASSWORD = "password123"
+
+
+def auth_headers(email):
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={"email": email, "password": PASSWORD})
+    if response.status_code != 200:
+        pytest.skip(f"Login failed for {email}: {response.text}")
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+class TestUnreadCounters:
+    """Unread counters follow messages and mark-read calls"""
+
+    @pytest.fixture
+    def shipper(self):
+        return auth_headers(SHIPPER_EMAIL)
+
+    @pytest.fixture
+    def carrier(self):
+        return auth_headers(CARRIER_EMAIL)
+
+    @pytest.fixture
+    def conversation_id(self, shipper):
+        response = requests.get(f"{BASE_URL}/api/conversations", headers=shipper)
+        items = response.json().get('items', [])
+        if not items:
+            pytest.skip("No conversation available")
+        return items[0]['id']
+
+    def unread(self, headers, conversation_id):
+        summary = requests.get(f"{BASE_URL}/api/conversations/unread-summary", headers=headers)
+        assert summary.status_code == 200, f"Expected 200, got {summary.status_code}: {summary.text}"
+        return summary.json()['by_conversation'].get(conversation_id, 0)
+
+    def test_send_increments_recipient_only(self, shipper, carrier, conversation_id):
+        requests.post(f"{BASE_URL}/api/conversations/{conversation_id}/read", headers=shipper)
+        assert self.unread(shipper, conversation_id) == 0
+
+        for text in ("TEST_unread 1", "TEST_unread 2"):
+            response = requests.post(f"{BASE_URL}/api/conversations/{conversation_id}/messages",
+                                     json={"text": text}, headers=carrier)
+            assert response.status_code == 200
+
+        assert self.unread(shipper, conversation_id) == 2
+        assert self.unread(carrier, conversation_id) == 0
+
+    def test_mark_read_sets_receipt(self, shipper, carrier, conversation_id):
+        sent = requests.post(f"{BASE_URL}/api/conversations/{conversation_id}/messages",
+                             json={"text": "TEST_receipt"}, headers=carrier).json()
+
+        response = requests.post(f"{BASE_URL}/api/conversations/{conversation_id}/read", headers=shipper)
+        assert response.status_code == 200
+        assert response.json()['last_read'] == sent['id']
+        assert self.unread(shipper, conversation_id) == 0
+
+        conv = requests.get(f"{BASE_URL}/api/conversations/{conversation_id}", headers=carrier).json()
+        assert conv['other_last_read'] == sent['id']
+
+    def test_mark_read_requires_participant(self, conversation_id):
+        admin = requests.post(f"{BASE_URL}/api/auth/login", json={"email": "admin@logimatch.com", "password": "admin123"})
+        if admin.status_code != 200:
+            pytest.skip("Admin login failed")
+        headers = {"Authorization": f"Bearer {admin.json()['access_token']}"}
+        response = requests.post(f"{BASE_URL}/api/conversations/{conversation_id}/read", headers=headers)
+        assert response.status_code == 403
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
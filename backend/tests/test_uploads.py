@@ -0,0 +1,182 @@
+"""
+Unit Tests for the streaming upload service (backend/uploads.py):
+- Content type sniffed from magic bytes, extension derived from it
+- SHA-256 computed while streaming, files stored by content with deduplication
+- Size limit and type checks leave nothing on disk
+- Orphan sweep keeps referenced and recent blobs
+- Range header parsing and cache validators for served files
+"""
+import asyncio
+import hashlib
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+
+from uploads import (  # noqa: E402
+    RangeNotSatisfiable, UploadRejected, UploadService, blob_etag, blob_key_from_url,
+    content_type_for, parse_range, sniff_mime, sweep_blobs,
+)
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+PDF = b"%PDF-1.4\n" + b"x" * 64
+
+
+class AsyncBytes:
+    """Minimal stand-in for UploadFile.read"""
+
+    def __init__(self, data: bytes):
+        self._buffer = io.BytesIO(data)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self._buffer.read(size)
+
+
+def save(service, data, kind):
+    return asyncio.run(service.save(AsyncBytes(data), kind))
+
+
+def files(root):
+    return sorted(p.relative_to(root).as_posix() for p in root.rglob("*") if p.is_file())
+
+
+class TestSniffing:
+    """Magic byte detection"""
+
+    def test_known_types(self):
+        assert sniff_mime(PNG) == "image/png"
+        assert sniff_mime(b"\xff\xd8\xff\xe0rest") == "image/jpeg"
+        assert sniff_mime(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+        assert sniff_mime(PDF) == "application/pdf"
+        assert sniff_mime(b"<html>") is None
+
+
+class TestUploadService:
+    """Streaming writes into the upload directory"""
+
+    def test_save_streams_and_hashes(self, tmp_path):
+        service = UploadService(tmp_path, chunk_size=16)
+        data = PNG * 10
+        saved = save(service, data, "photo")
+        sha = hashlib.sha256(data).hexdigest()
+        assert saved["sha256"] == sha
+        assert saved["key"] == f"blobs/{sha[:2]}/{sha[2:4]}/{sha}.png"
+        assert saved["size"] == len(data)
+        assert not saved["deduplicated"]
+        assert (tmp_path / saved["key"]).read_bytes() == data
+        assert files(tmp_path) == [saved["key"]]
+
+    def test_extension_comes_from_content(self, tmp_path):
+        service = UploadService(tmp_path)
+        saved = save(service, PDF, "document")
+        assert saved["key"].endswith(".pdf")
+        assert saved["content_type"] == "application/pdf"
+
+    def test_same_content_is_stored_once(self, tmp_path):
+        service = UploadService(tmp_path)
+        first = save(service, PNG, "avatar")
+        second = save(service, PNG, "photo")
+        assert second["key"] == first["key"]
+        assert second["deduplicated"]
+        assert files(tmp_path) == [first["key"]]
+        assert service.stats()["deduplicated"] == 1
+        assert service.stats()["bytes_written"] == len(PNG)
+
+    def test_rejects_type_not_allowed_for_kind(self, tmp_path):
+        service = UploadService(tmp_path)
+        with pytest.raises(UploadRejected) as exc:
+            save(service, PDF, "avatar")
+        assert exc.value.status_code == 415
+        with pytest.raises(UploadRejected) as exc:
+            save(service, b"MZ\x90\x00 not an image", "attachment")
+        assert exc.value.status_code == 415
+        assert files(tmp_path) == []
+
+    def test_rejects_oversized_file_without_leftovers(self, tmp_path):
+        service = UploadService(tmp_path, {"photo": (("image/png",), 100)}, chunk_size=32)
+        with pytest.raises(UploadRejected) as exc:
+            save(service, PNG * 3, "photo")
+        assert exc.value.status_code == 413
+        assert files(tmp_path) == []
+        assert service.stats()["rejected"] == 1
+
+    def test_rejects_empty_file(self, tmp_path):
+        service = UploadService(tmp_path)
+        with pytest.raises(UploadRejected) as exc:
+            save(service, b"", "photo")
+        assert exc.value.status_code == 400
+
+
+class TestSweep:
+    """Garbage collection of unreferenced blobs"""
+
+    def test_blob_key_from_url(self):
+        assert blob_key_from_url("/uploads/blobs/ab/cd/abcd.png") == "blobs/ab/cd/abcd.png"
+        assert blob_key_from_url("/uploads/u1_avatar.png") is None
+        assert blob_key_from_url(None) is None
+
+    def test_sweep_removes_only_old_orphans(self, tmp_path):
+        service = UploadService(tmp_path)
+        kept = save(service, PNG, "photo")["key"]
+        orphan = save(service, PNG + b"orphan", "photo")["key"]
+        fresh = save(service, PNG + b"fresh", "photo")["key"]
+        legacy = tmp_path / "u1_avatar.png"
+        legacy.write_bytes(PNG)
+        old = time.time() - 7200
+        for key in (kept, orphan):
+            os.utime(tmp_path / key, (old, old))
+
+        dry = sweep_blobs(service.storage, {kept}, grace_seconds=3600, dry_run=True)
+        assert dry["removed"] == [orphan]
+        assert (tmp_path / orphan).exists()
+
+        result = sweep_blobs(service.storage, {kept}, grace_seconds=3600, spool_dir=tmp_path)
+        assert result["removed"] == [orphan]
+        assert result["live"] == 1 and result["recent"] == 1
+        assert files(tmp_path) == sorted([kept, fresh, "u1_avatar.png"])
+
+    def test_reupload_protects_blob_from_sweep(self, tmp_path):
+        service = UploadService(tmp_path)
+        key = save(service, PNG, "photo")["key"]
+        old = time.time() - 7200
+        os.utime(tmp_path / key, (old, old))
+        save(service, PNG, "photo")
+        assert sweep_blobs(service.storage, set(), grace_seconds=3600)["removed"] == []
+
+
+class TestServingHelpers:
+    """Range parsing and validators used by the /uploads route"""
+
+    def test_parse_range(self):
+        assert parse_range(None, 1000) is None
+        assert parse_range("bytes=0-99", 1000) == (0, 99)
+        assert parse_range("bytes=900-", 1000) == (900, 999)
+        assert parse_range("bytes=-100", 1000) == (900, 999)
+        assert parse_range("bytes=-5000", 1000) == (0, 999)
+        assert parse_range("bytes=500-5000", 1000) == (500, 999)
+
+    def test_parse_range_ignored_or_unsatisfiable(self):
+        assert parse_range("bytes=0-1,5-6", 1000) is None
+        assert parse_range("items=0-1", 1000) is None
+        assert parse_range("bytes=abc-", 1000) is None
+        assert parse_range("bytes=9-3", 1000) is None
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range("bytes=1000-", 1000)
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range("bytes=-0", 1000)
+
+    def test_blob_validators(self):
+        sha = "ab" * 32
+        assert blob_etag(f"blobs/ab/ab/{sha}.webp") == f'"{sha}"'
+        assert blob_etag("u1_avatar.png") is None
+        assert content_type_for(f"blobs/ab/ab/{sha}.webp") == "image/webp"
+        assert content_type_for("identity_1.pdf") == "application/pdf"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,59 @@
+"""
+Backend API Tests for the authenticated-user cache:
+- Profile updates are visible immediately
+- Suspension and reactivation take effect on the next request
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+ADMIN_EMAIL = "admin@logimatch.com"
+ADMIN_PASSWORD = "admin123"
+USER_EMAIL = "marie@example.com"
+USER_PASSWORD = "password123"
+
+
+def auth_headers(email, password):
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={"email": email, "password": password})
+    if response.status_code != 200:
+        pytest.skip(f"Login failed for {email}: {response.text}")
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+class TestUserCacheInvalidation:
+    """Cached user documents must never outlive a write"""
+
+    @pytest.fixture
+    def admin(self):
+        return auth_headers(ADMIN_EMAIL, ADMIN_PASSWORD)
+
+    @pytest.fixture
+    def user(self):
+        return auth_headers(USER_EMAIL, USER_PASSWORD)
+
+    def test_profile_update_visible(self, user):
+        original = requests.get(f"{BASE_URL}/api/users/me", headers=user).json()
+        try:
+            response = requests.patch(f"{BASE_URL}/api/users/me", json={"bio": "TEST_cache bio"}, headers=user)
+            assert response.status_code == 200
+            assert requests.get(f"{BASE_URL}/api/users/me", headers=user).json()['bio'] == "TEST_cache bio"
+        finally:
+            requests.patch(f"{BASE_URL}/api/users/me", json={"bio": original.get('bio') or ""}, headers=user)
+
+    def test_suspension_applies_immediately(self, admin, user):
+        me = requests.get(f"{BASE_URL}/api/users/me", headers=user).json()
+        assert requests.get(f"{BASE_URL}/api/users/me", headers=user).status_code == 200
+        try:
+            assert requests.patch(f"{BASE_URL}/api/admin/users/{me['id']}/suspend", headers=admin).status_code == 200
+            # 401 : la suspension révoque aussi les tokens émis
+            assert requests.get(f"{BASE_URL}/api/users/me", headers=user).status_code in (401, 403)
+        finally:
+            requests.patch(f"{BASE_URL}/api/admin/users/{me['id']}/unsuspend", headers=admin)
+        relogged = auth_headers(USER_EMAIL, USER_PASSWORD)
+        assert requests.get(f"{BASE_URL}/api/users/me", headers=relogged).status_code == 200
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
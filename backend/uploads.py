@@ -0,0 +1,312 @@
+"""
+Réception des fichiers uploadés sans bloquer la boucle d'événements.
+
+`UploadService.save` lit le fichier par morceaux, écrit chaque morceau depuis
+un pool de threads, vérifie la taille maximale et le type réel du contenu
+(octets magiques du premier morceau, l'extension fournie par le client n'est
+pas fiable) et calcule le SHA-256 au fil de l'eau. Le contenu est écrit dans
+un fichier temporaire puis renommé : un fichier visible sous son nom final est
+toujours complet. La publication passe par un pilote de `storage` (disque
+local par défaut, ou S3) ; le répertoire `root` ne sert alors qu'aux fichiers
+temporaires.
+
+Les fichiers sont adressés par leur contenu : `blobs/ab/cd/<sha256>.<ext>`.
+Un même document envoyé deux fois n'occupe qu'une place sur le disque. Le
+comptage des références (qui pointe vers quel blob) est tenu côté base ;
+`sweep_blobs` supprime les blobs qu'aucun document ne référence plus.
+
+Côté lecture, le nom d'un blob est son empreinte : il ne change jamais de
+contenu, ce qui permet un cache navigateur « immutable » et un ETag fort
+sans relire le fichier. `parse_range` interprète l'en-tête HTTP `Range`.
+"""
+import asyncio
+import hashlib
+import mimetypes
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from storage import LocalStorage
+
+CHUNK_SIZE = 256 * 1024
+BLOB_PREFIX = "blobs/"
+
+IMAGE_TYPES = ("image/jpeg", "image/png", "image/webp", "image/gif")
+# Pièces justificatives : formats lisibles par l'équipe de vérification
+DOCUMENT_TYPES = ("image/jpeg", "image/png", "application/pdf")
+ATTACHMENT_TYPES = IMAGE_TYPES + ("application/pdf",)
+
+EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/gif": "gif",
+    "application/pdf": "pdf",
+}
+
+# Types acceptés et taille maximale (octets) par nature d'upload
+DEFAULT_KINDS: Dict[str, Tuple[Tuple[str, ...], int]] = {
+    "avatar": (IMAGE_TYPES, 5 * 1024 * 1024),
+    "photo": (IMAGE_TYPES, 10 * 1024 * 1024),
+    "document": (DOCUMENT_TYPES, 10 * 1024 * 1024),
+    "attachment": (ATTACHMENT_TYPES, 10 * 1024 * 1024),
+}
+
+
+def sniff_mime(head: bytes) -> Optional[str]:
+    """Type MIME d'après les premiers octets du contenu, None si non reconnu"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    return None
+
+
+def format_size(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f"{size / (1024 * 1024):.0f} Mo"
+    return f"{max(1, round(size / 1024))} Ko"
+
+
+def blob_key(sha256: str, ext: str) -> str:
+    """Chemin relatif du blob, réparti sur deux niveaux de sous-répertoires"""
+    return f"{BLOB_PREFIX}{sha256[:2]}/{sha256[2:4]}/{sha256}.{ext}"
+
+
+def blob_key_from_url(url: Optional[str], prefix: str = "/uploads/") -> Optional[str]:
+    """Clé du blob désigné par une URL publique, None pour les anciens noms de fichiers"""
+    if not url or not url.startswith(prefix + BLOB_PREFIX):
+        return None
+    return url[len(prefix):]
+
+
+def content_type_for(key: str) -> str:
+    ext = key.rsplit(".", 1)[-1].lower() if "." in key else ""
+    for content_type, known in EXTENSIONS.items():
+        if known == ext:
+            return content_type
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+def blob_etag(key: str) -> Optional[str]:
+    """ETag fort d'un blob, dérivé de son nom (l'empreinte SHA-256), None hors blobs"""
+    if not key.startswith(BLOB_PREFIX):
+        return None
+    return '"' + key.rsplit("/", 1)[-1].split(".", 1)[0] + '"'
+
+
+class RangeNotSatisfiable(Exception):
+    """Plage demandée hors du fichier (HTTP 416)"""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Plage `bytes=` unique en (début, fin incluse) ; None pour servir tout le fichier
+
+    Les plages multiples ou mal formées sont ignorées (réponse 200 complète,
+    ce que la RFC 9110 autorise) ; une plage hors du fichier lève RangeNotSatisfiable.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, sep, end = header[len("bytes="):].strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if start == "":
+            # Suffixe : les N derniers octets
+            length = int(end)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(0, size - length), size - 1
+        first = int(start)
+        last = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if first >= size:
+        raise RangeNotSatisfiable()
+    if first > last:
+        return None
+    return first, min(last, size - 1)
+
+
+class UploadRejected(Exception):
+    """Fichier refusé ; `status_code` est le code HTTP à renvoyer"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class UploadService:
+    """Enregistrement en flux des uploads (temporaires sous `root`), avec limites par nature"""
+
+    def __init__(self, root: Path, kinds: Optional[Dict[str, Tuple[Tuple[str, ...], int]]] = None,
+                 chunk_size: int = CHUNK_SIZE, storage=None):
+        self.root = Path(root)
+        self.storage = storage or LocalStorage(self.root)
+        self.kinds = dict(kinds or DEFAULT_KINDS)
+        self.chunk_size = chunk_size
+        self.saved = 0
+        self.rejected = 0
+        self.deduplicated = 0
+        self.bytes_written = 0
+
+    def max_size(self, kind: str) -> int:
+        return self.kinds[kind][1]
+
+    async def save(self, file, kind: str) -> dict:
+        """Écrire `file` (UploadFile ou tout objet à `read(n)` asynchrone) comme blob
+
+        L'extension est déduite du contenu. Si le blob existe déjà, la copie
+        temporaire est abandonnée (`deduplicated`). Lève `UploadRejected` (413
+        trop gros, 415 type refusé, 400 vide) ; rien n'est alors laissé sur le disque.
+        """
+        allowed, max_size = self.kinds[kind]
+        loop = asyncio.get_running_loop()
+        digest = hashlib.sha256()
+        size = 0
+        content_type = None
+        tmp_path = self.root / f".{uuid.uuid4().hex}.part"
+        handle = None
+        try:
+            while True:
+                chunk = await file.read(self.chunk_size)
+                if not chunk:
+                    break
+                if content_type is None:
+                    content_type = sniff_mime(chunk)
+                    if content_type not in allowed:
+                        raise UploadRejected(415, "Type de fichier non accepté")
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadRejected(413, f"Fichier trop volumineux (max {format_size(max_size)})")
+                digest.update(chunk)
+                if handle is None:
+                    handle = await loop.run_in_executor(None, open, tmp_path, "wb")
+                await loop.run_in_executor(None, handle.write, chunk)
+            if content_type is None:
+                raise UploadRejected(400, "Fichier vide")
+            await loop.run_in_executor(None, self._commit, handle)
+            handle = None
+            sha256 = digest.hexdigest()
+            key = blob_key(sha256, EXTENSIONS[content_type])
+            deduplicated = await loop.run_in_executor(None, self._publish, tmp_path, key, content_type)
+        except BaseException as e:
+            if isinstance(e, UploadRejected):
+                self.rejected += 1
+            # Nettoyage synchrone : doit aussi aboutir si la tâche est annulée
+            self._discard(handle, tmp_path)
+            raise
+        self.saved += 1
+        if deduplicated:
+            self.deduplicated += 1
+        else:
+            self.bytes_written += size
+        return {
+            "key": key,
+            "size": size,
+            "sha256": sha256,
+            "content_type": content_type,
+            "deduplicated": deduplicated,
+        }
+
+    async def store_bytes(self, data: bytes, content_type: str) -> dict:
+        """Publier un contenu déjà en mémoire (variantes générées) comme blob"""
+        sha256 = hashlib.sha256(data).hexdigest()
+        key = blob_key(sha256, EXTENSIONS[content_type])
+        tmp_path = self.root / f".{uuid.uuid4().hex}.part"
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self._write, tmp_path, data)
+            deduplicated = await loop.run_in_executor(None, self._publish, tmp_path, key, content_type)
+        except BaseException:
+            self._discard(None, tmp_path)
+            raise
+        if deduplicated:
+            self.deduplicated += 1
+        else:
+            self.bytes_written += len(data)
+        return {"key": key, "size": len(data), "sha256": sha256, "content_type": content_type,
+                "deduplicated": deduplicated}
+
+    async def read(self, key: str) -> bytes:
+        return await asyncio.get_running_loop().run_in_executor(None, self.storage.read, key)
+
+    @staticmethod
+    def _write(tmp_path: Path, data: bytes):
+        with open(tmp_path, "wb") as handle:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    @staticmethod
+    def _commit(handle):
+        handle.flush()
+        os.fsync(handle.fileno())
+        handle.close()
+
+    def _publish(self, tmp_path: Path, key: str, content_type: str) -> bool:
+        if self.storage.exists(key):
+            tmp_path.unlink()
+            # Rafraîchir la date : le ramasse-miettes épargne les blobs récemment réutilisés
+            self.storage.touch(key)
+            return True
+        self.storage.put_file(tmp_path, key, content_type)
+        return False
+
+    @staticmethod
+    def _discard(handle, tmp_path: Path):
+        if handle is not None:
+            handle.close()
+        try:
+            tmp_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "saved": self.saved,
+            "rejected": self.rejected,
+            "deduplicated": self.deduplicated,
+            "bytes_written": self.bytes_written,
+            "max_sizes": {kind: limit for kind, (_, limit) in self.kinds.items()},
+        }
+
+
+def sweep_blobs(storage, live_keys: Iterable[str], grace_seconds: float = 3600,
+                dry_run: bool = False, now: Optional[float] = None, spool_dir: Optional[Path] = None) -> dict:
+    """Supprimer les blobs absents de `live_keys` et les fichiers temporaires abandonnés de `spool_dir`
+
+    Les fichiers modifiés depuis moins de `grace_seconds` sont épargnés : un
+    upload en cours a écrit son blob mais pas encore sa référence en base.
+    """
+    live = set(live_keys)
+    cutoff = (now if now is not None else time.time()) - grace_seconds
+    result = {"scanned": 0, "live": 0, "recent": 0, "removed": [], "bytes_freed": 0}
+    # Inventaire complet avant suppression : le pilote local parcourt des répertoires qu'on vide
+    for key, size, mtime in list(storage.list(BLOB_PREFIX)):
+        result["scanned"] += 1
+        if key in live:
+            result["live"] += 1
+        elif mtime > cutoff:
+            result["recent"] += 1
+        else:
+            if not dry_run:
+                storage.delete(key)
+            result["removed"].append(key)
+            result["bytes_freed"] += size
+    for path in Path(spool_dir).glob(".*.part") if spool_dir else ():
+        stat = path.stat()
+        if stat.st_mtime <= cutoff:
+            if not dry_run:
+                path.unlink(missing_ok=True)
+            result["bytes_freed"] += stat.st_size
+    return result
@@ -10,6 +10,7 @@ import {
   DropdownMenuTrigger,
 } from '../ui/dropdown-menu';
 import { Avatar, AvatarFallback, AvatarImage } from '../ui/avatar';
+import { avatarSrc } from '../../lib/media';
 import { 
   Package, 
   Truck, 
@@ -150,7 +151,7 @@ export const Navbar = () => {
                   <DropdownMenuTrigger asChild>
                     <Button variant="ghost" className="relative h-10 w-10 rounded-full">
                       <Avatar className="h-10 w-10 ring-2 ring-primary/20 ring-offset-2 ring-offset-background">
-                        <AvatarImage src={user?.avatar_url ? `${process.env.REACT_APP_BACKEND_URL}${user.avatar_url}` : undefined} />
+                        <AvatarImage src={avatarSrc(user, 64)} />
                         <AvatarFallback className="bg-primary text-primary-foreground font-semibold">
                           {getInitials()}
                         </AvatarFallback>
@@ -160,7 +161,7 @@ export const Navbar = () => {
                   <DropdownMenuContent className="w-56" align="end">
                     <div className="flex items-center gap-3 p-3">
                       <Avatar className="h-10 w-10">
-                        <AvatarImage src={user?.avatar_url ? `${process.env.REACT_APP_BACKEND_URL}${user.avatar_url}` : undefined} />
+                        <AvatarImage src={avatarSrc(user, 64)} />
                         <AvatarFallback className="bg-primary text-primary-foreground">
                           {getInitials()}
                         </AvatarFallback>
@@ -5,6 +5,28 @@ const API_URL = process.env.REACT_APP_BACKEND_URL;
 
 const AuthContext = createContext(null);
 
+// Un seul rafraîchissement à la fois, partagé par tous les 401 simultanés : le refresh token
+// est à usage unique et le rejouer révoquerait toute la session
+let refreshInFlight = null;
+
+const refreshSession = (storedRefreshToken) => {
+  if (!refreshInFlight) {
+    refreshInFlight = axios.post(`${API_URL}/api/auth/refresh`, {}, {
+      headers: { Authorization: `Bearer ${storedRefreshToken}` }
+    }).then((res) => {
+      localStorage.setItem('token', res.data.access_token);
+      // Rotation : l'ancien refresh token est consommé, il faut garder le nouveau
+      if (res.data.refresh_token) {
+        localStorage.setItem('refreshToken', res.data.refresh_token);
+      }
+      return res.data;
+    }).finally(() => {
+      refreshInFlight = null;
+    });
+  }
+  return refreshInFlight;
+};
+
 export const useAuth = () => {
   const context = useContext(AuthContext);
   if (!context) {
@@ -38,16 +60,20 @@ export const AuthProvider = ({ children }) => {
       const originalRequest = error.config;
       if (error.response?.status === 401 && !originalRequest._retry) {
         originalRequest._retry = true;
+        const currentToken = localStorage.getItem('token');
+        if (currentToken && originalRequest.headers.Authorization !== `Bearer ${currentToken}`) {
+          // Requête partie avant un rafraîchissement déjà terminé : la rejouer avec le nouveau token suffit
+          return api(originalRequest);
+        }
         const storedRefreshToken = localStorage.getItem('refreshToken');
         if (storedRefreshToken) {
           try {
-            const res = await axios.post(`${API_URL}/api/auth/refresh`, {}, {
-              headers: { Authorization: `Bearer ${storedRefreshToken}` }
-            });
-            const newToken = res.data.access_token;
-            localStorage.setItem('token', newToken);
-            setToken(newToken);
-            originalRequest.headers.Authorization = `Bearer ${newToken}`;
+            const data = await refreshSession(storedRefreshToken);
+            setToken(data.access_token);
+            if (data.refresh_token) {
+              setRefreshToken(data.refresh_token);
+            }
+            originalRequest.headers.Authorization = `Bearer ${data.access_token}`;
             return api(originalRequest);
           } catch (refreshError) {
             logout();
@@ -101,6 +127,13 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    const currentToken = localStorage.getItem('token');
+    if (currentToken) {
+      // Révocation côté serveur des tokens émis ; la déconnexion locale n'attend pas la réponse
+      axios.post(`${API_URL}/api/auth/logout`, {}, {
+        headers: { Authorization: `Bearer ${currentToken}` }
+      }).catch(() => {});
+    }
     localStorage.removeItem('token');
     localStorage.removeItem('refreshToken');
     setToken(null);
@@ -0,0 +1,15 @@
+const backendUrl = process.env.REACT_APP_BACKEND_URL;
+
+// Plus petite variante couvrant `size` pixels (la plus grande sinon), l'original tant qu'elles ne sont pas prêtes
+export function imageSrc(url, variants, size) {
+  if (!url) return undefined;
+  const sizes = Object.keys(variants || {})
+    .map(Number)
+    .filter((s) => !Number.isNaN(s))
+    .sort((a, b) => a - b);
+  if (sizes.length === 0) return `${backendUrl}${url}`;
+  const best = sizes.find((s) => s >= size) ?? sizes[sizes.length - 1];
+  return `${backendUrl}${variants[String(best)]}`;
+}
+
+export const avatarSrc = (user, size = 64) => imageSrc(user?.avatar_url, user?.avatar_variants, size);
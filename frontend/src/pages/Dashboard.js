@@ -32,7 +32,8 @@ const Dashboard = () => {
     requests: [],
     offers: [],
     contracts: [],
-    conversations: []
+    conversations: [],
+    unread: { conversations: 0, unread_messages: 0 }
   });
 
   useEffect(() => {
@@ -45,7 +46,9 @@ const Dashboard = () => {
         api.get('/requests/mine?limit=5'),
         api.get('/offers/mine?limit=5'),
         api.get('/contracts'),
-        api.get('/conversations')
+        // Aperçu des 3 dernières conversations + résumé des non-lus, sans charger toute la boîte
+        api.get('/conversations?limit=3&include_total=false'),
+        api.get('/conversations/unread-summary')
       ];
       
       // Vérifier le statut de vérification pour les transporteurs
@@ -54,17 +57,18 @@ const Dashboard = () => {
       }
       
       const results = await Promise.all(promises);
-      const [requestsRes, offersRes, contractsRes, conversationsRes] = results;
+      const [requestsRes, offersRes, contractsRes, conversationsRes, unreadRes] = results;
 
       setStats({
         requests: requestsRes.data.items || [],
         offers: offersRes.data.items || [],
         contracts: contractsRes.data || [],
-        conversations: conversationsRes.data || []
+        conversations: conversationsRes.data.items || [],
+        unread: unreadRes.data
       });
       
-      if (isCarrier && results[4]) {
-        setVerificationStatus(results[4].data);
+      if (isCarrier && results[5]) {
+        setVerificationStatus(results[5].data);
       }
     } catch (error) {
       console.error('Failed to fetch dashboard data:', error);
@@ -308,7 +312,12 @@ const Dashboard = () => {
             <div className="flex items-center justify-between">
               <div>
                 <p className="text-sm text-muted-foreground">{t('messages.title')}</p>
-                <p className="text-3xl font-bold mt-1">{stats.conversations.length}</p>
+                <p className="text-3xl font-bold mt-1">{stats.unread.conversations}</p>
+                {stats.unread.unread_messages > 0 && (
+                  <p className="text-xs text-primary mt-1" data-testid="unread-messages">
+                    {stats.unread.unread_messages} {t('messages.unread')}
+                  </p>
+                )}
               </div>
               <div className="w-12 h-12 rounded-xl bg-muted flex items-center justify-center">
                 <MessageSquare className="w-6 h-6 text-muted-foreground" />
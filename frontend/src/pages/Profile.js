@@ -8,6 +8,7 @@ import { Label } from '../components/ui/label';
 import { Textarea } from '../components/ui/textarea';
 import { Card, CardContent, CardHeader, CardTitle } from '../components/ui/card';
 import { Avatar, AvatarFallback, AvatarImage } from '../components/ui/avatar';
+import { avatarSrc } from '../lib/media';
 import { Badge } from '../components/ui/badge';
 import {
   Select,
@@ -83,7 +84,7 @@ const Profile = () => {
       const res = await api.post('/users/me/avatar', formData, {
         headers: { 'Content-Type': 'multipart/form-data' }
       });
-      updateUser({ avatar_url: res.data.avatar_url });
+      updateUser({ avatar_url: res.data.avatar_url, avatar_variants: null });
       toast.success(t('success.updated'));
     } catch (error) {
       toast.error(t('errors.somethingWentWrong'));
@@ -119,7 +120,7 @@ const Profile = () => {
             <CardContent className="p-6 text-center">
               <div className="relative w-32 h-32 mx-auto mb-4">
                 <Avatar className="w-32 h-32 border-4 border-primary/20">
-                  <AvatarImage src={user?.avatar_url ? `${process.env.REACT_APP_BACKEND_URL}${user.avatar_url}` : undefined} />
+                  <AvatarImage src={avatarSrc(user, 256)} />
                   <AvatarFallback className="bg-primary text-primary-foreground text-4xl">
                     {user?.first_name?.[0]}{user?.last_name?.[0]}
                   </AvatarFallback>
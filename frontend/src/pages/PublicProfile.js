@@ -5,6 +5,7 @@ import { Card, CardContent, CardHeader, CardTitle } from '../components/ui/card'
 import { Badge } from '../components/ui/badge';
 import { Skeleton } from '../components/ui/skeleton';
 import { Avatar, AvatarFallback, AvatarImage } from '../components/ui/avatar';
+import { avatarSrc } from '../lib/media';
 import { Button } from '../components/ui/button';
 import { Star, MapPin, Shield, MessageSquare } from 'lucide-react';
 
@@ -14,7 +15,6 @@ const PublicProfile = () => {
   const navigate = useNavigate();
   const [loading, setLoading] = useState(true);
   const [profile, setProfile] = useState(null);
-  const backendUrl = process.env.REACT_APP_BACKEND_URL;
 
   useEffect(() => {
     api.get(`/users/${id}`)
@@ -46,7 +46,7 @@ const PublicProfile = () => {
     );
   }
 
-  const avatarUrl = profile.avatar_url ? backendUrl + profile.avatar_url : undefined;
+  const avatarUrl = avatarSrc(profile, 256);
   const rating = profile.rating_count > 0 ? (profile.rating_sum / profile.rating_count).toFixed(1) : null;
   const initials = (profile.first_name?.[0] || '') + (profile.last_name?.[0] || '');
   const isPro = profile.role === 'CARRIER_PRO';
@@ -66,35 +66,27 @@ const AdminPanel = () => {
     fetchData();
   }, [isAdmin]);
 
-  const fetchData = async () => {
+  // Un seul appel /admin/dashboard ; après une action, ne recharger que les sections concernées
+  const fetchData = async (sections) => {
     try {
-      const [statsRes, usersRes, verificationsRes, carrierVerifRes, reportsRes, requestsRes, offersRes, countriesRes, settingsRes, paymentsRes, analyticsRes, adsRes] = await Promise.all([
-        api.get('/admin/stats'),
-        api.get('/admin/users'),
-        api.get('/admin/verifications'),
-        api.get('/admin/carrier-verifications'),
-        api.get('/admin/reports'),
-        api.get('/admin/requests'),
-        api.get('/admin/offers'),
-        api.get('/admin/countries'),
-        api.get('/admin/settings'),
-        api.get('/admin/payments'),
-        api.get('/admin/analytics?days=30'),
-        api.get('/admin/ads-settings')
-      ]);
+      const res = await api.get('/admin/dashboard', {
+        params: sections ? { sections: sections.join(','), days: 30 } : { days: 30 }
+      });
+      const data = res.data;
 
-      setStats(statsRes.data);
-      setUsers(usersRes.data.items || []);
-      setVerifications(verificationsRes.data.items || []);
-      setCarrierVerifications(carrierVerifRes.data.items || []);
-      setReports(reportsRes.data.items || []);
-      setRequests(requestsRes.data.items || []);
-      setOffers(offersRes.data.items || []);
-      setCountries(countriesRes.data || []);
-      setSettings(settingsRes.data);
-      setPayments(paymentsRes.data?.items || []);
-      setAnalytics(analyticsRes.data);
-      setAdsSettings(adsRes.data);
+      if ('stats' in data) setStats(data.stats);
+      if ('users' in data) setUsers(data.users.items || []);
+      if ('verifications' in data) setVerifications(data.verifications.items || []);
+      if ('carrier_verifications' in data) setCarrierVerifications(data.carrier_verifications.items || []);
+      if ('reports' in data) setReports(data.reports.items || []);
+      if ('requests' in data) setRequests(data.requests.items || []);
+      if ('offers' in data) setOffers(data.offers.items || []);
+      if ('countries' in data) setCountries(data.countries || []);
+      if ('settings' in data) setSettings(data.settings);
+      if ('payments' in data) setPayments(data.payments?.items || []);
+      if ('analytics' in data) setAnalytics(data.analytics);
+      if ('ads_settings' in data) setAdsSettings(data.ads_settings);
+      if (data.errors) console.error('Admin dashboard sections failed:', data.errors);
     } catch (error) {
       console.error('Failed to fetch admin data:', error);
     } finally {
@@ -106,7 +98,7 @@ const AdminPanel = () => {
     try {
       await api.patch(`/admin/users/${userId}/${suspend ? 'suspend' : 'unsuspend'}`);
       toast.success(suspend ? 'Utilisateur suspendu' : 'Utilisateur réactivé');
-      fetchData();
+      fetchData(['users']);
     } catch (error) {
       toast.error('Erreur');
     }
@@ -116,7 +108,7 @@ const AdminPanel = () => {
     try {
       await api.patch(`/admin/verifications/${verificationId}/${approve ? 'approve' : 'reject'}`);
       toast.success(approve ? 'Vérification approuvée' : 'Vérification rejetée');
-      fetchData();
+      fetchData(['stats', 'verifications']);
     } catch (error) {
       toast.error('Erreur');
     }
@@ -137,7 +129,7 @@ const AdminPanel = () => {
       }
       setSelectedVerification(null);
       setRejectReason('');
-      fetchData();
+      fetchData(['carrier_verifications']);
     } catch (error) {
       toast.error(error.response?.data?.detail || 'Erreur');
     }
@@ -147,7 +139,7 @@ const AdminPanel = () => {
     try {
       await api.patch(`/admin/reports/${reportId}/close`);
       toast.success('Signalement clôturé');
-      fetchData();
+      fetchData(['stats', 'reports']);
     } catch (error) {
       toast.error('Erreur');
     }
@@ -157,7 +149,7 @@ const AdminPanel = () => {
     try {
       await api.delete(`/admin/${type}/${itemId}`);
       toast.success('Annonce masquée');
-      fetchData();
+      fetchData([type]);
     } catch (error) {
       toast.error('Erreur');
     }
@@ -173,7 +165,7 @@ const AdminPanel = () => {
       await api.post('/admin/countries', newCountry);
       toast.success('Pays ajouté');
       setNewCountry({ name: '', code: '', is_origin: true, is_destination: true });
-      fetchData();
+      fetchData(['countries']);
     } catch (error) {
       toast.error(error.response?.data?.detail || 'Erreur');
     }
@@ -183,7 +175,7 @@ const AdminPanel = () => {
     try {
       await api.delete(`/admin/countries/${countryId}`);
       toast.success('Pays supprimé');
-      fetchData();
+      fetchData(['countries']);
     } catch (error) {
       toast.error('Erreur');
     }
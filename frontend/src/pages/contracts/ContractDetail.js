@@ -6,6 +6,7 @@ import { Card, CardContent, CardHeader, CardTitle } from '../../components/ui/ca
 import { Badge } from '../../components/ui/badge';
 import { Skeleton } from '../../components/ui/skeleton';
 import { Avatar, AvatarFallback, AvatarImage } from '../../components/ui/avatar';
+import { avatarSrc } from '../../lib/media';
 import { Textarea } from '../../components/ui/textarea';
 import { Label } from '../../components/ui/label';
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from '../../components/ui/dialog';
@@ -26,7 +27,6 @@ const ContractDetail = () => {
   const [reviewComment, setReviewComment] = useState('');
   const [submitting, setSubmitting] = useState(false);
   const [paymentLoading, setPaymentLoading] = useState(false);
-  const backendUrl = process.env.REACT_APP_BACKEND_URL;
 
   useEffect(() => {
     fetchContract();
@@ -154,8 +154,8 @@ const ContractDetail = () => {
   };
   const currentStep = getStepIndex();
 
-  const shipperAvatar = contract.shipper?.avatar_url ? `${backendUrl}${contract.shipper.avatar_url}` : undefined;
-  const carrierAvatar = contract.carrier?.avatar_url ? `${backendUrl}${contract.carrier.avatar_url}` : undefined;
+  const shipperAvatar = avatarSrc(contract.shipper, 64);
+  const carrierAvatar = avatarSrc(contract.carrier, 64);
 
   return (
     <div className="max-w-4xl mx-auto px-6 py-12" data-testid="contract-detail-page">
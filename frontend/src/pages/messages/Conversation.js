@@ -1,17 +1,25 @@
 import { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate, Link } from 'react-router-dom';
+import { useTranslation } from 'react-i18next';
 import { useAuth } from '../../context/AuthContext';
 import { Button } from '../../components/ui/button';
 import { Card, CardContent } from '../../components/ui/card';
 import { Input } from '../../components/ui/input';
 import { Skeleton } from '../../components/ui/skeleton';
 import { Avatar, AvatarFallback, AvatarImage } from '../../components/ui/avatar';
+import { avatarSrc } from '../../lib/media';
 import { ArrowLeft, Send, Package, Truck } from 'lucide-react';
 import { toast } from 'sonner';
 import { cn } from '../../lib/utils';
 
-const MessageBubble = ({ msg, isOwn, backendUrl }) => {
-  const avatarSrc = msg.sender?.avatar_url ? `${backendUrl}${msg.sender.avatar_url}` : undefined;
+const FALLBACK_POLL_INTERVAL = 5000;
+const SOCKET_POLL_INTERVAL = 30000;
+const RECONNECT_BASE_DELAY = 1000;
+const RECONNECT_MAX_DELAY = 30000;
+
+const MessageBubble = ({ msg, isOwn, isSeen }) => {
+  const { t } = useTranslation();
+  const senderAvatar = avatarSrc(msg.sender, 64);
   const initials = `${msg.sender?.first_name?.[0] || ''}${msg.sender?.last_name?.[0] || ''}`;
   
   const formatTime = (dateStr) => {
@@ -22,7 +30,7 @@ const MessageBubble = ({ msg, isOwn, backendUrl }) => {
     <div className={cn("flex items-end gap-2", isOwn ? "flex-row-reverse" : "")} data-testid={`message-${msg.id}`}>
       {!isOwn && (
         <Avatar className="w-8 h-8">
-          <AvatarImage src={avatarSrc} />
+          <AvatarImage src={senderAvatar} />
           <AvatarFallback className="bg-muted text-xs">{initials}</AvatarFallback>
         </Avatar>
       )}
@@ -33,6 +41,7 @@ const MessageBubble = ({ msg, isOwn, backendUrl }) => {
         {msg.text && <p className="text-sm whitespace-pre-wrap">{msg.text}</p>}
         <span className={cn("text-xs mt-1 block", isOwn ? "text-primary-foreground/70" : "text-muted-foreground")}>
           {formatTime(msg.created_at)}
+          {isSeen && ` · ${t('messages.read')}`}
         </span>
       </div>
     </div>
@@ -47,17 +56,68 @@ const Conversation = () => {
   const [sending, setSending] = useState(false);
   const [conversation, setConversation] = useState(null);
   const [messages, setMessages] = useState([]);
+  const [otherLastRead, setOtherLastRead] = useState(null);
   const [newMessage, setNewMessage] = useState('');
   const messagesEndRef = useRef(null);
+  const lastMessageIdRef = useRef(null);
   const backendUrl = process.env.REACT_APP_BACKEND_URL;
 
   useEffect(() => {
     fetchData();
-    const interval = setInterval(fetchMessages, 5000);
-    return () => clearInterval(interval);
+
+    // Messages poussés en temps réel. Le polling reste actif : rapide sans WebSocket,
+    // lent (revalidation ETag, 304 si rien n'a changé) tant que le flux est ouvert,
+    // au cas où un message publié par un autre worker ne serait pas relayé.
+    let socket = null;
+    let interval = null;
+    let reconnectTimer = null;
+    let attempts = 0;
+    const poll = (delay) => {
+      if (interval) clearInterval(interval);
+      interval = setInterval(fetchMessages, delay);
+    };
+    const connect = () => {
+      const token = localStorage.getItem('token');
+      if (!backendUrl || !token || !('WebSocket' in window)) return;
+      socket = new WebSocket(`${backendUrl.replace(/^http/, 'ws')}/api/ws/conversations?token=${encodeURIComponent(token)}`);
+      socket.onopen = () => socket.send(JSON.stringify({ type: 'subscribe', conversation_id: id }));
+      socket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.conversation_id !== id) return;
+        if (data.type === 'subscribed') {
+          // Rattrapage des messages arrivés avant l'abonnement (chargement initial ou coupure)
+          attempts = 0;
+          fetchMessages();
+          poll(SOCKET_POLL_INTERVAL);
+        } else if (data.type === 'message') {
+          appendMessage(data.message);
+          if (data.message.sender_id !== user.id) markRead();
+        } else if (data.type === 'read' && data.user_id !== user.id) {
+          setOtherLastRead(data.message_id);
+        }
+      };
+      socket.onclose = () => {
+        poll(FALLBACK_POLL_INTERVAL);
+        const delay = Math.min(RECONNECT_BASE_DELAY * 2 ** attempts, RECONNECT_MAX_DELAY);
+        attempts += 1;
+        reconnectTimer = setTimeout(connect, delay);
+      };
+    };
+    poll(FALLBACK_POLL_INTERVAL);
+    connect();
+
+    return () => {
+      clearTimeout(reconnectTimer);
+      if (socket) {
+        socket.onclose = null;
+        socket.close();
+      }
+      if (interval) clearInterval(interval);
+    };
   }, [id]);
 
   useEffect(() => {
+    lastMessageIdRef.current = messages.length ? messages[messages.length - 1].id : null;
     if (messagesEndRef.current) {
       messagesEndRef.current.scrollIntoView({ behavior: 'smooth' });
     }
@@ -68,7 +128,9 @@ const Conversation = () => {
       const convRes = await api.get(`/conversations/${id}`);
       const msgRes = await api.get(`/conversations/${id}/messages`);
       setConversation(convRes.data);
+      setOtherLastRead(convRes.data.other_last_read);
       setMessages(msgRes.data.items || []);
+      if (convRes.data.unread_count > 0) markRead();
     } catch (error) {
       toast.error('Conversation non trouvée');
       navigate('/messages');
@@ -77,20 +139,38 @@ const Conversation = () => {
     }
   };
 
+  // Polling et rattrapage : ne récupère que les messages postérieurs au dernier reçu
   const fetchMessages = async () => {
+    const lastId = lastMessageIdRef.current;
     try {
-      const res = await api.get(`/conversations/${id}/messages`);
-      setMessages(res.data.items || []);
+      const res = await api.get(`/conversations/${id}/messages`, {
+        params: lastId ? { after_id: lastId } : {},
+      });
+      if (lastId) {
+        const items = res.data.items || [];
+        items.forEach(appendMessage);
+        if (items.some(m => m.sender_id !== user.id)) markRead();
+      } else {
+        setMessages(res.data.items || []);
+      }
     } catch (error) {}
   };
 
+  const markRead = () => {
+    api.post(`/conversations/${id}/read`).catch(() => {});
+  };
+
+  const appendMessage = (msg) => {
+    setMessages(prev => prev.some(m => m.id === msg.id) ? prev : [...prev, msg]);
+  };
+
   const handleSend = async (e) => {
     e.preventDefault();
     if (!newMessage.trim() || sending) return;
     setSending(true);
     try {
       const res = await api.post(`/conversations/${id}/messages`, { text: newMessage });
-      setMessages(prev => [...prev, res.data]);
+      appendMessage(res.data);
       setNewMessage('');
     } catch (error) {
       toast.error('Erreur lors de l\'envoi');
@@ -112,7 +192,7 @@ const Conversation = () => {
   if (!conversation) return null;
 
   const otherUser = conversation.other_user;
-  const avatarUrl = otherUser?.avatar_url ? `${backendUrl}${otherUser.avatar_url}` : undefined;
+  const avatarUrl = avatarSrc(otherUser, 64);
   const initials = `${otherUser?.first_name?.[0] || ''}${otherUser?.last_name?.[0] || ''}`;
 
   return (
@@ -148,7 +228,7 @@ const Conversation = () => {
 
       <div className="flex-1 overflow-y-auto space-y-3 pb-4">
         {messages.map((msg) => (
-          <MessageBubble key={msg.id} msg={msg} isOwn={msg.sender_id === user.id} backendUrl={backendUrl} />
+          <MessageBubble key={msg.id} msg={msg} isOwn={msg.sender_id === user.id} isSeen={msg.id === otherLastRead} />
         ))}
         <div ref={messagesEndRef} />
       </div>
@@ -6,6 +6,7 @@ import { Card, CardContent } from '../../components/ui/card';
 import { Badge } from '../../components/ui/badge';
 import { Skeleton } from '../../components/ui/skeleton';
 import { Avatar, AvatarFallback, AvatarImage } from '../../components/ui/avatar';
+import { avatarSrc } from '../../lib/media';
 import { Input } from '../../components/ui/input';
 import { MessageSquare, Search, Package, Truck } from 'lucide-react';
 
@@ -24,7 +25,7 @@ const MessagesList = () => {
   const fetchConversations = async () => {
     try {
       const res = await api.get('/conversations');
-      setConversations(res.data || []);
+      setConversations(res.data.items || []);
     } catch (error) {
       console.error('Failed to fetch conversations:', error);
     } finally {
@@ -116,7 +117,7 @@ const MessagesList = () => {
                 <CardContent className="p-4">
                   <div className="flex items-center gap-4">
                     <Avatar className="w-14 h-14">
-                      <AvatarImage src={conv.other_user?.avatar_url ? `${process.env.REACT_APP_BACKEND_URL}${conv.other_user.avatar_url}` : undefined} />
+                      <AvatarImage src={avatarSrc(conv.other_user, 64)} />
                       <AvatarFallback className="bg-primary text-primary-foreground font-semibold">
                         {conv.other_user?.first_name?.[0]}{conv.other_user?.last_name?.[0]}
                       </AvatarFallback>
@@ -126,6 +127,11 @@ const MessagesList = () => {
                       <div className="flex items-center justify-between mb-1">
                         <span className="font-semibold">
                           {conv.other_user?.first_name} {conv.other_user?.last_name}
+                          {conv.unread_count > 0 && (
+                            <Badge className="ml-2 text-xs" data-testid={`unread-${conv.id}`}>
+                              {conv.unread_count}
+                            </Badge>
+                          )}
                         </span>
                         <span className="text-xs text-muted-foreground">
                           {formatDate(conv.last_message_at)}
@@ -6,6 +6,7 @@ import { Card, CardContent, CardHeader, CardTitle } from '../../components/ui/ca
 import { Badge } from '../../components/ui/badge';
 import { Skeleton } from '../../components/ui/skeleton';
 import { Avatar, AvatarFallback, AvatarImage } from '../../components/ui/avatar';
+import { avatarSrc } from '../../lib/media';
 import {
   Dialog,
   DialogContent,
@@ -267,7 +268,7 @@ const RequestDetail = () => {
             <CardContent className="space-y-4">
               <div className="flex items-center gap-4">
                 <Avatar className="w-14 h-14">
-                  <AvatarImage src={request.user?.avatar_url ? `${process.env.REACT_APP_BACKEND_URL}${request.user.avatar_url}` : undefined} />
+                  <AvatarImage src={avatarSrc(request.user, 256)} />
                   <AvatarFallback className="bg-primary text-primary-foreground text-lg">
                     {request.user?.first_name?.[0]}{request.user?.last_name?.[0]}
                   </AvatarFallback>
@@ -2,11 +2,13 @@ import { useState, useEffect } from 'react';
 import { Link, useSearchParams } from 'react-router-dom';
 import { useTranslation } from 'react-i18next';
 import { useAuth } from '../../context/AuthContext';
+import { avatarSrc } from '../../lib/media';
 import { Button } from '../../components/ui/button';
 import { Input } from '../../components/ui/input';
 import { Card, CardContent } from '../../components/ui/card';
 import { Badge } from '../../components/ui/badge';
 import { Skeleton } from '../../components/ui/skeleton';
+import { Avatar, AvatarFallback, AvatarImage } from '../../components/ui/avatar';
 import {
   Select,
   SelectContent,
@@ -262,9 +264,12 @@ const RequestsList = () => {
                     {request.user && (
                       <div className="flex items-center justify-between pt-4 border-t">
                         <div className="flex items-center gap-2">
-                          <div className="w-8 h-8 rounded-full bg-primary/10 flex items-center justify-center text-sm font-semibold text-primary">
-                            {request.user.first_name?.[0]}{request.user.last_name?.[0]}
-                          </div>
+                          <Avatar className="w-8 h-8">
+                            <AvatarImage src={avatarSrc(request.user, 64)} loading="lazy" />
+                            <AvatarFallback className="bg-primary/10 text-sm font-semibold text-primary">
+                              {request.user.first_name?.[0]}{request.user.last_name?.[0]}
+                            </AvatarFallback>
+                          </Avatar>
                           <span className="text-sm font-medium">
                             {request.user.first_name} {request.user.last_name?.[0]}.
                           </span>